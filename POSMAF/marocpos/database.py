@@ -1,341 +1,351 @@
 import sqlite3
 import os
+import threading
+from contextlib import contextmanager
 from datetime import datetime, UTC
+from urllib.parse import quote
+from query_profiler import QueryProfiler, ProfiledConnection
+
+class PooledConnection:
+    """Proxy around a pooled sqlite3 connection.
+
+    Behaves exactly like the wrapped connection, except that close() hands
+    the connection back to its pool instead of closing the database file.
+    """
+    __slots__ = ('_conn', '_pool', '_generation', '_owner', '_closed', '_changes')
+
+    def __init__(self, conn, pool, generation):
+        object.__setattr__(self, '_conn', conn)
+        object.__setattr__(self, '_pool', pool)
+        object.__setattr__(self, '_generation', generation)
+        object.__setattr__(self, '_owner', threading.get_ident())
+        object.__setattr__(self, '_closed', False)
+        object.__setattr__(self, '_changes', conn.total_changes)
+
+    def close(self):
+        """Return the connection to the pool (safe to call more than once)."""
+        if self._closed:
+            return
+        object.__setattr__(self, '_closed', True)
+        if self._pool is not None and threading.get_ident() == self._owner:
+            changed = self._conn.total_changes != self._changes
+            self._pool.release(self._conn, self._generation, changed)
+
+    def __getattr__(self, name):
+        if name in PooledConnection.__slots__:
+            raise AttributeError(name)
+        if self._closed:
+            raise sqlite3.ProgrammingError("Cannot operate on a closed database.")
+        return getattr(self._conn, name)
+
+    def __setattr__(self, name, value):
+        setattr(self._conn, name, value)
+
+    def __enter__(self):
+        self._conn.__enter__()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return self._conn.__exit__(exc_type, exc_value, traceback)
+
+    def __del__(self):
+        # A caller that forgot close() must not leak the pooled connection
+        try:
+            self.close()
+        except Exception:
+            pass
+
+
+class ConnectionPool:
+    """Per-thread pool of long-lived SQLite connections.
+
+    sqlite3 connections may only be used by the thread that created them, so
+    each thread keeps its own small stack of idle connections. The first
+    connection opened by a thread is reused for the lifetime of the process;
+    nested get_connection() calls borrow extra connections, of which at most
+    ``max_idle`` are kept open once released.
+
+    A read-only pool opens connections with ``mode=ro`` and ``query_only``,
+    and hands each one out inside a deferred read transaction, so every
+    statement run on it sees the same WAL snapshot until it is closed.
+    """
+
+    # Applied once, when a connection is opened
+    PRAGMAS = (
+        ("journal_mode", "WAL"),
+        ("synchronous", "NORMAL"),
+        ("busy_timeout", 5000),
+        ("foreign_keys", "ON"),
+        ("cache_size", -16000),       # ~16 MB page cache
+        ("mmap_size", 134217728),     # 128 MB memory-mapped I/O
+        ("temp_store", "MEMORY"),
+    )
+
+    READ_ONLY_PRAGMAS = (
+        ("busy_timeout", 5000),
+        ("cache_size", -16000),
+        ("mmap_size", 134217728),
+        ("temp_store", "MEMORY"),
+        ("query_only", "ON"),
+    )
+
+    def __init__(self, db_path, max_idle=4, read_only=False):
+        self.db_path = db_path
+        self.max_idle = max_idle
+        self.read_only = read_only
+        self._local = threading.local()
+        self._generation = 0
+
+    def _idle(self):
+        """Return the idle stack of the calling thread, dropping stale connections."""
+        local = self._local
+        if getattr(local, 'generation', None) != self._generation:
+            for conn in getattr(local, 'idle', []):
+                try:
+                    conn.close()
+                except sqlite3.Error:
+                    pass
+            local.idle = []
+            local.generation = self._generation
+        return local.idle
+
+    def _open(self):
+        factory = ProfiledConnection if QueryProfiler.enabled else sqlite3.Connection
+        if self.read_only:
+            uri = f"file:{quote(self.db_path)}?mode=ro"
+            conn = sqlite3.connect(uri, uri=True, timeout=5.0, factory=factory)
+            pragmas = self.READ_ONLY_PRAGMAS
+        else:
+            conn = sqlite3.connect(self.db_path, timeout=5.0, factory=factory)
+            pragmas = self.PRAGMAS
+        cursor = conn.cursor()
+        for pragma, value in pragmas:
+            cursor.execute(f"PRAGMA {pragma} = {value}")
+        cursor.close()
+        return conn
+
+    def acquire(self):
+        idle = self._idle()
+        conn = idle.pop() if idle else self._open()
+        conn.row_factory = sqlite3.Row
+        if self.read_only:
+            conn.execute("BEGIN")
+        return PooledConnection(conn, self, self._generation)
+
+    def release(self, conn, generation, changed=False):
+        # Mirror sqlite3's close(): anything left uncommitted is discarded
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            conn.close()
+            return
+
+        if changed and not self.read_only:
+            DatabaseManager.notify_changes(conn)
+
+        idle = self._idle()
+        if generation == self._generation and len(idle) < self.max_idle:
+            idle.append(conn)
+        else:
+            conn.close()
+
+    def close_all(self):
+        """Close every idle connection; other threads drop theirs on next use."""
+        self._generation += 1
+        self._idle()
+
 
 class DatabaseManager:
     # Get the absolute path to the marocpos directory
     MAROCPOS_DIR = os.path.dirname(os.path.abspath(__file__))
     DB_PATH = os.path.join(MAROCPOS_DIR, "pos7.db")
+    POOL_SIZE = 4
+
+    _pool = None
+    _read_pool = None
+    _pool_lock = threading.Lock()
+    _local = threading.local()
+    _change_listeners = []
+
+    @classmethod
+    def get_pool(cls):
+        """Return the connection pool for the current DB_PATH."""
+        pool = cls._pool
+        if pool is None or pool.db_path != cls.DB_PATH:
+            with cls._pool_lock:
+                if cls._pool is None or cls._pool.db_path != cls.DB_PATH:
+                    if cls._pool is not None:
+                        cls._pool.close_all()
+                    cls._pool = ConnectionPool(cls.DB_PATH, cls.POOL_SIZE)
+                pool = cls._pool
+        return pool
+
+    @classmethod
+    def get_read_pool(cls):
+        """Return the read-only connection pool for the current DB_PATH."""
+        pool = cls._read_pool
+        if pool is None or pool.db_path != cls.DB_PATH:
+            with cls._pool_lock:
+                if cls._read_pool is None or cls._read_pool.db_path != cls.DB_PATH:
+                    if cls._read_pool is not None:
+                        cls._read_pool.close_all()
+                    cls._read_pool = ConnectionPool(cls.DB_PATH, cls.POOL_SIZE, read_only=True)
+                pool = cls._read_pool
+        return pool
 
     @classmethod
     def get_connection(cls):
-        """Create and return a connection to the SQLite database."""
+        """Return a pooled connection to the SQLite database.
+
+        Callers keep using conn.close() when they are done; the connection
+        is returned to the pool rather than closed.
+        """
         try:
-            conn = sqlite3.connect(cls.DB_PATH)
-            conn.row_factory = sqlite3.Row
-            return conn
+            return cls.get_pool().acquire()
         except sqlite3.Error as e:
             print(f"Error connecting to database: {e}")
             return None
 
+    @classmethod
+    def get_read_connection(cls):
+        """Return a pooled read-only connection for reporting.
+
+        The connection reads one consistent WAL snapshot until it is closed
+        and never takes the write lock, so reports do not block checkout.
+        Falls back to a regular connection if the file cannot be opened
+        read-only (e.g. it does not exist yet).
+        """
+        snapshot = getattr(cls._local, 'report_snapshot', None)
+        if snapshot is not None:
+            return PooledConnection(snapshot, None, 0)
+        try:
+            return cls.get_read_pool().acquire()
+        except sqlite3.Error as e:
+            print(f"Error opening read-only connection: {e}")
+            return cls.get_connection()
+
+    @classmethod
+    def add_change_listener(cls, callback):
+        """Call ``callback(conn)`` after each write that changed the database.
+
+        It runs on the writing thread, when a connection that inserted,
+        updated or deleted rows goes back to the pool. Its transaction is
+        then committed or rolled back, so the callback reads committed data
+        on ``conn``. It does not matter how the writer committed.
+        """
+        if callback not in cls._change_listeners:
+            cls._change_listeners.append(callback)
+
+    @classmethod
+    def remove_change_listener(cls, callback):
+        if callback in cls._change_listeners:
+            cls._change_listeners.remove(callback)
+
+    @classmethod
+    def notify_changes(cls, conn):
+        for callback in list(cls._change_listeners):
+            try:
+                callback(conn)
+            except Exception as e:
+                print(f"Error in database change listener: {e}")
+
+    @classmethod
+    def memory_snapshot(cls):
+        """Copy the database into a new in-memory connection (sqlite backup API)."""
+        snapshot = sqlite3.connect(":memory:")
+        source = cls.get_read_connection()
+        try:
+            source.backup(snapshot)
+        finally:
+            source.close()
+        snapshot.row_factory = sqlite3.Row
+        return snapshot
+
+    @classmethod
+    @contextmanager
+    def report_snapshot(cls):
+        """Run heavy analytics against an in-memory copy of the database.
+
+        Inside the block, get_read_connection() on this thread returns the
+        copy, so every report sees the same data and none touch the file.
+        """
+        snapshot = cls.memory_snapshot()
+        cls._local.report_snapshot = snapshot
+        try:
+            yield snapshot
+        finally:
+            cls._local.report_snapshot = None
+            snapshot.close()
+
+    @classmethod
+    def enable_query_profiling(cls, slow_threshold_ms=100, log_path=None):
+        """Time every statement and log those slower than slow_threshold_ms.
+
+        Pooled connections are recycled so that new ones are opened with the
+        profiling cursor; see QueryProfiler.snapshot() for the statistics.
+        """
+        QueryProfiler.configure(
+            enabled=True,
+            slow_threshold_ms=slow_threshold_ms,
+            log_path=log_path or os.path.join(cls.MAROCPOS_DIR, "logs", "slow_queries.log")
+        )
+        cls.close_all_connections()
+
+    @classmethod
+    def disable_query_profiling(cls):
+        """Go back to plain sqlite3 connections with no timing overhead."""
+        QueryProfiler.configure(enabled=False)
+        cls.close_all_connections()
+
+    @classmethod
+    def close_all_connections(cls):
+        """Close pooled connections, e.g. before the database file is removed."""
+        for pool in (cls._pool, cls._read_pool):
+            if pool is not None:
+                pool.close_all()
+
     @classmethod
     def get_current_datetime(cls):
         """Get current UTC datetime in YYYY-MM-DD HH:MM:SS format."""
         return datetime.now(UTC).strftime("%Y-%m-%d %H:%M:%S")
 
+# Opt-in profiling, e.g. MAROCPOS_SQL_PROFILE=1 MAROCPOS_SLOW_QUERY_MS=50
+if os.environ.get("MAROCPOS_SQL_PROFILE"):
+    DatabaseManager.enable_query_profiling(
+        slow_threshold_ms=float(os.environ.get("MAROCPOS_SLOW_QUERY_MS", 100))
+    )
+
 def get_connection():
     """Wrapper function for backward compatibility."""
     return DatabaseManager.get_connection()
 
+def get_read_connection():
+    """Read-only snapshot connection for reports."""
+    return DatabaseManager.get_read_connection()
+
 def initialize_database():
-    """Initialize the database by creating required tables if they don't exist."""
-    connection = get_connection()
-    if not connection:
-        print("Failed to connect to the database. Initialization aborted.")
-        return False
+    """Bring the database schema up to date by running pending migrations.
 
-    cursor = connection.cursor()
-
-    schema = """
-    CREATE TABLE IF NOT EXISTS Stores (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        name TEXT NOT NULL,
-        address TEXT,
-        phone TEXT,
-        email TEXT,
-        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-    );
-
-    CREATE TABLE IF NOT EXISTS Categories (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        name TEXT NOT NULL UNIQUE,
-        description TEXT,
-        parent_id INTEGER,
-        image_path TEXT,
-        tax_rate REAL DEFAULT 0,
-        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-        FOREIGN KEY (parent_id) REFERENCES Categories(id) ON DELETE SET NULL
-    );
-
-    CREATE TABLE IF NOT EXISTS Products (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        name TEXT NOT NULL UNIQUE,
-        description TEXT,
-        barcode TEXT UNIQUE,
-        unit_price REAL NOT NULL,
-        purchase_price REAL DEFAULT 0,
-        profit_margin REAL,
-        stock INTEGER NOT NULL DEFAULT 0,
-        min_stock INTEGER DEFAULT 0,
-        reorder_point INTEGER DEFAULT 0,
-        category_id INTEGER,
-        image_path TEXT,
-        unit TEXT DEFAULT 'piece',
-        weight REAL,
-        volume REAL,
-        status TEXT DEFAULT 'available',
-        product_type TEXT DEFAULT 'stockable',
-        valuation_method TEXT DEFAULT 'FIFO',
-        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-        FOREIGN KEY (category_id) REFERENCES Categories(id) ON DELETE SET NULL
-    );
-
-    CREATE TABLE IF NOT EXISTS ProductAttributes (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        name TEXT NOT NULL UNIQUE,
-        description TEXT,
-        display_type TEXT DEFAULT 'radio' CHECK(display_type IN ('radio', 'select', 'color', 'pills')),
-        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-    );
-    
-    CREATE TABLE IF NOT EXISTS ProductAttributeValues (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        attribute_id INTEGER NOT NULL,
-        value TEXT NOT NULL,
-        sequence INTEGER DEFAULT 0,
-        html_color TEXT,
-        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-        FOREIGN KEY (attribute_id) REFERENCES ProductAttributes(id) ON DELETE CASCADE,
-        UNIQUE(attribute_id, value)
-    );
-    
-    CREATE TABLE IF NOT EXISTS ProductTemplateAttributeLine (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        product_id INTEGER NOT NULL,
-        attribute_id INTEGER NOT NULL,
-        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-        FOREIGN KEY (product_id) REFERENCES Products(id) ON DELETE CASCADE,
-        FOREIGN KEY (attribute_id) REFERENCES ProductAttributes(id) ON DELETE CASCADE,
-        UNIQUE(product_id, attribute_id)
-    );
-    
-    CREATE TABLE IF NOT EXISTS ProductTemplateAttributeValue (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        line_id INTEGER NOT NULL,
-        value_id INTEGER NOT NULL,
-        price_extra REAL DEFAULT 0,
-        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-        FOREIGN KEY (line_id) REFERENCES ProductTemplateAttributeLine(id) ON DELETE CASCADE,
-        FOREIGN KEY (value_id) REFERENCES ProductAttributeValues(id) ON DELETE CASCADE,
-        UNIQUE(line_id, value_id)
-    );
-    
-    CREATE TABLE IF NOT EXISTS ProductVariantCombination (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        product_id INTEGER NOT NULL,
-        product_variant_id INTEGER NOT NULL,
-        template_attribute_value_id INTEGER NOT NULL,
-        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-        FOREIGN KEY (product_id) REFERENCES Products(id) ON DELETE CASCADE,
-        FOREIGN KEY (product_variant_id) REFERENCES ProductVariants(id) ON DELETE CASCADE,
-        FOREIGN KEY (template_attribute_value_id) REFERENCES ProductTemplateAttributeValue(id) ON DELETE CASCADE,
-        UNIQUE(product_variant_id, template_attribute_value_id)
-    );
-    
-    CREATE TABLE IF NOT EXISTS ProductVariants (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        product_id INTEGER NOT NULL,
-        name TEXT NOT NULL,
-        barcode TEXT UNIQUE,
-        unit_price REAL,
-        purchase_price REAL,
-        stock INTEGER DEFAULT 0,
-        attributes TEXT,
-        sku TEXT,
-        image_path TEXT,
-        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-        FOREIGN KEY (product_id) REFERENCES Products(id) ON DELETE CASCADE
-    );
-
-    CREATE TABLE IF NOT EXISTS StockMovements (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        product_id INTEGER,
-        variant_id INTEGER,
-        movement_type TEXT CHECK(movement_type IN ('in', 'out', 'adjustment')),
-        quantity INTEGER NOT NULL,
-        unit_price REAL,
-        reference TEXT,
-        notes TEXT,
-        user_id INTEGER,
-        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-        FOREIGN KEY (product_id) REFERENCES Products(id) ON DELETE CASCADE,
-        FOREIGN KEY (variant_id) REFERENCES ProductVariants(id) ON DELETE CASCADE,
-        FOREIGN KEY (user_id) REFERENCES Users(id)
-    );
-
-    CREATE TABLE IF NOT EXISTS Users (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        username TEXT NOT NULL UNIQUE,
-        password TEXT NOT NULL,
-        role TEXT NOT NULL CHECK(role IN ('admin', 'cashier', 'manager')),
-        full_name TEXT,
-        email TEXT,
-        phone TEXT,
-        active INTEGER DEFAULT 1,
-        last_login TIMESTAMP,
-        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-    );
-
-    CREATE TABLE IF NOT EXISTS Sales (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        user_id INTEGER NOT NULL,
-        total_amount REAL NOT NULL,
-        discount REAL DEFAULT 0,
-        tax_amount REAL DEFAULT 0,
-        final_total REAL NOT NULL,
-        payment_method TEXT DEFAULT 'CASH',
-        payment_status TEXT DEFAULT 'COMPLETED',
-        notes TEXT,
-        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-        FOREIGN KEY (user_id) REFERENCES Users(id)
-    );
-
-    CREATE TABLE IF NOT EXISTS SaleItems (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        sale_id INTEGER NOT NULL,
-        product_id INTEGER NOT NULL,
-        variant_id INTEGER,
-        quantity INTEGER NOT NULL,
-        unit_price REAL NOT NULL,
-        subtotal REAL NOT NULL,
-        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-        FOREIGN KEY (sale_id) REFERENCES Sales(id),
-        FOREIGN KEY (product_id) REFERENCES Products(id),
-        FOREIGN KEY (variant_id) REFERENCES ProductVariants(id)
-    );
-
-    CREATE TABLE IF NOT EXISTS Cart (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        user_id INTEGER NOT NULL,
-        product_id INTEGER NOT NULL,
-        variant_id INTEGER,
-        quantity INTEGER NOT NULL DEFAULT 1,
-        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-        FOREIGN KEY (user_id) REFERENCES Users(id),
-        FOREIGN KEY (product_id) REFERENCES Products(id),
-        FOREIGN KEY (variant_id) REFERENCES ProductVariants(id)
-    );
-
-    CREATE TABLE IF NOT EXISTS Settings (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        key TEXT NOT NULL UNIQUE,
-        value TEXT,
-        description TEXT,
-        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-    );
-
-    CREATE TABLE IF NOT EXISTS Expenses (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        description TEXT NOT NULL,
-        amount REAL NOT NULL,
-        date DATE NOT NULL,
-        category TEXT,
-        user_id INTEGER,
-        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-        FOREIGN KEY (user_id) REFERENCES Users(id)
-    );
-
-    CREATE TABLE IF NOT EXISTS Suppliers (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        name TEXT NOT NULL,
-        contact_person TEXT,
-        phone TEXT,
-        email TEXT,
-        address TEXT,
-        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-    );
-
-    CREATE TABLE IF NOT EXISTS ProductSuppliers (
-        product_id INTEGER,
-        supplier_id INTEGER,
-        price REAL,
-        lead_time INTEGER,
-        minimum_order INTEGER,
-        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-        PRIMARY KEY (product_id, supplier_id),
-        FOREIGN KEY (product_id) REFERENCES Products(id),
-        FOREIGN KEY (supplier_id) REFERENCES Suppliers(id)
-    );
+    Migrations are recorded in the schema_version table, so on later
+    launches this is a single version check.
     """
+    from migrations import MigrationManager
 
-    try:
-        # Create tables
-        cursor.executescript(schema)
-
-        # Check if admin user exists, if not create it
-        cursor.execute("SELECT COUNT(*) FROM Users WHERE username = ?", ('MAFPOS',))
-        if cursor.fetchone()[0] == 0:
-            current_time = DatabaseManager.get_current_datetime()
-            cursor.execute("""
-                INSERT INTO Users (
-                    username, password, role, full_name, active, created_at
-                ) VALUES (?, ?, ?, ?, ?, ?)
-            """, ('MAFPOS', 'admin123', 'admin', 'Administrator', 1, current_time))
-
-        # Initialize default settings
-        default_settings = [
-            ('store_name', 'My Store', 'Store name'),
-            ('store_address', '', 'Store address'),
-            ('store_phone', '', 'Store phone number'),
-            ('store_email', '', 'Store email'),
-            ('tax_rate', '0', 'Default tax rate'),
-            ('currency', 'MAD', 'Store currency'),
-            ('receipt_footer', 'Thank you for your purchase!', 'Receipt footer message'),
-            ('default_product_type', 'stockable', 'Default product type'),
-            ('default_valuation_method', 'FIFO', 'Default stock valuation method'),
-            ('low_stock_alert', 'true', 'Enable low stock alerts'),
-            ('auto_reorder', 'false', 'Enable automatic reordering'),
-            ('default_unit', 'piece', 'Default unit of measure'),
-            ('receipt_printer_type', 'thermal', 'Receipt printer type (thermal/A4)'),
-            ('receipt_logo_path', '', 'Path to receipt logo image')
-        ]
-
-        for key, value, description in default_settings:
-            cursor.execute("""
-                INSERT OR IGNORE INTO Settings (key, value, description)
-                VALUES (?, ?, ?)
-            """, (key, value, description))
-
-        connection.commit()
-        print("✅ Base de données initialisée avec succès.\n")
-
-        # Print database info
-        cursor.execute("SELECT name FROM sqlite_master WHERE type='table'")
-        tables = cursor.fetchall()
-        print("📦 Tables existantes:")
-        for table in tables:
-            print(f"- {table[0]}")
-
-        cursor.execute("SELECT name FROM Categories")
-        categories = cursor.fetchall()
-        print("\n📁 Catégories existantes:")
-        for category in categories:
-            print(f"- {category[0]}")
-
-        print("\n✅ Tables créées ou vérifiées.")
-        print("✅ Utilisateur admin par défaut existant.")
-        return True
-
-    except sqlite3.Error as e:
-        print(f"❌ Erreur lors de l'initialisation de la base de données : {e}")
+    if not MigrationManager.migrate():
         return False
 
-    finally:
-        if connection:
-            connection.close()
+    missing = MigrationManager.missing_indexes()
+    if missing:
+        print(f"⚠️ Index manquants : {', '.join(missing)}")
+
+    print("✅ Base de données initialisée avec succès.")
+    return True
 
 def reset_database():
     """Reset the database by deleting and recreating it."""
     try:
+        DatabaseManager.close_all_connections()
         if os.path.exists(DatabaseManager.DB_PATH):
             os.remove(DatabaseManager.DB_PATH)
             print("🗑️ Ancienne base de données supprimée.")
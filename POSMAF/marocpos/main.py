@@ -4,8 +4,6 @@ import os
 from ui.login_window import LoginWindow
 from controllers.auth_controller import AuthController
 from models.user import User
-from models.product import Product
-from models.category import Category
 from database import initialize_database
 from datetime import datetime
 
@@ -30,32 +28,9 @@ def init_admin_user():
 def main():
     print("Starting application...")
 
-    # Initialize database
+    # Initialize database (runs pending schema migrations once)
     initialize_database()
 
-    # Create tables
-    User.create_table()
-    Product.create_tables()
-    Category.initialize_database()
-    
-    # Initialize product attribute tables for variants
-    try:
-        from models.product_attribute import ProductAttribute
-        ProductAttribute.create_tables()
-        print("✅ Product tables updated successfully")
-    except Exception as e:
-        print(f"⚠️ Error initializing product attribute tables: {e}")
-    
-    # Initialize payment tables for multiple payment methods
-    try:
-        from models.payment import Payment
-        Payment.create_tables()
-        print("✅ Payment tables created successfully")
-    except Exception as e:
-        print(f"⚠️ Error initializing payment tables: {e}")
-        
-    print("Database tables created or verified.")
-
     # Initialize admin user
     init_admin_user()
     
@@ -0,0 +1,1223 @@
+import re
+import sqlite3
+from database import get_connection, DatabaseManager
+
+# Canonical schema. Every table the application uses is declared here, with
+# the union of the columns the models read and write.
+SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS Stores (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT NOT NULL,
+        address TEXT,
+        phone TEXT,
+        email TEXT,
+        location TEXT,
+        active INTEGER NOT NULL DEFAULT 1,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS Categories (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT NOT NULL UNIQUE,
+        description TEXT,
+        parent_id INTEGER,
+        image_path TEXT,
+        tax_rate REAL DEFAULT 0,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (parent_id) REFERENCES Categories(id) ON DELETE SET NULL
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS Products (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT NOT NULL UNIQUE,
+        description TEXT,
+        barcode TEXT UNIQUE,
+        unit_price REAL NOT NULL DEFAULT 0,
+        purchase_price REAL DEFAULT 0,
+        profit_margin REAL,
+        stock INTEGER NOT NULL DEFAULT 0,
+        min_stock INTEGER DEFAULT 0,
+        reorder_point INTEGER DEFAULT 0,
+        category_id INTEGER,
+        image_path TEXT,
+        unit TEXT DEFAULT 'piece',
+        weight REAL,
+        volume REAL,
+        status TEXT DEFAULT 'available',
+        product_type TEXT DEFAULT 'stockable',
+        valuation_method TEXT DEFAULT 'FIFO',
+        has_variants BOOLEAN DEFAULT 0,
+        variant_attributes TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (category_id) REFERENCES Categories(id) ON DELETE SET NULL
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS ProductAttributes (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT NOT NULL UNIQUE,
+        description TEXT,
+        display_type TEXT DEFAULT 'radio' CHECK(display_type IN ('radio', 'select', 'color', 'pills')),
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS ProductAttributeValues (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        attribute_id INTEGER NOT NULL,
+        value TEXT NOT NULL,
+        sequence INTEGER DEFAULT 0,
+        html_color TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (attribute_id) REFERENCES ProductAttributes(id) ON DELETE CASCADE,
+        UNIQUE(attribute_id, value)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS ProductTemplateAttributeLine (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        product_id INTEGER NOT NULL,
+        attribute_id INTEGER NOT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (product_id) REFERENCES Products(id) ON DELETE CASCADE,
+        FOREIGN KEY (attribute_id) REFERENCES ProductAttributes(id) ON DELETE CASCADE,
+        UNIQUE(product_id, attribute_id)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS ProductTemplateAttributeValue (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        line_id INTEGER NOT NULL,
+        value_id INTEGER NOT NULL,
+        price_extra REAL DEFAULT 0,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (line_id) REFERENCES ProductTemplateAttributeLine(id) ON DELETE CASCADE,
+        FOREIGN KEY (value_id) REFERENCES ProductAttributeValues(id) ON DELETE CASCADE,
+        UNIQUE(line_id, value_id)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS ProductVariants (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        product_id INTEGER NOT NULL,
+        name TEXT,
+        barcode TEXT UNIQUE,
+        unit_price REAL,
+        purchase_price REAL,
+        stock INTEGER DEFAULT 0,
+        attributes TEXT,
+        attribute_values TEXT,
+        price_adjustment REAL DEFAULT 0,
+        sku TEXT,
+        image_path TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (product_id) REFERENCES Products(id) ON DELETE CASCADE
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS ProductVariantCombination (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        product_id INTEGER NOT NULL,
+        product_variant_id INTEGER NOT NULL,
+        template_attribute_value_id INTEGER NOT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (product_id) REFERENCES Products(id) ON DELETE CASCADE,
+        FOREIGN KEY (product_variant_id) REFERENCES ProductVariants(id) ON DELETE CASCADE,
+        FOREIGN KEY (template_attribute_value_id) REFERENCES ProductTemplateAttributeValue(id) ON DELETE CASCADE,
+        UNIQUE(product_variant_id, template_attribute_value_id)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS Users (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        username TEXT NOT NULL UNIQUE,
+        password TEXT NOT NULL,
+        role TEXT NOT NULL CHECK(role IN ('admin', 'cashier', 'manager')),
+        full_name TEXT,
+        email TEXT,
+        phone TEXT,
+        active INTEGER DEFAULT 1,
+        last_login TIMESTAMP,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS StockMovements (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        product_id INTEGER,
+        variant_id INTEGER,
+        movement_type TEXT CHECK(movement_type IN ('in', 'out', 'adjustment')),
+        quantity INTEGER NOT NULL,
+        unit_price REAL,
+        reference TEXT,
+        notes TEXT,
+        user_id INTEGER,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (product_id) REFERENCES Products(id) ON DELETE CASCADE,
+        FOREIGN KEY (variant_id) REFERENCES ProductVariants(id) ON DELETE CASCADE,
+        FOREIGN KEY (user_id) REFERENCES Users(id)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS Sales (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER NOT NULL,
+        total_amount REAL NOT NULL,
+        discount REAL DEFAULT 0,
+        tax_amount REAL DEFAULT 0,
+        final_total REAL NOT NULL,
+        payment_method TEXT DEFAULT 'CASH',
+        payment_status TEXT DEFAULT 'COMPLETED',
+        notes TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (user_id) REFERENCES Users(id)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS SaleItems (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        sale_id INTEGER NOT NULL,
+        product_id INTEGER NOT NULL,
+        variant_id INTEGER,
+        quantity INTEGER NOT NULL,
+        unit_price REAL NOT NULL,
+        subtotal REAL NOT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (sale_id) REFERENCES Sales(id),
+        FOREIGN KEY (product_id) REFERENCES Products(id),
+        FOREIGN KEY (variant_id) REFERENCES ProductVariants(id)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS PaymentMethods (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT NOT NULL UNIQUE,
+        description TEXT,
+        active INTEGER DEFAULT 1,
+        requires_reference INTEGER DEFAULT 0,
+        requires_approval INTEGER DEFAULT 0,
+        icon TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS SalePayments (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        sale_id INTEGER NOT NULL,
+        payment_method_id INTEGER NOT NULL,
+        amount REAL NOT NULL,
+        reference_number TEXT,
+        approved INTEGER DEFAULT 1,
+        notes TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (sale_id) REFERENCES Sales(id) ON DELETE CASCADE,
+        FOREIGN KEY (payment_method_id) REFERENCES PaymentMethods(id)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS Cart (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER NOT NULL,
+        product_id INTEGER NOT NULL,
+        variant_id INTEGER,
+        quantity INTEGER NOT NULL DEFAULT 1,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (user_id) REFERENCES Users(id),
+        FOREIGN KEY (product_id) REFERENCES Products(id),
+        FOREIGN KEY (variant_id) REFERENCES ProductVariants(id)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS Settings (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        key TEXT NOT NULL UNIQUE,
+        value TEXT,
+        description TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS Expenses (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        description TEXT NOT NULL,
+        amount REAL NOT NULL,
+        date DATE NOT NULL,
+        category TEXT,
+        user_id INTEGER,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (user_id) REFERENCES Users(id)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS Suppliers (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT NOT NULL,
+        contact_person TEXT,
+        phone TEXT,
+        email TEXT,
+        address TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS ProductSuppliers (
+        product_id INTEGER,
+        supplier_id INTEGER,
+        price REAL,
+        lead_time INTEGER,
+        minimum_order INTEGER,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (product_id, supplier_id),
+        FOREIGN KEY (product_id) REFERENCES Products(id),
+        FOREIGN KEY (supplier_id) REFERENCES Suppliers(id)
+    )
+    """,
+]
+
+DEFAULT_SETTINGS = [
+    ('store_name', 'My Store', 'Store name'),
+    ('store_address', '', 'Store address'),
+    ('store_phone', '', 'Store phone number'),
+    ('store_email', '', 'Store email'),
+    ('tax_rate', '0', 'Default tax rate'),
+    ('currency', 'MAD', 'Store currency'),
+    ('receipt_footer', 'Thank you for your purchase!', 'Receipt footer message'),
+    ('default_product_type', 'stockable', 'Default product type'),
+    ('default_valuation_method', 'FIFO', 'Default stock valuation method'),
+    ('low_stock_alert', 'true', 'Enable low stock alerts'),
+    ('auto_reorder', 'false', 'Enable automatic reordering'),
+    ('default_unit', 'piece', 'Default unit of measure'),
+    ('receipt_printer_type', 'thermal', 'Receipt printer type (thermal/A4)'),
+    ('receipt_logo_path', '', 'Path to receipt logo image')
+]
+
+DEFAULT_PAYMENT_METHODS = [
+    ('CASH', 'Paiement en espèces', 1, 0, 0, 'cash.png'),
+    ('CARD', 'Paiement par carte bancaire', 1, 1, 0, 'credit-card.png'),
+    ('CHECK', 'Paiement par chèque', 1, 1, 1, 'check.png'),
+    ('TRANSFER', 'Virement bancaire', 1, 1, 1, 'bank-transfer.png'),
+    ('MOBILE', 'Paiement mobile', 1, 1, 0, 'mobile-payment.png'),
+]
+
+
+# Secondary indexes for the report, stock and variant lookup paths. Trailing
+# columns make the index covering for the aggregate queries in SalesReport.
+LOOKUP_INDEXES = [
+    "CREATE INDEX IF NOT EXISTS idx_sales_created_at ON Sales (created_at, final_total, discount, user_id)",
+    "CREATE INDEX IF NOT EXISTS idx_saleitems_sale_id ON SaleItems (sale_id)",
+    "CREATE INDEX IF NOT EXISTS idx_saleitems_product_id ON SaleItems (product_id, sale_id, quantity, subtotal)",
+    "CREATE INDEX IF NOT EXISTS idx_saleitems_variant_id ON SaleItems (variant_id)",
+    "CREATE INDEX IF NOT EXISTS idx_salepayments_sale_id ON SalePayments (sale_id, payment_method_id, amount)",
+    "CREATE INDEX IF NOT EXISTS idx_productvariants_product_id ON ProductVariants (product_id)",
+    "CREATE INDEX IF NOT EXISTS idx_stockmovements_product_id ON StockMovements (product_id, created_at)",
+    "CREATE INDEX IF NOT EXISTS idx_stockmovements_variant_id ON StockMovements (variant_id)",
+    "CREATE INDEX IF NOT EXISTS idx_products_category_id ON Products (category_id, name)",
+]
+
+# Barcode lookups of the scan-to-cart field
+BARCODE_INDEXES = [
+    "CREATE INDEX IF NOT EXISTS idx_products_barcode ON Products (barcode)",
+    "CREATE INDEX IF NOT EXISTS idx_productvariants_barcode ON ProductVariants (barcode)",
+]
+
+# Combination rows of a product, loaded in bulk with its variants
+VARIANT_COMBINATION_INDEXES = [
+    "CREATE INDEX IF NOT EXISTS idx_variantcombination_product_id ON ProductVariantCombination (product_id)",
+]
+
+
+def _create_base_schema(cursor):
+    """Create every table of the canonical schema."""
+    for statement in SCHEMA:
+        cursor.execute(statement)
+
+
+def _add_missing_columns(cursor):
+    """Bring tables created by older versions up to the canonical columns.
+
+    The canonical schema is built in a scratch in-memory database and each
+    existing table is compared against it. SQLite cannot add a column with a
+    non-constant default, so timestamp columns are added bare and back-filled.
+    """
+    reference = sqlite3.connect(":memory:")
+    try:
+        for statement in SCHEMA:
+            reference.execute(statement)
+        tables = [row[0] for row in reference.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%'"
+        )]
+        expected = {
+            table: reference.execute(f"PRAGMA table_info({table})").fetchall()
+            for table in tables
+        }
+    finally:
+        reference.close()
+
+    for table, columns in expected.items():
+        cursor.execute(f"PRAGMA table_info({table})")
+        existing = {row[1] for row in cursor.fetchall()}
+        for _, name, col_type, notnull, default, _ in columns:
+            if name in existing:
+                continue
+            print(f"Adding '{name}' column to {table} table...")
+            if default is not None and default.upper() == 'CURRENT_TIMESTAMP':
+                cursor.execute(f"ALTER TABLE {table} ADD COLUMN {name} {col_type}")
+                cursor.execute(f"UPDATE {table} SET {name} = CURRENT_TIMESTAMP WHERE {name} IS NULL")
+            elif default is not None:
+                null_clause = " NOT NULL" if notnull else ""
+                cursor.execute(f"ALTER TABLE {table} ADD COLUMN {name} {col_type}{null_clause} DEFAULT {default}")
+            else:
+                cursor.execute(f"ALTER TABLE {table} ADD COLUMN {name} {col_type}")
+
+
+def _add_column(cursor, table, name, definition):
+    """ALTER TABLE ... ADD COLUMN, unless the table already has the column."""
+    cursor.execute(f"PRAGMA table_info({table})")
+    if name not in {row[1] for row in cursor.fetchall()}:
+        cursor.execute(f"ALTER TABLE {table} ADD COLUMN {name} {definition}")
+
+
+def _seed_defaults(cursor):
+    """Insert the default admin user, settings and payment methods."""
+    cursor.execute("SELECT COUNT(*) FROM Users WHERE username = ?", ('MAFPOS',))
+    if cursor.fetchone()[0] == 0:
+        current_time = DatabaseManager.get_current_datetime()
+        cursor.execute("""
+            INSERT INTO Users (
+                username, password, role, full_name, active, created_at
+            ) VALUES (?, ?, ?, ?, ?, ?)
+        """, ('MAFPOS', 'admin123', 'admin', 'Administrator', 1, current_time))
+
+    cursor.executemany("""
+        INSERT OR IGNORE INTO Settings (key, value, description)
+        VALUES (?, ?, ?)
+    """, DEFAULT_SETTINGS)
+
+    cursor.execute("SELECT COUNT(*) FROM PaymentMethods")
+    if cursor.fetchone()[0] == 0:
+        current_time = DatabaseManager.get_current_datetime()
+        cursor.executemany("""
+            INSERT INTO PaymentMethods (
+                name, description, active,
+                requires_reference, requires_approval,
+                icon, created_at, updated_at
+            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        """, [(*method, current_time, current_time) for method in DEFAULT_PAYMENT_METHODS])
+
+
+def _add_lookup_indexes(cursor):
+    for statement in LOOKUP_INDEXES:
+        cursor.execute(statement)
+
+
+def _add_barcode_indexes(cursor):
+    for statement in BARCODE_INDEXES:
+        cursor.execute(statement)
+
+
+def _add_variant_combination_index(cursor):
+    for statement in VARIANT_COMBINATION_INDEXES:
+        cursor.execute(statement)
+
+
+# Full-text index over product and variant names, descriptions, SKUs and
+# barcodes. Product rows use rowid = product id, variant rows rowid = -variant
+# id, so triggers can address their own row without scanning. Update triggers
+# only watch the indexed columns, so stock changes never touch the index.
+SEARCH_SCHEMA = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS ProductSearch USING fts5(
+        name, description, sku, barcode,
+        product_id UNINDEXED,
+        tokenize = 'unicode61 remove_diacritics 2',
+        prefix = '2 3'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS trg_products_search_insert
+    AFTER INSERT ON Products BEGIN
+        INSERT INTO ProductSearch (rowid, name, description, sku, barcode, product_id)
+        VALUES (new.id, new.name, new.description, NULL, new.barcode, new.id);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS trg_products_search_update
+    AFTER UPDATE OF name, description, barcode ON Products BEGIN
+        DELETE FROM ProductSearch WHERE rowid = old.id;
+        INSERT INTO ProductSearch (rowid, name, description, sku, barcode, product_id)
+        VALUES (new.id, new.name, new.description, NULL, new.barcode, new.id);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS trg_products_search_delete
+    AFTER DELETE ON Products BEGIN
+        DELETE FROM ProductSearch WHERE rowid = old.id;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS trg_variants_search_insert
+    AFTER INSERT ON ProductVariants BEGIN
+        INSERT INTO ProductSearch (rowid, name, description, sku, barcode, product_id)
+        VALUES (-new.id, new.name, NULL, new.sku, new.barcode, new.product_id);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS trg_variants_search_update
+    AFTER UPDATE OF name, sku, barcode, product_id ON ProductVariants BEGIN
+        DELETE FROM ProductSearch WHERE rowid = -old.id;
+        INSERT INTO ProductSearch (rowid, name, description, sku, barcode, product_id)
+        VALUES (-new.id, new.name, NULL, new.sku, new.barcode, new.product_id);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS trg_variants_search_delete
+    AFTER DELETE ON ProductVariants BEGIN
+        DELETE FROM ProductSearch WHERE rowid = -old.id;
+    END
+    """,
+]
+
+
+def _create_product_search(cursor):
+    """Create the FTS5 search index and its sync triggers, then backfill it."""
+    for statement in SEARCH_SCHEMA:
+        cursor.execute(statement)
+    cursor.execute("DELETE FROM ProductSearch")
+    cursor.execute("""
+        INSERT INTO ProductSearch (rowid, name, description, sku, barcode, product_id)
+        SELECT id, name, description, NULL, barcode, id FROM Products
+    """)
+    cursor.execute("""
+        INSERT INTO ProductSearch (rowid, name, description, sku, barcode, product_id)
+        SELECT -id, name, NULL, sku, barcode, product_id FROM ProductVariants
+    """)
+    # Default ranking: name matches weigh most, then SKU and barcode
+    cursor.execute("INSERT INTO ProductSearch (ProductSearch, rank) VALUES ('rank', 'bm25(10.0, 1.0, 5.0, 5.0, 0.0)')")
+    cursor.execute("INSERT INTO ProductSearch (ProductSearch) VALUES ('optimize')")
+
+
+# Selling price of a variant: base product price + variant price_adjustment
+# + the price_extra of every template value in its combination. Written in
+# terms of ProductVariants so it can be used in the triggers' UPDATEs.
+EFFECTIVE_PRICE_SQL = """
+    COALESCE((SELECT p.unit_price FROM Products p WHERE p.id = ProductVariants.product_id), 0)
+    + COALESCE(ProductVariants.price_adjustment, 0)
+    + COALESCE((
+        SELECT SUM(ptav.price_extra)
+        FROM ProductVariantCombination pvc
+        JOIN ProductTemplateAttributeValue ptav ON pvc.template_attribute_value_id = ptav.id
+        WHERE pvc.product_variant_id = ProductVariants.id
+    ), 0)
+"""
+
+# The price_extra trigger looks combinations up by template value
+EFFECTIVE_PRICE_INDEXES = [
+    "CREATE INDEX IF NOT EXISTS idx_variantcombination_template_value ON ProductVariantCombination (template_attribute_value_id)",
+]
+
+# Keep ProductVariants.effective_price current whenever one of its inputs changes
+EFFECTIVE_PRICE_TRIGGERS = [
+    f"""
+    CREATE TRIGGER IF NOT EXISTS trg_variants_price_insert
+    AFTER INSERT ON ProductVariants BEGIN
+        UPDATE ProductVariants SET effective_price = {EFFECTIVE_PRICE_SQL} WHERE id = new.id;
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS trg_variants_price_update
+    AFTER UPDATE OF price_adjustment, product_id ON ProductVariants BEGIN
+        UPDATE ProductVariants SET effective_price = {EFFECTIVE_PRICE_SQL} WHERE id = new.id;
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS trg_products_price_update
+    AFTER UPDATE OF unit_price ON Products BEGIN
+        UPDATE ProductVariants SET effective_price = {EFFECTIVE_PRICE_SQL} WHERE product_id = new.id;
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS trg_template_value_price_update
+    AFTER UPDATE OF price_extra ON ProductTemplateAttributeValue BEGIN
+        UPDATE ProductVariants SET effective_price = {EFFECTIVE_PRICE_SQL}
+        WHERE id IN (
+            SELECT product_variant_id FROM ProductVariantCombination
+            WHERE template_attribute_value_id = new.id
+        );
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS trg_combination_price_insert
+    AFTER INSERT ON ProductVariantCombination BEGIN
+        UPDATE ProductVariants SET effective_price = {EFFECTIVE_PRICE_SQL} WHERE id = new.product_variant_id;
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS trg_combination_price_delete
+    AFTER DELETE ON ProductVariantCombination BEGIN
+        UPDATE ProductVariants SET effective_price = {EFFECTIVE_PRICE_SQL} WHERE id = old.product_variant_id;
+    END
+    """,
+]
+
+
+def _add_effective_price(cursor):
+    """Store each variant's selling price and maintain it with triggers."""
+    cursor.execute("PRAGMA table_info(ProductVariants)")
+    if 'effective_price' not in {row[1] for row in cursor.fetchall()}:
+        cursor.execute("ALTER TABLE ProductVariants ADD COLUMN effective_price REAL")
+    for statement in EFFECTIVE_PRICE_INDEXES + EFFECTIVE_PRICE_TRIGGERS:
+        cursor.execute(statement)
+    cursor.execute(f"UPDATE ProductVariants SET effective_price = {EFFECTIVE_PRICE_SQL}")
+
+
+def _add_dynamic_variants(cursor):
+    """Let a product create its variants on first sale or stock entry."""
+    _add_column(cursor, 'Products', 'dynamic_variants', 'BOOLEAN DEFAULT 0')
+
+
+# Canonical combination key of a variant: its template value ids, sorted and
+# comma separated (ProductAttribute.combination_key builds the same text for
+# lookups). Always computed by this expression from the combination rows: by
+# the model layer once all rows of a variant exist (insert_variants,
+# add_combination), and by trigger on removals. Per-row updates while a
+# variant is being built could collide with another variant's complete key.
+COMBINATION_KEY_SQL = """
+    (SELECT group_concat(template_attribute_value_id, ',') FROM (
+        SELECT template_attribute_value_id FROM ProductVariantCombination
+        WHERE product_variant_id = ProductVariants.id
+        ORDER BY template_attribute_value_id
+    ))
+"""
+
+COMBINATION_KEY_SCHEMA = [
+    """
+    CREATE UNIQUE INDEX IF NOT EXISTS idx_productvariants_combination_key
+    ON ProductVariants (product_id, combination_key)
+    WHERE combination_key IS NOT NULL
+    """,
+    # A key that would duplicate another variant's is left unchanged
+    f"""
+    CREATE TRIGGER IF NOT EXISTS trg_combination_key_delete
+    AFTER DELETE ON ProductVariantCombination BEGIN
+        UPDATE OR IGNORE ProductVariants SET combination_key = {COMBINATION_KEY_SQL}
+        WHERE id = old.product_variant_id;
+    END
+    """,
+]
+
+
+def _add_combination_key(cursor):
+    """Key each variant by its sorted template value ids, uniquely per product."""
+    cursor.execute("PRAGMA table_info(ProductVariants)")
+    if 'combination_key' not in {row[1] for row in cursor.fetchall()}:
+        cursor.execute("ALTER TABLE ProductVariants ADD COLUMN combination_key TEXT")
+    # Rebuilt below, after the back-fill has removed duplicate keys
+    cursor.execute("DROP INDEX IF EXISTS idx_productvariants_combination_key")
+    cursor.execute(f"UPDATE ProductVariants SET combination_key = {COMBINATION_KEY_SQL}")
+    # Older databases may hold duplicate variants; the oldest keeps the key
+    cursor.execute("""
+        UPDATE ProductVariants SET combination_key = NULL
+        WHERE combination_key IS NOT NULL AND id NOT IN (
+            SELECT MIN(id) FROM ProductVariants
+            WHERE combination_key IS NOT NULL
+            GROUP BY product_id, combination_key
+        )
+    """)
+    if cursor.rowcount > 0:
+        print(f"⚠️ {cursor.rowcount} variantes en double laissées sans clé de combinaison.")
+    for statement in COMBINATION_KEY_SCHEMA:
+        cursor.execute(statement)
+
+
+# Display name of a variant in terms of ProductVariants: its attribute values
+# in attribute line order, else the values of legacy attribute_values JSON,
+# else its name.
+DISPLAY_NAME_SQL = """
+    COALESCE(
+        (SELECT group_concat(value, ' / ') FROM (
+            SELECT pav.value
+            FROM ProductVariantCombination pvc
+            JOIN ProductTemplateAttributeValue ptav ON ptav.id = pvc.template_attribute_value_id
+            JOIN ProductAttributeValues pav ON pav.id = ptav.value_id
+            WHERE pvc.product_variant_id = ProductVariants.id
+            ORDER BY ptav.line_id
+        )),
+        (SELECT group_concat(value, ' / ') FROM json_each(
+            CASE WHEN json_valid(ProductVariants.attribute_values) THEN ProductVariants.attribute_values END
+        ) WHERE value IS NOT NULL AND value <> ''),
+        NULLIF(ProductVariants.name, ''),
+        'Variante #' || ProductVariants.id
+    )
+"""
+
+DISPLAY_NAME_TRIGGERS = [
+    f"""
+    CREATE TRIGGER IF NOT EXISTS trg_variants_display_insert
+    AFTER INSERT ON ProductVariants BEGIN
+        UPDATE ProductVariants SET display_name = {DISPLAY_NAME_SQL} WHERE id = new.id;
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS trg_variants_display_update
+    AFTER UPDATE OF name, attribute_values ON ProductVariants BEGIN
+        UPDATE ProductVariants SET display_name = {DISPLAY_NAME_SQL} WHERE id = new.id;
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS trg_combination_display_insert
+    AFTER INSERT ON ProductVariantCombination BEGIN
+        UPDATE ProductVariants SET display_name = {DISPLAY_NAME_SQL} WHERE id = new.product_variant_id;
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS trg_combination_display_delete
+    AFTER DELETE ON ProductVariantCombination BEGIN
+        UPDATE ProductVariants SET display_name = {DISPLAY_NAME_SQL} WHERE id = old.product_variant_id;
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS trg_attribute_value_display_update
+    AFTER UPDATE OF value ON ProductAttributeValues BEGIN
+        UPDATE ProductVariants SET display_name = {DISPLAY_NAME_SQL}
+        WHERE id IN (
+            SELECT pvc.product_variant_id
+            FROM ProductVariantCombination pvc
+            JOIN ProductTemplateAttributeValue ptav ON ptav.id = pvc.template_attribute_value_id
+            WHERE ptav.value_id = new.id
+        );
+    END
+    """,
+]
+
+
+def _add_variant_display_name(cursor):
+    """Store each variant's display name and maintain it with triggers."""
+    cursor.execute("PRAGMA table_info(ProductVariants)")
+    if 'display_name' not in {row[1] for row in cursor.fetchall()}:
+        cursor.execute("ALTER TABLE ProductVariants ADD COLUMN display_name TEXT")
+    for statement in DISPLAY_NAME_TRIGGERS:
+        cursor.execute(statement)
+    cursor.execute(f"UPDATE ProductVariants SET display_name = {DISPLAY_NAME_SQL}")
+
+
+# Low-stock products in name order for the product listing filter; the WHERE
+# clause must stay identical to the one in Product.get_products_page
+LOW_STOCK_CONDITION = "COALESCE(stock, 0) <= COALESCE(min_stock, 0)"
+PRODUCT_LISTING_INDEXES = [
+    f"CREATE INDEX IF NOT EXISTS idx_products_low_stock ON Products (name) WHERE {LOW_STOCK_CONDITION}",
+]
+
+
+def _add_product_listing_indexes(cursor):
+    """Indexes behind the keyset product listing (Product.get_products_page).
+
+    Pages are read in (name, id) order. Databases created with a UNIQUE name
+    already have that index; older ones get a plain one.
+    """
+    cursor.execute("PRAGMA index_list(Products)")
+    indexes = [row[1] for row in cursor.fetchall() if not row[4]]
+    leading_columns = set()
+    for index in indexes:
+        cursor.execute(f"PRAGMA index_info('{index}')")
+        columns = {row[0]: row[2] for row in cursor.fetchall()}
+        if 0 in columns:
+            leading_columns.add(columns[0])
+    if 'name' not in leading_columns:
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_products_name ON Products (name)")
+    for statement in PRODUCT_LISTING_INDEXES:
+        cursor.execute(statement)
+
+
+# Open layers of each stock row in consumption order; fully consumed layers
+# stay out of the index, so it only grows with the stock actually on hand
+COST_LAYER_SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS StockCostLayers (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        product_id INTEGER NOT NULL,
+        variant_id INTEGER,
+        movement_id INTEGER,
+        unit_cost REAL NOT NULL DEFAULT 0,
+        quantity_received REAL NOT NULL,
+        quantity_remaining REAL NOT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (product_id) REFERENCES Products(id) ON DELETE CASCADE,
+        FOREIGN KEY (variant_id) REFERENCES ProductVariants(id) ON DELETE CASCADE,
+        FOREIGN KEY (movement_id) REFERENCES StockMovements(id) ON DELETE SET NULL
+    )
+    """,
+]
+
+COST_LAYER_INDEXES = [
+    """
+    CREATE INDEX IF NOT EXISTS idx_costlayers_open
+    ON StockCostLayers (product_id, variant_id, id)
+    WHERE quantity_remaining > 0
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_costlayers_movement_id ON StockCostLayers (movement_id)",
+]
+
+
+def _add_cost_layers(cursor):
+    """Create the stock cost layers and open one layer for the stock on hand.
+
+    Existing stock is valued at its purchase price (the variant's, else the
+    product's). Sale lines recorded before this step keep a NULL cost.
+    """
+    _add_column(cursor, 'SaleItems', 'cost_amount', 'REAL')
+    for statement in COST_LAYER_SCHEMA + COST_LAYER_INDEXES:
+        cursor.execute(statement)
+    cursor.execute("SELECT COUNT(*) FROM StockCostLayers")
+    if cursor.fetchone()[0]:
+        return
+    cursor.execute("""
+        INSERT INTO StockCostLayers (product_id, variant_id, unit_cost, quantity_received, quantity_remaining)
+        SELECT id, NULL, COALESCE(purchase_price, 0), stock, stock
+        FROM Products
+        WHERE stock > 0
+    """)
+    cursor.execute("""
+        INSERT INTO StockCostLayers (product_id, variant_id, unit_cost, quantity_received, quantity_remaining)
+        SELECT pv.product_id, pv.id, COALESCE(pv.purchase_price, p.purchase_price, 0), pv.stock, pv.stock
+        FROM ProductVariants pv
+        JOIN Products p ON p.id = pv.product_id
+        WHERE pv.stock > 0
+    """)
+
+
+STOCK_LEDGER_SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS StockSnapshots (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        product_id INTEGER NOT NULL,
+        variant_id INTEGER,
+        quantity REAL NOT NULL,
+        last_movement_id INTEGER NOT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (product_id) REFERENCES Products(id) ON DELETE CASCADE,
+        FOREIGN KEY (variant_id) REFERENCES ProductVariants(id) ON DELETE CASCADE
+    )
+    """,
+]
+
+# Movements of a stock row in ledger order (covering, for the on-hand sums),
+# snapshots of a row newest first, and the sale / cancellation links
+STOCK_LEDGER_INDEXES = [
+    "CREATE INDEX IF NOT EXISTS idx_stockmovements_ledger ON StockMovements (product_id, variant_id, id, quantity)",
+    "CREATE INDEX IF NOT EXISTS idx_stocksnapshots_row ON StockSnapshots (product_id, variant_id, last_movement_id)",
+    "CREATE INDEX IF NOT EXISTS idx_stocksnapshots_last_movement ON StockSnapshots (last_movement_id)",
+    "CREATE INDEX IF NOT EXISTS idx_stockmovements_sale_id ON StockMovements (sale_id) WHERE sale_id IS NOT NULL",
+    "CREATE INDEX IF NOT EXISTS idx_stockmovements_reversal_of ON StockMovements (reversal_of) WHERE reversal_of IS NOT NULL",
+]
+
+
+def _add_stock_ledger(cursor):
+    """Turn StockMovements into the stock ledger and take its opening snapshot.
+
+    Earlier sales never wrote movements, so the ledger starts from the stock
+    columns as they are now: every row with stock or with past movements is
+    snapshotted at its current stock, up to the last existing movement.
+    """
+    _add_column(cursor, 'StockMovements', 'sale_id', 'INTEGER')
+    _add_column(cursor, 'StockMovements', 'reversal_of', 'INTEGER')
+    for statement in STOCK_LEDGER_SCHEMA + STOCK_LEDGER_INDEXES:
+        cursor.execute(statement)
+    cursor.execute("SELECT COUNT(*) FROM StockSnapshots")
+    if cursor.fetchone()[0]:
+        return
+    cursor.execute("SELECT COALESCE(MAX(id), 0) FROM StockMovements")
+    last_movement_id = cursor.fetchone()[0]
+    cursor.execute("""
+        INSERT INTO StockSnapshots (product_id, variant_id, quantity, last_movement_id)
+        SELECT id, NULL, COALESCE(stock, 0), ?
+        FROM Products
+        WHERE COALESCE(stock, 0) <> 0
+           OR id IN (SELECT product_id FROM StockMovements WHERE variant_id IS NULL)
+    """, (last_movement_id,))
+    cursor.execute("""
+        INSERT INTO StockSnapshots (product_id, variant_id, quantity, last_movement_id)
+        SELECT product_id, id, COALESCE(stock, 0), ?
+        FROM ProductVariants
+        WHERE COALESCE(stock, 0) <> 0
+           OR id IN (SELECT variant_id FROM StockMovements WHERE variant_id IS NOT NULL)
+    """, (last_movement_id,))
+
+
+STOCK_TAKE_SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS StockTakes (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT,
+        status TEXT NOT NULL DEFAULT 'open' CHECK(status IN ('open', 'closed', 'cancelled')),
+        category_id INTEGER,
+        notes TEXT,
+        user_id INTEGER,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        closed_at TIMESTAMP,
+        FOREIGN KEY (category_id) REFERENCES Categories(id) ON DELETE SET NULL,
+        FOREIGN KEY (user_id) REFERENCES Users(id)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS StockTakeCounts (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        stock_take_id INTEGER NOT NULL,
+        product_id INTEGER NOT NULL,
+        variant_id INTEGER,
+        counted_quantity REAL NOT NULL DEFAULT 0,
+        last_movement_id INTEGER NOT NULL DEFAULT 0,
+        expected_quantity REAL,
+        user_id INTEGER,
+        counted_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (stock_take_id) REFERENCES StockTakes(id) ON DELETE CASCADE,
+        FOREIGN KEY (product_id) REFERENCES Products(id) ON DELETE CASCADE,
+        FOREIGN KEY (variant_id) REFERENCES ProductVariants(id) ON DELETE CASCADE,
+        FOREIGN KEY (user_id) REFERENCES Users(id)
+    )
+    """,
+]
+
+# One count per stock row and session (the upsert target of
+# StockTake.record_counts), and the open sessions
+STOCK_TAKE_INDEXES = [
+    """
+    CREATE UNIQUE INDEX IF NOT EXISTS idx_stocktakecounts_row
+    ON StockTakeCounts (stock_take_id, product_id, COALESCE(variant_id, 0))
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_stocktakes_open ON StockTakes (id) WHERE status = 'open'",
+]
+
+
+def _add_stock_takes(cursor):
+    """Create the stock-take sessions and their staging table of counts."""
+    for statement in STOCK_TAKE_SCHEMA + STOCK_TAKE_INDEXES:
+        cursor.execute(statement)
+
+
+# Movement history of a variant in date order (the product-wide history uses
+# idx_stockmovements_product_id)
+MOVEMENT_HISTORY_INDEXES = [
+    """
+    CREATE INDEX IF NOT EXISTS idx_stockmovements_variant_history
+    ON StockMovements (variant_id, created_at)
+    WHERE variant_id IS NOT NULL
+    """,
+]
+
+
+def _add_movement_history_indexes(cursor):
+    """Indexes behind the paged movement history (Product.get_stock_movements_page)."""
+    for statement in MOVEMENT_HISTORY_INDEXES:
+        cursor.execute(statement)
+
+
+# Stock alerts, raised by triggers when a stock column crosses a threshold:
+# 'low_stock' at min_stock (when the low_stock_alert setting is on) and
+# 'reorder' at reorder_point (when auto_reorder is on). Variants use the
+# thresholds of their product. An alert is resolved when the stock climbs
+# back above its threshold. Thresholds are read as in LOW_STOCK_CONDITION.
+SETTING_ENABLED_SQL = """
+    LOWER(COALESCE((SELECT value FROM Settings WHERE key = '{key}'), '{default}')) IN ('true', '1', 'yes', 'oui')
+"""
+LOW_STOCK_ALERTS_ENABLED = SETTING_ENABLED_SQL.format(key='low_stock_alert', default='true')
+REORDER_ALERTS_ENABLED = SETTING_ENABLED_SQL.format(key='auto_reorder', default='false')
+
+STOCK_ALERT_SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS StockAlerts (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        product_id INTEGER NOT NULL,
+        variant_id INTEGER,
+        alert_type TEXT NOT NULL CHECK(alert_type IN ('low_stock', 'reorder')),
+        stock REAL,
+        threshold REAL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        resolved_at TIMESTAMP,
+        acknowledged_at TIMESTAMP,
+        FOREIGN KEY (product_id) REFERENCES Products(id) ON DELETE CASCADE,
+        FOREIGN KEY (variant_id) REFERENCES ProductVariants(id) ON DELETE CASCADE
+    )
+    """,
+]
+
+STOCK_ALERT_INDEXES = [
+    """
+    CREATE INDEX IF NOT EXISTS idx_stockalerts_open
+    ON StockAlerts (product_id, variant_id, alert_type)
+    WHERE resolved_at IS NULL
+    """,
+]
+
+STOCK_ALERT_TRIGGERS = [
+    f"""
+    CREATE TRIGGER IF NOT EXISTS trg_products_stock_alert
+    AFTER UPDATE OF stock, min_stock, reorder_point ON Products
+    WHEN COALESCE(NEW.has_variants, 0) = 0 AND (
+        (COALESCE(NEW.stock, 0) <= COALESCE(NEW.min_stock, 0)
+            AND COALESCE(OLD.stock, 0) > COALESCE(OLD.min_stock, 0))
+        OR (COALESCE(NEW.stock, 0) <= COALESCE(NEW.reorder_point, 0)
+            AND COALESCE(OLD.stock, 0) > COALESCE(OLD.reorder_point, 0))
+    )
+    BEGIN
+        INSERT INTO StockAlerts (product_id, variant_id, alert_type, stock, threshold)
+        SELECT NEW.id, NULL, 'low_stock', COALESCE(NEW.stock, 0), COALESCE(NEW.min_stock, 0)
+        WHERE COALESCE(NEW.stock, 0) <= COALESCE(NEW.min_stock, 0)
+          AND COALESCE(OLD.stock, 0) > COALESCE(OLD.min_stock, 0)
+          AND {LOW_STOCK_ALERTS_ENABLED};
+        INSERT INTO StockAlerts (product_id, variant_id, alert_type, stock, threshold)
+        SELECT NEW.id, NULL, 'reorder', COALESCE(NEW.stock, 0), NEW.reorder_point
+        WHERE NEW.reorder_point > 0
+          AND COALESCE(NEW.stock, 0) <= NEW.reorder_point
+          AND COALESCE(OLD.stock, 0) > COALESCE(OLD.reorder_point, 0)
+          AND {REORDER_ALERTS_ENABLED};
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS trg_products_stock_alert_resolve
+    AFTER UPDATE OF stock, min_stock, reorder_point ON Products
+    WHEN COALESCE(NEW.stock, 0) > COALESCE(OLD.stock, 0)
+        OR NEW.min_stock IS NOT OLD.min_stock
+        OR NEW.reorder_point IS NOT OLD.reorder_point
+    BEGIN
+        UPDATE StockAlerts SET resolved_at = CURRENT_TIMESTAMP
+        WHERE product_id = NEW.id AND variant_id IS NULL AND resolved_at IS NULL
+          AND COALESCE(NEW.stock, 0) > CASE alert_type
+              WHEN 'low_stock' THEN COALESCE(NEW.min_stock, 0)
+              ELSE COALESCE(NEW.reorder_point, 0)
+          END;
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS trg_variants_stock_alert
+    AFTER UPDATE OF stock ON ProductVariants
+    WHEN COALESCE(NEW.stock, 0) < COALESCE(OLD.stock, 0)
+    BEGIN
+        INSERT INTO StockAlerts (product_id, variant_id, alert_type, stock, threshold)
+        SELECT NEW.product_id, NEW.id, 'low_stock', COALESCE(NEW.stock, 0), COALESCE(p.min_stock, 0)
+        FROM Products p
+        WHERE p.id = NEW.product_id
+          AND COALESCE(NEW.stock, 0) <= COALESCE(p.min_stock, 0)
+          AND COALESCE(OLD.stock, 0) > COALESCE(p.min_stock, 0)
+          AND {LOW_STOCK_ALERTS_ENABLED};
+        INSERT INTO StockAlerts (product_id, variant_id, alert_type, stock, threshold)
+        SELECT NEW.product_id, NEW.id, 'reorder', COALESCE(NEW.stock, 0), p.reorder_point
+        FROM Products p
+        WHERE p.id = NEW.product_id
+          AND p.reorder_point > 0
+          AND COALESCE(NEW.stock, 0) <= p.reorder_point
+          AND COALESCE(OLD.stock, 0) > p.reorder_point
+          AND {REORDER_ALERTS_ENABLED};
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS trg_variants_stock_alert_resolve
+    AFTER UPDATE OF stock ON ProductVariants
+    WHEN COALESCE(NEW.stock, 0) > COALESCE(OLD.stock, 0)
+    BEGIN
+        UPDATE StockAlerts SET resolved_at = CURRENT_TIMESTAMP
+        WHERE product_id = NEW.product_id AND variant_id = NEW.id AND resolved_at IS NULL
+          AND COALESCE(NEW.stock, 0) > (
+              SELECT CASE StockAlerts.alert_type
+                  WHEN 'low_stock' THEN COALESCE(min_stock, 0)
+                  ELSE COALESCE(reorder_point, 0)
+              END
+              FROM Products WHERE id = NEW.product_id
+          );
+    END
+    """,
+]
+
+
+def _add_stock_alerts(cursor):
+    """Create the stock alerts table and the threshold triggers.
+
+    Alerts are raised on crossings only, so rows already below a threshold
+    get their first alert the next time they cross it.
+    """
+    for statement in STOCK_ALERT_SCHEMA + STOCK_ALERT_INDEXES + STOCK_ALERT_TRIGGERS:
+        cursor.execute(statement)
+
+
+# Negative cost layers: units sold below zero, owed to the next receipts
+COST_SHORTFALL_INDEXES = [
+    """
+    CREATE INDEX IF NOT EXISTS idx_costlayers_short
+    ON StockCostLayers (product_id, variant_id, id)
+    WHERE quantity_remaining < 0
+    """,
+]
+
+
+def _add_cost_shortfalls(cursor):
+    """Record the cost of outgoing movements and realign the layers with the stock.
+
+    Stock sold below zero used to leave no layer behind, so the next receipts
+    kept their whole quantity open. Rows whose open layers exceed the stock
+    give the excess back from their oldest layers, rows below zero get a
+    negative layer at the purchase price, and rows with stock no layer covers
+    get one at the purchase price.
+    """
+    _add_column(cursor, 'StockMovements', 'cost_amount', 'REAL')
+    for statement in COST_SHORTFALL_INDEXES:
+        cursor.execute(statement)
+
+    cursor.execute("""
+        SELECT p.id, NULL, COALESCE(p.stock, 0), COALESCE(p.purchase_price, 0),
+               (SELECT COALESCE(SUM(l.quantity_remaining), 0) FROM StockCostLayers l
+                WHERE l.product_id = p.id AND l.variant_id IS NULL AND l.quantity_remaining > 0)
+        FROM Products p
+        UNION ALL
+        SELECT pv.product_id, pv.id, COALESCE(pv.stock, 0), COALESCE(pv.purchase_price, p.purchase_price, 0),
+               (SELECT COALESCE(SUM(l.quantity_remaining), 0) FROM StockCostLayers l
+                WHERE l.product_id = pv.product_id AND l.variant_id = pv.id AND l.quantity_remaining > 0)
+        FROM ProductVariants pv
+        JOIN Products p ON p.id = pv.product_id
+    """)
+    rows = [row for row in cursor.fetchall() if row[4] != max(row[2], 0) or row[2] < 0]
+    for product_id, variant_id, stock, unit_cost, layered in rows:
+        excess = layered - max(stock, 0)
+        missing = [-excess] if excess < 0 else []
+        if stock < 0:
+            missing.append(stock)
+        if excess > 0:
+            cursor.execute("""
+                SELECT id, quantity_remaining FROM StockCostLayers
+                WHERE product_id = ? AND variant_id IS ? AND quantity_remaining > 0
+                ORDER BY id
+            """, (product_id, variant_id))
+            updates = []
+            for layer_id, available in cursor.fetchall():
+                taken = min(available, excess)
+                updates.append((available - taken, layer_id))
+                excess -= taken
+                if excess <= 0:
+                    break
+            cursor.executemany("UPDATE StockCostLayers SET quantity_remaining = ? WHERE id = ?", updates)
+        cursor.executemany("""
+            INSERT INTO StockCostLayers (product_id, variant_id, unit_cost, quantity_received, quantity_remaining)
+            VALUES (?, ?, ?, ?, ?)
+        """, [(product_id, variant_id, unit_cost, quantity, quantity) for quantity in missing])
+
+
+# Every index the steps below create, checked at start-up by missing_indexes
+INDEXES = (
+    LOOKUP_INDEXES + BARCODE_INDEXES + VARIANT_COMBINATION_INDEXES + EFFECTIVE_PRICE_INDEXES
+    + PRODUCT_LISTING_INDEXES + COST_LAYER_INDEXES + STOCK_LEDGER_INDEXES + STOCK_TAKE_INDEXES
+    + MOVEMENT_HISTORY_INDEXES + STOCK_ALERT_INDEXES + COST_SHORTFALL_INDEXES
+)
+
+
+# Ordered migration steps: (version, name, function(cursor)).
+# Append new steps at the end; never renumber or edit an applied step.
+MIGRATIONS = [
+    (1, 'base_schema', _create_base_schema),
+    (2, 'legacy_columns', _add_missing_columns),
+    (3, 'seed_defaults', _seed_defaults),
+    (4, 'lookup_indexes', _add_lookup_indexes),
+    (5, 'barcode_indexes', _add_barcode_indexes),
+    (6, 'product_search', _create_product_search),
+    (7, 'variant_combination_index', _add_variant_combination_index),
+    (8, 'variant_effective_price', _add_effective_price),
+    (9, 'dynamic_variants', _add_dynamic_variants),
+    (10, 'variant_combination_key', _add_combination_key),
+    (11, 'variant_display_name', _add_variant_display_name),
+    (12, 'product_listing_indexes', _add_product_listing_indexes),
+    (13, 'stock_cost_layers', _add_cost_layers),
+    (14, 'stock_ledger', _add_stock_ledger),
+    (15, 'stock_takes', _add_stock_takes),
+    (16, 'movement_history_indexes', _add_movement_history_indexes),
+    (17, 'stock_alerts', _add_stock_alerts),
+    (18, 'stock_cost_shortfalls', _add_cost_shortfalls),
+]
+
+
+class MigrationManager:
+    """Applies the ordered MIGRATIONS once and records them in schema_version."""
+
+    @staticmethod
+    def latest_version():
+        return MIGRATIONS[-1][0] if MIGRATIONS else 0
+
+    @staticmethod
+    def current_version(cursor):
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS schema_version (
+                version INTEGER PRIMARY KEY,
+                name TEXT NOT NULL,
+                applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        cursor.execute("SELECT COALESCE(MAX(version), 0) FROM schema_version")
+        return cursor.fetchone()[0]
+
+    @staticmethod
+    def missing_indexes():
+        """Return the names of declared INDEXES that do not exist in the database."""
+        conn = get_connection()
+        if not conn:
+            return []
+        try:
+            cursor = conn.cursor()
+            cursor.execute("SELECT name FROM sqlite_master WHERE type = 'index'")
+            existing = {row[0] for row in cursor.fetchall()}
+            names = [re.search(r"INDEX IF NOT EXISTS (\w+)", statement).group(1) for statement in INDEXES]
+            return [name for name in names if name not in existing]
+        finally:
+            conn.close()
+
+    @staticmethod
+    def migrate():
+        """Apply pending migrations. Returns True when the schema is up to date."""
+        conn = get_connection()
+        if not conn:
+            print("Failed to connect to the database. Migration aborted.")
+            return False
+
+        try:
+            cursor = conn.cursor()
+            if MigrationManager.current_version(cursor) >= MigrationManager.latest_version():
+                return True
+
+            applied = False
+            for version, name, apply in MIGRATIONS:
+                # Each step runs in its own write transaction; re-check the
+                # version inside it in case another instance got there first
+                cursor.execute("BEGIN IMMEDIATE")
+                try:
+                    if MigrationManager.current_version(cursor) >= version:
+                        cursor.execute("ROLLBACK")
+                        continue
+                    apply(cursor)
+                    cursor.execute(
+                        "INSERT INTO schema_version (version, name) VALUES (?, ?)",
+                        (version, name)
+                    )
+                    cursor.execute("COMMIT")
+                    applied = True
+                    print(f"✅ Migration {version} ({name}) appliquée.")
+                except Exception:
+                    cursor.execute("ROLLBACK")
+                    raise
+            if applied:
+                # Planner statistics for the new indexes, once per run
+                cursor.execute("ANALYZE")
+            return True
+        except sqlite3.Error as e:
+            print(f"❌ Erreur lors de la migration de la base de données : {e}")
+            return False
+        finally:
+            conn.close()
@@ -0,0 +1,396 @@
+from database import get_connection
+from models.records import fetch_records, fetch_record
+from functools import lru_cache
+import json
+import threading
+
+PRODUCT_QUERY = """
+    SELECT
+        p.id,
+        p.name,
+        p.barcode,
+        COALESCE(p.unit_price, 0) as unit_price,
+        COALESCE(p.stock, 0) as stock,
+        p.image_path,
+        p.category_id,
+        p.has_variants,
+        p.variant_attributes,
+        COALESCE(p.dynamic_variants, 0) as dynamic_variants,
+        COALESCE(c.name, 'Non catégorisé') as category_name,
+        p.description,
+        COALESCE(p.purchase_price, 0) as purchase_price,
+        COALESCE(p.min_stock, 0) as min_stock,
+        p.unit,
+        p.weight,
+        p.volume,
+        COALESCE(p.status, 'available') as status,
+        COALESCE(p.product_type, 'stockable') as product_type,
+        COALESCE(p.valuation_method, 'FIFO') as valuation_method
+    FROM Products p
+    LEFT JOIN Categories c ON p.category_id = c.id
+"""
+
+# Status of the products deleted after they were sold or moved in stock: the
+# row is kept for the sales and the stock ledger, hidden from the till and
+# the product lists
+ARCHIVED_STATUS = 'archived'
+ACTIVE_PRODUCT_CONDITION = f"COALESCE(p.status, 'available') <> '{ARCHIVED_STATUS}'"
+
+# Catalog columns with few distinct values, shared between product records
+SHARED_PRODUCT_COLUMNS = ('category_name', 'unit', 'status', 'product_type', 'valuation_method')
+
+
+@lru_cache(maxsize=8192)
+def _decode_json(text):
+    try:
+        value = json.loads(text)
+    except (TypeError, ValueError):
+        return None
+    # Frozen so the cached value cannot be mutated through a caller's copy
+    if isinstance(value, dict):
+        return dict, tuple(value.items())
+    if isinstance(value, list):
+        return list, tuple(value)
+    return None
+
+
+def parse_json_attributes(value):
+    """Decode variant_attributes / attribute_values JSON, once per distinct text.
+
+    Returns a new dict (attribute values) or list (attribute names), the
+    value itself if it is already decoded, or None for empty or invalid text.
+    """
+    if isinstance(value, (dict, list)):
+        return value
+    if not value or not isinstance(value, str):
+        return None
+    decoded = _decode_json(value)
+    if decoded is None:
+        return None
+    kind, items = decoded
+    return kind(items)
+
+
+class ProductCatalog:
+    """Process-wide in-memory copy of the sellable catalog.
+
+    Products, variants (through Product.fetch_variants) and category names are
+    loaded once, then kept current by the model layer: Product, Category and
+    CheckoutService call the refresh/remove/adjust hooks below after they
+    commit. The hooks are no-ops until the catalog has been loaded.
+
+    Products and variants are compact records (see models.records) that read
+    like dicts. Products returned by the catalog are shared and must be
+    treated as read-only; variants are returned as copies because callers
+    annotate them.
+    """
+    _lock = threading.RLock()
+    _loaded = False
+
+    _products = {}             # product id -> product dict
+    _by_category = {}          # category id -> set of product ids
+    _sorted = {}               # category id (None = all) -> products sorted by name
+    _variants = {}             # variant id -> variant dict
+    _variants_by_product = {}  # product id -> [variant id, ...]
+    _barcodes = {}             # barcode -> (product id, variant id or None)
+    _categories = {}           # category id -> name
+
+    # ------------------------------------------------------------------
+    # Loading
+
+    @staticmethod
+    def _product_record(product):
+        if product.get('variant_attributes'):
+            product['variant_attributes'] = parse_json_attributes(product['variant_attributes'])
+        return product
+
+    @classmethod
+    def load(cls):
+        """(Re)load the whole catalog with a handful of set-based queries."""
+        from models.product import Product
+
+        conn = get_connection()
+        if conn:
+            try:
+                cursor = conn.cursor()
+                cursor.execute(PRODUCT_QUERY + " WHERE " + ACTIVE_PRODUCT_CONDITION)
+                products = [cls._product_record(row) for row in fetch_records(cursor, 'ProductRow', SHARED_PRODUCT_COLUMNS)]
+                variants = Product.fetch_variants(cursor)
+                cursor.execute("SELECT id, name FROM Categories")
+                categories = {row['id']: row['name'] for row in cursor.fetchall()}
+            except Exception as e:
+                print(f"Error loading product catalog: {e}")
+                return False
+            finally:
+                conn.close()
+
+            with cls._lock:
+                cls._products = {}
+                cls._by_category = {}
+                cls._sorted = {}
+                cls._variants = {}
+                cls._variants_by_product = {}
+                cls._barcodes = {}
+                cls._categories = categories
+                for product in products:
+                    cls._index_product(product)
+                for variant in variants:
+                    if variant['product_id'] in cls._products:
+                        cls._index_variant(variant)
+                cls._loaded = True
+            return True
+        return False
+
+    @classmethod
+    def ensure_loaded(cls):
+        with cls._lock:
+            if cls._loaded:
+                return True
+            return cls.load()
+
+    @classmethod
+    def is_loaded(cls):
+        return cls._loaded
+
+    @classmethod
+    def invalidate(cls):
+        """Forget everything; the next lookup reloads from the database."""
+        with cls._lock:
+            cls._loaded = False
+            cls._products = {}
+            cls._by_category = {}
+            cls._sorted = {}
+            cls._variants = {}
+            cls._variants_by_product = {}
+            cls._barcodes = {}
+            cls._categories = {}
+
+    # ------------------------------------------------------------------
+    # Index maintenance (caller holds the lock)
+
+    @classmethod
+    def _index_product(cls, product):
+        cls._products[product['id']] = product
+        cls._by_category.setdefault(product['category_id'], set()).add(product['id'])
+        if product.get('barcode'):
+            cls._barcodes[product['barcode']] = (product['id'], None)
+        cls._sorted.pop(product['category_id'], None)
+        cls._sorted.pop(None, None)
+
+    @classmethod
+    def _unindex_product(cls, product_id):
+        product = cls._products.pop(product_id, None)
+        if product is None:
+            return None
+        ids = cls._by_category.get(product['category_id'])
+        if ids is not None:
+            ids.discard(product_id)
+        if product.get('barcode') and cls._barcodes.get(product['barcode']) == (product_id, None):
+            del cls._barcodes[product['barcode']]
+        cls._sorted.pop(product['category_id'], None)
+        cls._sorted.pop(None, None)
+        return product
+
+    @classmethod
+    def _index_variant(cls, variant):
+        cls._variants[variant['id']] = variant
+        ids = cls._variants_by_product.setdefault(variant['product_id'], [])
+        if variant['id'] not in ids:
+            ids.append(variant['id'])
+            ids.sort()
+        if variant.get('barcode'):
+            cls._barcodes[variant['barcode']] = (variant['product_id'], variant['id'])
+
+    @classmethod
+    def _unindex_variant(cls, variant_id):
+        variant = cls._variants.pop(variant_id, None)
+        if variant is None:
+            return None
+        ids = cls._variants_by_product.get(variant['product_id'])
+        if ids and variant_id in ids:
+            ids.remove(variant_id)
+        if variant.get('barcode') and cls._barcodes.get(variant['barcode']) == (variant['product_id'], variant_id):
+            del cls._barcodes[variant['barcode']]
+        return variant
+
+    # ------------------------------------------------------------------
+    # Lookups
+
+    @classmethod
+    def products_in_category(cls, category_id=None):
+        """Products of a category (all products for None), sorted by name."""
+        with cls._lock:
+            if not cls.ensure_loaded():
+                return []
+            products = cls._sorted.get(category_id)
+            if products is None:
+                if category_id is None:
+                    products = list(cls._products.values())
+                else:
+                    products = [cls._products[i] for i in cls._by_category.get(category_id, ())]
+                products.sort(key=lambda p: p['name'] or '')
+                cls._sorted[category_id] = products
+            return list(products)
+
+    @classmethod
+    def get_product(cls, product_id):
+        with cls._lock:
+            if not cls.ensure_loaded():
+                return None
+            return cls._products.get(product_id)
+
+    @classmethod
+    def get_variants(cls, product_id):
+        with cls._lock:
+            if not cls.ensure_loaded():
+                return []
+            return [cls._variants[i].copy() for i in cls._variants_by_product.get(product_id, ())]
+
+    @classmethod
+    def get_variant(cls, variant_id):
+        with cls._lock:
+            if not cls.ensure_loaded():
+                return None
+            variant = cls._variants.get(variant_id)
+            return variant.copy() if variant is not None else None
+
+    @classmethod
+    def find_by_barcode(cls, barcode):
+        """Return (product, variant) for a barcode; variant is None for a product code."""
+        with cls._lock:
+            if not barcode or not cls.ensure_loaded():
+                return None, None
+            match = cls._barcodes.get(barcode)
+            if match is None:
+                return None, None
+            product_id, variant_id = match
+            variant = cls._variants.get(variant_id) if variant_id is not None else None
+            return cls._products.get(product_id), variant.copy() if variant is not None else None
+
+    @classmethod
+    def category_name(cls, category_id):
+        with cls._lock:
+            if not cls.ensure_loaded():
+                return None
+            return cls._categories.get(category_id)
+
+    # ------------------------------------------------------------------
+    # Incremental updates from the model layer
+
+    @classmethod
+    def _fetch(cls, conn, callback):
+        own = conn is None
+        if own:
+            conn = get_connection()
+            if not conn:
+                return False
+        try:
+            callback(conn.cursor())
+            return True
+        except Exception as e:
+            print(f"Error refreshing product catalog: {e}")
+            cls.invalidate()
+            return False
+        finally:
+            if own:
+                conn.close()
+
+    @classmethod
+    def refresh_product(cls, product_id, conn=None):
+        """Reload one product and its variants."""
+        if not cls._loaded:
+            return
+        from models.product import Product
+
+        def reload(cursor):
+            cursor.execute(PRODUCT_QUERY + " WHERE p.id = ? AND " + ACTIVE_PRODUCT_CONDITION, (product_id,))
+            row = fetch_record(cursor, 'ProductRow')
+            variants = Product.fetch_variants(cursor, product_ids=[product_id])
+            with cls._lock:
+                cls._unindex_product(product_id)
+                for variant_id in list(cls._variants_by_product.pop(product_id, ())):
+                    cls._unindex_variant(variant_id)
+                if row is None:
+                    return
+                product = cls._product_record(row)
+                cls._index_product(product)
+                for variant in variants:
+                    cls._index_variant(variant)
+
+        cls._fetch(conn, reload)
+
+    @classmethod
+    def remove_product(cls, product_id):
+        if not cls._loaded:
+            return
+        with cls._lock:
+            cls._unindex_product(product_id)
+            for variant_id in list(cls._variants_by_product.pop(product_id, ())):
+                cls._unindex_variant(variant_id)
+
+    @classmethod
+    def refresh_variant(cls, variant_id, conn=None):
+        """Reload one variant (after it was added or edited)."""
+        if not cls._loaded:
+            return
+        from models.product import Product
+
+        def reload(cursor):
+            variants = Product.fetch_variants(cursor, variant_ids=[variant_id])
+            with cls._lock:
+                cls._unindex_variant(variant_id)
+                for variant in variants:
+                    if variant['product_id'] in cls._products:
+                        cls._index_variant(variant)
+
+        cls._fetch(conn, reload)
+
+    @classmethod
+    def refresh_attribute_line(cls, line_id, conn=None):
+        """Reload the product owning a template attribute line (price extras changed)."""
+        if not cls._loaded:
+            return
+
+        def reload(cursor):
+            cursor.execute("SELECT product_id FROM ProductTemplateAttributeLine WHERE id = ?", (line_id,))
+            row = cursor.fetchone()
+            if row is not None:
+                cls.refresh_product(row['product_id'], cursor.connection)
+
+        cls._fetch(conn, reload)
+
+    @classmethod
+    def remove_variant(cls, variant_id):
+        if not cls._loaded:
+            return
+        with cls._lock:
+            cls._unindex_variant(variant_id)
+
+    @classmethod
+    def adjust_stock(cls, product_id, variant_id, delta):
+        """Apply a committed stock change of ``delta`` units."""
+        if not cls._loaded:
+            return
+        with cls._lock:
+            if variant_id:
+                target = cls._variants.get(variant_id)
+            else:
+                target = cls._products.get(product_id)
+            if target is not None:
+                target['stock'] = (target.get('stock') or 0) + delta
+
+    @classmethod
+    def reload_categories(cls, conn=None):
+        """Reload category names after a category was added or renamed."""
+        if not cls._loaded:
+            return
+
+        def reload(cursor):
+            cursor.execute("SELECT id, name FROM Categories")
+            categories = {row['id']: row['name'] for row in cursor.fetchall()}
+            with cls._lock:
+                cls._categories = categories
+                for product in cls._products.values():
+                    product['category_name'] = categories.get(product['category_id'], 'Non catégorisé')
+
+        cls._fetch(conn, reload)
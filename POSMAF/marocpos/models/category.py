@@ -1,4 +1,5 @@
 from database import get_connection
+from models.catalog import ProductCatalog
 
 class Category:
     def __init__(self, id=None, name=None, description=None):
@@ -36,6 +37,7 @@ class Category:
                     VALUES (?, ?)
                 """, (name, description))
                 conn.commit()
+                ProductCatalog.reload_categories(conn)
                 return cursor.lastrowid
             except Exception as e:
                 print(f"Error adding category: {e}")
@@ -56,6 +58,7 @@ class Category:
                     WHERE id = ?
                 """, (name, description, category_id))
                 conn.commit()
+                ProductCatalog.reload_categories(conn)
                 return True
             except Exception as e:
                 print(f"Error updating category: {e}")
@@ -87,6 +90,7 @@ class Category:
                     """, (category_id,))
                     
                     cursor.execute("COMMIT")
+                    ProductCatalog.invalidate()
                     return True
                 except Exception as e:
                     cursor.execute("ROLLBACK")
@@ -115,6 +119,7 @@ class Category:
                     cursor.execute("DELETE FROM sqlite_sequence WHERE name='Categories'")
                     
                     cursor.execute("COMMIT")
+                    ProductCatalog.invalidate()
                     return True
                 except Exception as e:
                     cursor.execute("ROLLBACK")
@@ -145,26 +150,3 @@ class Category:
             finally:
                 conn.close()
         return None
-
-    @staticmethod
-    def initialize_database():
-        conn = get_connection()
-        if conn:
-            try:
-                cursor = conn.cursor()
-                # Create Categories table if it doesn't exist
-                cursor.execute("""
-                    CREATE TABLE IF NOT EXISTS Categories (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        name TEXT NOT NULL UNIQUE,
-                        description TEXT
-                    )
-                """)
-                conn.commit()
-                return True
-            except Exception as e:
-                print(f"Error initializing Categories table: {e}")
-                return False
-            finally:
-                conn.close()
-        return False
\ No newline at end of file
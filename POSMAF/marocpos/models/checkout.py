@@ -0,0 +1,183 @@
+from database import get_connection
+from models.catalog import ProductCatalog
+from models.stock_ledger import StockLedger
+from models.product_attribute import ProductAttribute
+from datetime import datetime
+
+
+class CheckoutService:
+    """Records a complete sale in a single write transaction.
+
+    The sale header, its lines, its payments and the stock movements are
+    written on one connection and committed together, so a failure at any
+    step leaves no partial sale behind. Each line appends an 'out' movement
+    to the stock ledger, which consumes the stock cost layers it sells
+    from; that cost of goods is recorded on its SaleItems row.
+    """
+
+    @staticmethod
+    def merge_stock_updates(items):
+        """Sum the quantities of lines that hit the same stock row.
+
+        Returns two lists of (quantity, id) tuples, one for variants and one
+        for products.
+        """
+        variants = {}
+        products = {}
+        for item in items:
+            if item.get('variant_id'):
+                variants[item['variant_id']] = variants.get(item['variant_id'], 0) + item['quantity']
+            else:
+                products[item['product_id']] = products.get(item['product_id'], 0) + item['quantity']
+        return (
+            [(quantity, variant_id) for variant_id, quantity in variants.items()],
+            [(quantity, product_id) for product_id, quantity in products.items()],
+        )
+
+    @staticmethod
+    def checkout(user_id, items, payments=None, payment_method=None, discount=0, tax_rate=0, created_at=None):
+        """Create a sale with its items, payments and stock updates.
+
+        ``items`` are dicts with product_id, quantity, unit_price and an
+        optional variant_id (product_name is used to resolve a missing
+        product_id). Lines of dynamic variants products may carry
+        template_value_ids instead of a variant_id; the variant row is
+        created in the same transaction the first time it is sold. ``payments`` are dicts with method_id, amount and
+        optional method_name, reference and notes.
+
+        Returns the new sale id, or None if nothing was recorded.
+        """
+        if not items:
+            return None
+        payments = payments or []
+
+        if payment_method is None:
+            if len(payments) > 1:
+                payment_method = "MULTIPLE"
+            elif payments:
+                payment_method = payments[0].get('method_name') or 'CASH'
+            else:
+                payment_method = 'CASH'
+
+        if created_at is None:
+            created_at = datetime.now()
+        if isinstance(created_at, datetime):
+            created_at = created_at.strftime("%Y-%m-%d %H:%M:%S")
+
+        conn = get_connection()
+        if conn:
+            try:
+                cursor = conn.cursor()
+                # Take the write lock up front instead of upgrading mid-sale
+                cursor.execute("BEGIN IMMEDIATE")
+
+                lines = []
+                created_variants = set()
+                for item in items:
+                    product_id = item.get('product_id')
+                    if not product_id:
+                        cursor.execute("SELECT id FROM Products WHERE name = ?", (item['product_name'],))
+                        row = cursor.fetchone()
+                        if not row:
+                            raise ValueError(f"Produit introuvable: {item['product_name']}")
+                        product_id = row[0]
+                    variant_id = item.get('variant_id') or None
+                    if variant_id is None and item.get('template_value_ids'):
+                        variant_id, created = ProductAttribute.ensure_variant(
+                            cursor, product_id, item['template_value_ids']
+                        )
+                        if created:
+                            created_variants.add(variant_id)
+                    lines.append({
+                        'product_id': product_id,
+                        'variant_id': variant_id,
+                        'quantity': item['quantity'],
+                        'unit_price': item['unit_price'],
+                    })
+
+                # Calculate totals
+                subtotal = sum(line['quantity'] * line['unit_price'] for line in lines)
+                tax_amount = subtotal * (tax_rate / 100)
+                final_total = subtotal + tax_amount - discount
+
+                # Create sale record
+                cursor.execute("""
+                    INSERT INTO Sales (
+                        created_at, user_id, total_amount,
+                        discount, tax_amount, final_total,
+                        payment_method, payment_status
+                    ) VALUES (?, ?, ?, ?, ?, ?, ?, 'COMPLETED')
+                """, (
+                    created_at, user_id, subtotal,
+                    discount, tax_amount, final_total,
+                    payment_method
+                ))
+                sale_id = cursor.lastrowid
+
+                # One ledger movement per line; moves the stock and returns the line's cost
+                movements = StockLedger.record_many(cursor, [
+                    {
+                        'product_id': line['product_id'],
+                        'variant_id': line['variant_id'],
+                        'quantity': -line['quantity'],
+                        'movement_type': 'out',
+                        'reference': f"Vente #{sale_id}",
+                        'user_id': user_id,
+                        'sale_id': sale_id,
+                    }
+                    for line in lines
+                ])
+                for line, (_, cost) in zip(lines, movements):
+                    line['cost_amount'] = cost
+
+                # Add sale items
+                cursor.executemany("""
+                    INSERT INTO SaleItems (
+                        sale_id, product_id, variant_id,
+                        quantity, unit_price, subtotal, cost_amount
+                    ) VALUES (?, ?, ?, ?, ?, ?, ?)
+                """, [
+                    (
+                        sale_id, line['product_id'], line['variant_id'],
+                        line['quantity'], line['unit_price'],
+                        line['quantity'] * line['unit_price'],
+                        line['cost_amount']
+                    )
+                    for line in lines
+                ])
+
+                # Add payment records
+                if payments:
+                    cursor.executemany("""
+                        INSERT INTO SalePayments (
+                            sale_id, payment_method_id, amount,
+                            reference_number, approved, notes,
+                            created_at
+                        ) VALUES (?, ?, ?, ?, 1, ?, ?)
+                    """, [
+                        (
+                            sale_id, payment['method_id'], payment['amount'],
+                            payment.get('reference', ''), payment.get('notes', ''),
+                            created_at
+                        )
+                        for payment in payments
+                    ])
+
+                conn.commit()
+                variant_updates, product_updates = CheckoutService.merge_stock_updates(lines)
+                for variant_id in created_variants:
+                    ProductCatalog.refresh_variant(variant_id, conn)
+                for quantity, variant_id in variant_updates:
+                    if variant_id not in created_variants:
+                        ProductCatalog.adjust_stock(None, variant_id, -quantity)
+                for quantity, product_id in product_updates:
+                    ProductCatalog.adjust_stock(product_id, None, -quantity)
+                return sale_id
+
+            except Exception as e:
+                conn.rollback()
+                print(f"Error creating sale: {e}")
+                return None
+            finally:
+                conn.close()
+        return None
@@ -0,0 +1,246 @@
+from database import get_read_connection
+
+# Valuation methods that keep one weighted-average layer per stock row;
+# any other method (the default 'FIFO') consumes layers oldest first
+AVERAGE_COST_METHODS = ('AVCO', 'AVERAGE', 'CUMP')
+
+# Cost of the units still in stock, per product (variant_id NULL) or variant.
+# The quantity_remaining > 0 condition matches the partial index
+# idx_costlayers_open, so only open layers are read.
+OPEN_LAYER_VALUE_SQL = """
+    SELECT product_id, variant_id,
+           SUM(quantity_remaining) as quantity,
+           SUM(quantity_remaining * unit_cost) as value
+    FROM StockCostLayers
+    WHERE quantity_remaining > 0
+    GROUP BY product_id, variant_id
+"""
+
+
+class CostLayers:
+    """Cost layers behind stock valuation and the cost of goods sold.
+
+    Every unit in stock belongs to a layer of StockCostLayers: a quantity
+    received at one unit cost. Incoming stock opens a layer (for average-cost
+    products it is merged into the single open layer at the weighted average
+    cost); outgoing stock consumes open layers oldest first and returns what
+    they cost. Layers are never replayed: consuming reads only the open
+    layers it needs and the valuation sums the open layers.
+
+    Stock sold below zero opens a negative layer for the missing units,
+    costed at the purchase price; the next receipts fill it before opening
+    a layer of their own, so the open layers always add up to the stock.
+
+    The cursor methods are called by StockLedger for every movement, inside
+    the caller's write transaction, so layer changes commit or roll back with
+    the stock change that caused them.
+    """
+
+    @staticmethod
+    def _cost_settings(cursor, product_id, variant_id=None):
+        """(default unit cost, valuation method) of a stock row"""
+        if variant_id:
+            cursor.execute("""
+                SELECT COALESCE(pv.purchase_price, p.purchase_price, 0),
+                       UPPER(COALESCE(p.valuation_method, 'FIFO'))
+                FROM ProductVariants pv
+                JOIN Products p ON p.id = pv.product_id
+                WHERE pv.id = ?
+            """, (variant_id,))
+        else:
+            cursor.execute("""
+                SELECT COALESCE(purchase_price, 0), UPPER(COALESCE(valuation_method, 'FIFO'))
+                FROM Products WHERE id = ?
+            """, (product_id,))
+        row = cursor.fetchone()
+        return (row[0], row[1]) if row else (0, 'FIFO')
+
+    @staticmethod
+    def _open_layers(cursor, product_id, variant_id):
+        cursor.execute("""
+            SELECT id, quantity_remaining, unit_cost
+            FROM StockCostLayers
+            WHERE product_id = ? AND variant_id IS ? AND quantity_remaining > 0
+            ORDER BY id
+        """, (product_id, variant_id or None))
+        return cursor
+
+    @staticmethod
+    def _short_layers(cursor, product_id, variant_id):
+        cursor.execute("""
+            SELECT id, quantity_remaining
+            FROM StockCostLayers
+            WHERE product_id = ? AND variant_id IS ? AND quantity_remaining < 0
+            ORDER BY id
+        """, (product_id, variant_id or None))
+        return cursor
+
+    @staticmethod
+    def receive(cursor, product_id, variant_id, quantity, unit_cost=None, movement_id=None):
+        """Put ``quantity`` units in stock at ``unit_cost`` per unit.
+
+        A missing cost uses the purchase price of the variant or product.
+        The units first fill the negative layers left by stock sold below
+        zero. Returns the id of the layer holding the rest, or None.
+        """
+        if quantity <= 0:
+            return None
+        variant_id = variant_id or None
+        default_cost, method = CostLayers._cost_settings(cursor, product_id, variant_id)
+        if unit_cost is None:
+            unit_cost = default_cost
+
+        filled = []
+        for layer_id, missing in CostLayers._short_layers(cursor, product_id, variant_id).fetchall():
+            taken = min(-missing, quantity)
+            filled.append((missing + taken, layer_id))
+            quantity -= taken
+            if quantity <= 0:
+                break
+        if filled:
+            cursor.executemany(
+                "UPDATE StockCostLayers SET quantity_remaining = ? WHERE id = ?",
+                filled
+            )
+        if quantity <= 0:
+            return None
+
+        if method in AVERAGE_COST_METHODS:
+            layers = CostLayers._open_layers(cursor, product_id, variant_id).fetchall()
+            if layers:
+                # Fold everything into the oldest layer at the weighted average
+                total_quantity = quantity + sum(layer[1] for layer in layers)
+                total_value = quantity * unit_cost + sum(layer[1] * layer[2] for layer in layers)
+                layer_id = layers[0][0]
+                cursor.execute("""
+                    UPDATE StockCostLayers
+                    SET quantity_received = quantity_received + ?,
+                        quantity_remaining = ?,
+                        unit_cost = ?
+                    WHERE id = ?
+                """, (quantity, total_quantity, total_value / total_quantity, layer_id))
+                if len(layers) > 1:
+                    cursor.executemany(
+                        "UPDATE StockCostLayers SET quantity_remaining = 0 WHERE id = ?",
+                        [(layer[0],) for layer in layers[1:]]
+                    )
+                return layer_id
+
+        cursor.execute("""
+            INSERT INTO StockCostLayers (
+                product_id, variant_id, movement_id, unit_cost,
+                quantity_received, quantity_remaining
+            ) VALUES (?, ?, ?, ?, ?, ?)
+        """, (product_id, variant_id, movement_id, unit_cost, quantity, quantity))
+        return cursor.lastrowid
+
+    @staticmethod
+    def consume(cursor, product_id, variant_id, quantity, movement_id=None):
+        """Take ``quantity`` units out of stock, oldest layer first.
+
+        Returns the cost of the units taken. Units no layer covers (stock
+        sold below zero) are costed at the purchase price and owed by a
+        negative layer.
+        """
+        if quantity <= 0:
+            return 0.0
+        variant_id = variant_id or None
+        remaining = quantity
+        cost = 0.0
+        updates = []
+        for layer_id, available, unit_cost in CostLayers._open_layers(cursor, product_id, variant_id):
+            taken = min(available, remaining)
+            cost += taken * unit_cost
+            updates.append((available - taken, layer_id))
+            remaining -= taken
+            if remaining <= 0:
+                break
+        if updates:
+            cursor.executemany(
+                "UPDATE StockCostLayers SET quantity_remaining = ? WHERE id = ?",
+                updates
+            )
+        if remaining > 0:
+            default_cost, _ = CostLayers._cost_settings(cursor, product_id, variant_id)
+            cost += remaining * default_cost
+            cursor.execute("""
+                INSERT INTO StockCostLayers (
+                    product_id, variant_id, movement_id, unit_cost,
+                    quantity_received, quantity_remaining
+                ) VALUES (?, ?, ?, ?, ?, ?)
+            """, (product_id, variant_id, movement_id, default_cost, -remaining, -remaining))
+        return cost
+
+    @staticmethod
+    def apply_movement(cursor, product_id, variant_id, quantity, unit_cost=None, movement_id=None):
+        """Apply a signed stock change; returns the cost of the units taken out"""
+        if quantity > 0:
+            CostLayers.receive(cursor, product_id, variant_id, quantity, unit_cost, movement_id)
+            return 0.0
+        return CostLayers.consume(cursor, product_id, variant_id, -quantity, movement_id)
+
+    @staticmethod
+    def revert_movement(cursor, movement_id, product_id, variant_id, quantity):
+        """Undo the layer changes of a stock movement that is being cancelled.
+
+        A receipt is taken back from the layer it opened first (whatever of it
+        is left), then from the oldest layers. An issue first cancels what its
+        own negative layer still owes; the other units are put back at the
+        cost the issue recorded (StockMovements.cost_amount), or at the
+        purchase price for movements recorded without one.
+        """
+        if quantity <= 0:
+            units = -quantity
+            cursor.execute("SELECT cost_amount FROM StockMovements WHERE id = ?", (movement_id,))
+            row = cursor.fetchone()
+            cost = row[0] if row else None
+            cursor.execute("""
+                SELECT id, quantity_remaining, unit_cost FROM StockCostLayers
+                WHERE movement_id = ? AND quantity_remaining < 0
+            """, (movement_id,))
+            layer = cursor.fetchone()
+            if layer is not None:
+                cancelled = min(-layer[1], units)
+                cursor.execute(
+                    "UPDATE StockCostLayers SET quantity_remaining = ? WHERE id = ?",
+                    (layer[1] + cancelled, layer[0])
+                )
+                units -= cancelled
+                if cost is not None:
+                    cost -= cancelled * layer[2]
+            if units > 0:
+                unit_cost = max(cost, 0) / units if cost is not None else None
+                CostLayers.receive(cursor, product_id, variant_id, units, unit_cost)
+            return
+        cursor.execute("""
+            SELECT id, quantity_remaining FROM StockCostLayers
+            WHERE movement_id = ? AND quantity_remaining > 0
+        """, (movement_id,))
+        layer = cursor.fetchone()
+        if layer is not None:
+            taken = min(layer[1], quantity)
+            cursor.execute(
+                "UPDATE StockCostLayers SET quantity_remaining = ? WHERE id = ?",
+                (layer[1] - taken, layer[0])
+            )
+            quantity -= taken
+        CostLayers.consume(cursor, product_id, variant_id, quantity)
+
+    @staticmethod
+    def get_valuation():
+        """Current cost of stock: {(product_id, variant_id): (quantity, value)}"""
+        conn = get_read_connection()
+        if conn:
+            try:
+                cursor = conn.cursor()
+                cursor.execute(OPEN_LAYER_VALUE_SQL)
+                return {
+                    (row['product_id'], row['variant_id']): (row['quantity'], row['value'])
+                    for row in cursor.fetchall()
+                }
+            except Exception as e:
+                print(f"Error getting stock valuation: {e}")
+                return {}
+            finally:
+                conn.close()
+        return {}
@@ -1,87 +1,10 @@
-from database import get_connection
+from database import get_connection, get_read_connection
 from datetime import datetime, UTC
 import json
 
 class Payment:
     """Model for managing payment methods and sales payments"""
     
-    @staticmethod
-    def create_tables():
-        """Create the payment-related tables"""
-        conn = get_connection()
-        if conn:
-            try:
-                cursor = conn.cursor()
-                
-                # Create PaymentMethods table for available payment types
-                cursor.execute("""
-                    CREATE TABLE IF NOT EXISTS PaymentMethods (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        name TEXT NOT NULL UNIQUE,
-                        description TEXT,
-                        active INTEGER DEFAULT 1,
-                        requires_reference INTEGER DEFAULT 0,
-                        requires_approval INTEGER DEFAULT 0,
-                        icon TEXT,
-                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                    )
-                """)
-                
-                # Create SalePayments table for multiple payments per sale
-                cursor.execute("""
-                    CREATE TABLE IF NOT EXISTS SalePayments (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        sale_id INTEGER NOT NULL,
-                        payment_method_id INTEGER NOT NULL,
-                        amount REAL NOT NULL,
-                        reference_number TEXT,
-                        approved INTEGER DEFAULT 1,
-                        notes TEXT,
-                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                        FOREIGN KEY (sale_id) REFERENCES Sales(id) ON DELETE CASCADE,
-                        FOREIGN KEY (payment_method_id) REFERENCES PaymentMethods(id)
-                    )
-                """)
-                
-                # Check if default payment methods exist, if not create them
-                cursor.execute("SELECT COUNT(*) FROM PaymentMethods")
-                if cursor.fetchone()[0] == 0:
-                    # Insert default payment methods
-                    default_methods = [
-                        ('CASH', 'Paiement en espèces', 1, 0, 0, 'cash.png'),
-                        ('CARD', 'Paiement par carte bancaire', 1, 1, 0, 'credit-card.png'),
-                        ('CHECK', 'Paiement par chèque', 1, 1, 1, 'check.png'),
-                        ('TRANSFER', 'Virement bancaire', 1, 1, 1, 'bank-transfer.png'),
-                        ('MOBILE', 'Paiement mobile', 1, 1, 0, 'mobile-payment.png'),
-                    ]
-                    
-                    try:
-                        # For Python 3.11+
-                        current_time = datetime.now(UTC).strftime("%Y-%m-%d %H:%M:%S")
-                    except AttributeError:
-                        # For older Python versions
-                        current_time = datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S")
-                    
-                    for method in default_methods:
-                        cursor.execute("""
-                            INSERT INTO PaymentMethods (
-                                name, description, active, 
-                                requires_reference, requires_approval, 
-                                icon, created_at, updated_at
-                            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-                        """, (*method, current_time, current_time))
-                
-                conn.commit()
-                print("✅ Payment tables created successfully")
-                return True
-            except Exception as e:
-                print(f"❌ Error creating payment tables: {e}")
-                return False
-            finally:
-                conn.close()
-        return False
-    
     @staticmethod
     def get_all_payment_methods(active_only=True):
         """Get all available payment methods"""
@@ -242,7 +165,7 @@ class Payment:
     @staticmethod
     def get_payment_summary(start_date=None, end_date=None):
         """Get a summary of payments by method for a date range"""
-        conn = get_connection()
+        conn = get_read_connection()
         if conn:
             try:
                 cursor = conn.cursor()
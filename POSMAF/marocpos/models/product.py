@@ -1,6 +1,12 @@
 from database import get_connection
+from models.catalog import ProductCatalog, parse_json_attributes, ARCHIVED_STATUS, ACTIVE_PRODUCT_CONDITION
+from models.product_attribute import ProductAttribute
+from models.stock_ledger import StockLedger
+from models.records import record_type, fetch_records
+from migrations import LOW_STOCK_CONDITION
 from datetime import datetime, UTC
 import json
+import re
 import sqlite3
 
 class Product:
@@ -11,74 +17,85 @@ class Product:
         self.stock = stock or 0  # Convert None to 0
         self.category_id = category_id
 
+    # Rows per page of the keyset product listing
+    PAGE_SIZE = 200
+    # Rows per page of a product's stock movement history
+    MOVEMENT_PAGE_SIZE = 100
+
+    LISTING_QUERY = """
+        SELECT
+            p.id,
+            p.name,
+            p.barcode,
+            COALESCE(p.unit_price, 0) as unit_price,
+            COALESCE(p.purchase_price, 0) as purchase_price,
+            COALESCE(p.stock, 0) as stock,
+            COALESCE(p.min_stock, 0) as min_stock,
+            p.category_id,
+            COALESCE(c.name, 'Non catégorisé') as category_name,
+            p.image_path,
+            p.has_variants,
+            p.variant_attributes,
+            p.description,
+            COALESCE(p.status, 'available') as status
+        FROM Products p
+        LEFT JOIN Categories c ON p.category_id = c.id
+    """
+
     @staticmethod
-    def create_tables():
+    def get_products_page(after=None, limit=PAGE_SIZE, category_id=None, status=None, low_stock=False):
+        """One page of products in (name, id) order, after a keyset cursor.
+
+        ``after`` is the (name, id) of the last product of the previous page,
+        or None for the first page. Filters: ``category_id``, ``status`` and
+        ``low_stock`` (stock at or below min_stock); archived products are
+        only listed when ``status`` asks for them. Each page is an index
+        range scan of ``limit`` rows, so its cost does not grow with the
+        catalogue.
+
+        Returns (products, next_cursor); next_cursor is None on the last page.
+        """
+        conditions = []
+        params = []
+        if category_id is not None:
+            conditions.append("p.category_id = ?")
+            params.append(category_id)
+        if status:
+            conditions.append("COALESCE(p.status, 'available') = ?")
+            params.append(status)
+        else:
+            conditions.append(ACTIVE_PRODUCT_CONDITION)
+        if low_stock:
+            # Same expression as the partial index idx_products_low_stock
+            conditions.append(LOW_STOCK_CONDITION)
+        if after is not None:
+            conditions.append("(p.name, p.id) > (?, ?)")
+            params.extend(after)
+
+        query = Product.LISTING_QUERY
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        # One extra row tells whether another page follows
+        query += " ORDER BY p.name, p.id LIMIT ?"
+        params.append(limit + 1)
+
         conn = get_connection()
         if conn:
             try:
                 cursor = conn.cursor()
-                
-                # Update Products table with variant support
-                cursor.execute("""
-                    CREATE TABLE IF NOT EXISTS Products (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        barcode TEXT,
-                        name TEXT NOT NULL,
-                        description TEXT,
-                        unit_price REAL DEFAULT 0,
-                        purchase_price REAL DEFAULT 0,
-                        profit_margin REAL,
-                        stock INTEGER DEFAULT 0,
-                        min_stock INTEGER DEFAULT 0,
-                        reorder_point INTEGER,
-                        image_path TEXT,
-                        category_id INTEGER,
-                        unit TEXT DEFAULT 'pièce',
-                        weight REAL,
-                        volume REAL,
-                        status TEXT DEFAULT 'available',
-                        product_type TEXT DEFAULT 'stockable',
-                        valuation_method TEXT DEFAULT 'FIFO',
-                        has_variants BOOLEAN DEFAULT 0,
-                        variant_attributes TEXT,
-                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                        FOREIGN KEY (category_id) REFERENCES Categories(id)
-                    )
-                """)
-                
-                # Create ProductVariants table
-                cursor.execute("""
-                    CREATE TABLE IF NOT EXISTS ProductVariants (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        product_id INTEGER,
-                        attribute_values TEXT,
-                        price_adjustment REAL DEFAULT 0,
-                        stock INTEGER DEFAULT 0,
-                        barcode TEXT,
-                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                        FOREIGN KEY (product_id) REFERENCES Products(id)
-                    )
-                """)
-                
-                # Check if columns exist, add them if they don't
-                cursor.execute("PRAGMA table_info(Products)")
-                columns = {row[1] for row in cursor.fetchall()}
-                
-                # Add has_variants column if it doesn't exist
-                if 'has_variants' not in columns:
-                    print("Adding 'has_variants' column to Products table...")
-                    cursor.execute("ALTER TABLE Products ADD COLUMN has_variants BOOLEAN DEFAULT 0")
-                
-                # Add variant_attributes column if it doesn't exist
-                if 'variant_attributes' not in columns:
-                    print("Adding 'variant_attributes' column to Products table...")
-                    cursor.execute("ALTER TABLE Products ADD COLUMN variant_attributes TEXT")
-                
-                conn.commit()
+                cursor.execute(query, params)
+                products = fetch_records(cursor, 'ProductRow', ('category_name', 'status'))
+                if len(products) > limit:
+                    products = products[:limit]
+                    last = products[-1]
+                    return products, (last['name'], last['id'])
+                return products, None
+            except Exception as e:
+                print(f"Error getting products page: {e}")
+                return [], None
             finally:
                 conn.close()
+        return [], None
 
     @staticmethod
     def get_all_products():
@@ -87,12 +104,7 @@ class Product:
             try:
                 cursor = conn.cursor()
                 
-                # First check if the variant columns exist
-                cursor.execute("PRAGMA table_info(Products)")
-                columns = {row[1] for row in cursor.fetchall()}
-                
-                # Build query based on available columns
-                query = """
+                query = f"""
                     SELECT 
                         p.id, 
                         p.name, 
@@ -112,25 +124,14 @@ class Product:
                         COALESCE(p.status, 'available') as status,
                         COALESCE(p.product_type, 'stockable') as product_type,
                         COALESCE(p.valuation_method, 'FIFO') as valuation_method,
-                """
-                
-                # Add variant columns if they exist
-                if 'has_variants' in columns:
-                    query += "p.has_variants,"
-                else:
-                    query += "0 as has_variants,"
-                    
-                if 'variant_attributes' in columns:
-                    query += "p.variant_attributes,"
-                else:
-                    query += "NULL as variant_attributes,"
-                
-                query += """
+                        p.has_variants,
+                        p.variant_attributes,
                         COALESCE(c.name, 'Non catégorisé') as category_name,
                         p.created_at,
                         p.updated_at
                     FROM Products p
                     LEFT JOIN Categories c ON p.category_id = c.id
+                    WHERE {ACTIVE_PRODUCT_CONDITION}
                     ORDER BY p.id DESC
                 """
                 
@@ -150,12 +151,7 @@ class Product:
             try:
                 cursor = conn.cursor()
                 
-                # Check if variant columns exist
-                cursor.execute("PRAGMA table_info(Products)")
-                columns = {row[1] for row in cursor.fetchall()}
-                
-                # Build the base query
-                query = """
+                query = f"""
                     SELECT 
                         p.id, 
                         p.name, 
@@ -164,20 +160,8 @@ class Product:
                         COALESCE(p.stock, 0) as stock,
                         p.image_path,
                         p.category_id,
-                """
-                
-                # Add variant columns if they exist
-                if 'has_variants' in columns:
-                    query += "p.has_variants,"
-                else:
-                    query += "0 as has_variants,"
-                    
-                if 'variant_attributes' in columns:
-                    query += "p.variant_attributes,"
-                else:
-                    query += "NULL as variant_attributes,"
-                
-                query += """
+                        p.has_variants,
+                        p.variant_attributes,
                         COALESCE(c.name, 'Non catégorisé') as category_name,
                         p.description,
                         COALESCE(p.purchase_price, 0) as purchase_price,
@@ -190,11 +174,12 @@ class Product:
                         COALESCE(p.valuation_method, 'FIFO') as valuation_method
                     FROM Products p
                     LEFT JOIN Categories c ON p.category_id = c.id
+                    WHERE {ACTIVE_PRODUCT_CONDITION}
                 """
                 
                 # Add category filter if provided
                 if category_id is not None:
-                    query += " WHERE p.category_id = ? "
+                    query += " AND p.category_id = ? "
                     params = (category_id,)
                 else:
                     params = ()
@@ -210,10 +195,7 @@ class Product:
                 for product in products:
                     product_dict = dict(product)
                     if product_dict.get('variant_attributes'):
-                        try:
-                            product_dict['variant_attributes'] = json.loads(product_dict['variant_attributes'])
-                        except:
-                            product_dict['variant_attributes'] = None
+                        product_dict['variant_attributes'] = parse_json_attributes(product_dict['variant_attributes'])
                     result.append(product_dict)
                 
                 return result
@@ -243,7 +225,9 @@ class Product:
                 """, (product_id, attribute_values, price_adjustment, stock, barcode))
                 
                 variant_id = cursor.lastrowid
+                StockLedger.record_stock_edits(cursor, {}, variant_ids=[variant_id], movement_type='in', notes=StockLedger.OPENING_NOTES)
                 conn.commit()
+                ProductCatalog.refresh_variant(variant_id, conn)
                 return variant_id
             except Exception as e:
                 print(f"Error adding variant: {e}")
@@ -252,123 +236,125 @@ class Product:
                 conn.close()
         return None
 
+    # Upper bound on ids per IN (...) list, well below SQLite's variable limit
+    ID_CHUNK_SIZE = 500
+
+    @staticmethod
+    def _id_chunks(ids):
+        ids = list(ids)
+        for i in range(0, len(ids), Product.ID_CHUNK_SIZE):
+            yield ids[i:i + Product.ID_CHUNK_SIZE]
+
+    # Keys fetch_variants adds to the variant columns
+    VARIANT_COMPUTED_FIELDS = (
+        'attribute_values', 'attributes', 'combination', 'price_adjustment',
+        'price_extras', 'effective_price', 'unit_price', 'total_price_adjustment',
+    )
+
+    @staticmethod
+    def fetch_variants(cursor, product_ids=None, variant_ids=None):
+        """Load variants with their combination values and computed prices.
+
+        Two set-based queries per chunk of ids: the variant rows (joined to
+        their product's base price) and all their combination values. With no
+        ids, every variant is loaded. Returns records (dict-compatible, see
+        models.records) ordered by product, then id;
+        ``effective_price`` (also exposed as ``unit_price``) is the selling price
+        and ``display_name`` the precomputed label of the variant.
+        """
+        base_query = """
+            SELECT v.*, COALESCE(p.unit_price, 0) as base_price
+            FROM ProductVariants v
+            JOIN Products p ON p.id = v.product_id
+        """
+        combination_query = """
+            SELECT
+                pvc.product_variant_id,
+                ptav.id as template_value_id,
+                pa.name as attribute_name,
+                pav.value,
+                COALESCE(ptav.price_extra, 0) as price_extra
+            FROM ProductVariantCombination pvc
+            JOIN ProductTemplateAttributeValue ptav ON pvc.template_attribute_value_id = ptav.id
+            JOIN ProductAttributeValues pav ON ptav.value_id = pav.id
+            JOIN ProductAttributes pa ON pav.attribute_id = pa.id
+        """
+
+        if product_ids is not None:
+            filters = [("v.product_id", "pvc.product_id", chunk) for chunk in Product._id_chunks(product_ids)]
+        elif variant_ids is not None:
+            filters = [("v.id", "pvc.product_variant_id", chunk) for chunk in Product._id_chunks(variant_ids)]
+        else:
+            filters = [(None, None, None)]
+
+        rows = []
+        combinations = {}
+        for variant_column, combination_column, chunk in filters:
+            if chunk is not None:
+                placeholders = ", ".join("?" for _ in chunk)
+                cursor.execute(f"{base_query} WHERE {variant_column} IN ({placeholders})", chunk)
+                rows.extend(cursor.fetchall())
+                cursor.execute(
+                    f"{combination_query} WHERE {combination_column} IN ({placeholders}) ORDER BY ptav.line_id",
+                    chunk
+                )
+            else:
+                cursor.execute(base_query)
+                rows.extend(cursor.fetchall())
+                cursor.execute(f"{combination_query} ORDER BY ptav.line_id")
+            for combination in cursor.fetchall():
+                combinations.setdefault(combination['product_variant_id'], []).append({
+                    'template_value_id': combination['template_value_id'],
+                    'attribute': combination['attribute_name'],
+                    'value': combination['value'],
+                    'price_extra': float(combination['price_extra']),
+                })
+
+        result = []
+        if rows:
+            # One compact record type for the variant columns (base_price,
+            # always last, is dropped) plus the computed keys
+            columns = tuple(rows[0].keys())[:-1]
+            computed = tuple(key for key in Product.VARIANT_COMPUTED_FIELDS if key not in columns)
+            make_variant = record_type('VariantRow', columns + computed)
+            padding = (None,) * len(computed)
+        for row in rows:
+            row_values = tuple(row)
+            variant = make_variant(*row_values[:-1], *padding)
+            base_price = float(row_values[-1] or 0)
+
+            # Attribute values come from the combination rows; only variants
+            # without any fall back to their legacy JSON (decoded once per text)
+            combination = combinations.get(variant['id'], [])
+            if combination:
+                values = {value['attribute']: value['value'] for value in combination}
+            else:
+                values = parse_json_attributes(variant.get('attribute_values'))
+                if not isinstance(values, dict):
+                    values = {}
+            # Stored in both keys for compatibility with older callers
+            variant['attribute_values'] = values
+            variant['attributes'] = values.copy()
+
+            # effective_price is maintained by triggers; the rest is breakdown
+            effective_price = float(variant.get('effective_price') or 0)
+            variant['combination'] = combination
+            variant['price_adjustment'] = float(variant.get('price_adjustment') or 0)
+            variant['price_extras'] = sum(value['price_extra'] for value in combination)
+            variant['effective_price'] = effective_price
+            variant['unit_price'] = effective_price
+            variant['total_price_adjustment'] = effective_price - base_price
+            result.append(variant)
+
+        result.sort(key=lambda v: (v['product_id'], v['id']))
+        return result
+
     @staticmethod
     def get_variants(product_id):
         conn = get_connection()
         if conn:
             try:
-                cursor = conn.cursor()
-                
-                # Get the base product's unit price
-                cursor.execute("""
-                    SELECT unit_price
-                    FROM Products
-                    WHERE id = ?
-                """, (product_id,))
-                product_row = cursor.fetchone()
-                base_product_price = float(product_row['unit_price'] if product_row else 0)
-                
-                # First get the variants basic data
-                cursor.execute("""
-                    SELECT *
-                    FROM ProductVariants
-                    WHERE product_id = ?
-                    ORDER BY id
-                """, (product_id,))
-                variants = cursor.fetchall()
-                
-                # Check if price_adjustment column exists or if we need to use unit_price
-                has_price_adjustment = False
-                
-                # If we have variants, check their structure
-                if variants and len(variants) > 0:
-                    variant_dict = dict(variants[0])
-                    # Check which price columns are available
-                    has_price_adjustment = 'price_adjustment' in variant_dict
-                    has_unit_price = 'unit_price' in variant_dict
-                    print(f"Variant structure check: has_price_adjustment={has_price_adjustment}, has_unit_price={has_unit_price}")
-                
-                # Convert variants to a more robust format
-                result = []
-                for variant in variants:
-                    variant_dict = dict(variant)
-                    
-                    # Handle attribute_values with better error protection
-                    if variant_dict.get('attribute_values'):
-                        try:
-                            if isinstance(variant_dict['attribute_values'], str):
-                                parsed_values = json.loads(variant_dict['attribute_values'])
-                                # Store in both attribute_values and attributes for compatibility
-                                variant_dict['attribute_values'] = parsed_values
-                                variant_dict['attributes'] = parsed_values.copy() if isinstance(parsed_values, dict) else {}
-                            else:
-                                # If it's already a dict/object, make sure we have it in both places
-                                variant_dict['attributes'] = variant_dict['attribute_values'].copy() if isinstance(variant_dict['attribute_values'], dict) else {}
-                        except Exception as e:
-                            print(f"Error parsing variant attributes: {e}")
-                            # Provide empty dictionaries as fallback
-                            variant_dict['attribute_values'] = {}
-                            variant_dict['attributes'] = {}
-                    else:
-                        # Ensure both attribute keys exist even if empty
-                        variant_dict['attribute_values'] = {}
-                        variant_dict['attributes'] = {}
-                    
-                    # Fix price calculation: Calculate price either from unit_price or price_adjustment
-                    try:
-                        # Identify pricing structure and calculate appropriately
-                        if has_price_adjustment:
-                            # If using price_adjustment, we need to add it to the base product price
-                            price_adj = float(variant_dict.get('price_adjustment') or 0)
-                            variant_price = base_product_price + price_adj
-                            variant_dict['price_adjustment'] = price_adj
-                        else:
-                            # If using unit_price directly, use that value
-                            variant_price = float(variant_dict.get('unit_price') or base_product_price)
-                            # Compute price_adjustment for compatibility with code that expects it
-                            variant_dict['price_adjustment'] = variant_price - base_product_price
-                        
-                        # Add or ensure unit_price field exists
-                        variant_dict['unit_price'] = variant_price
-                        
-                        # Compute price extras from attribute combinations
-                        price_extras = 0
-                        try:
-                            cursor.execute("""
-                                SELECT ptav.price_extra
-                                FROM ProductVariantCombination pvc
-                                JOIN ProductTemplateAttributeValue ptav ON pvc.template_attribute_value_id = ptav.id
-                                WHERE pvc.product_variant_id = ?
-                            """, (variant_dict['id'],))
-                            
-                            # Sum up all price extras
-                            attribute_extras = cursor.fetchall()
-                            if attribute_extras:
-                                price_extras = sum(float(extra['price_extra'] or 0) for extra in attribute_extras)
-                        except Exception as e:
-                            print(f"Failed to retrieve attribute price extras: {e}")
-                            # We'll continue with price_extras as 0
-                        
-                        # Store calculated values
-                        variant_dict['price_extras'] = price_extras
-                        variant_dict['total_price_adjustment'] = variant_dict['price_adjustment'] + price_extras
-                        
-                        print(f"Variant {variant_dict['id']} - Fixed price calculation: Base product price {base_product_price}, Variant price {variant_price}, Total price = {variant_price + price_extras}")
-                        
-                    except Exception as e:
-                        print(f"Error calculating price adjustment for variant {variant_dict['id']}: {e}")
-                        # Use base product price as fallback and log the error
-                        variant_dict['price_extras'] = 0
-                        variant_dict['unit_price'] = base_product_price
-                        variant_dict['price_adjustment'] = 0
-                        variant_dict['total_price_adjustment'] = 0
-                        
-                    # Add explicit debugging output
-                    print(f"Returning variant: {variant_dict['id']}, attributes: {variant_dict.get('attributes')}, final price: {variant_dict['unit_price']}")
-                    
-                    result.append(variant_dict)
-                
-                return result
+                return Product.fetch_variants(conn.cursor(), product_ids=[product_id])
             except Exception as e:
                 print(f"Error getting variants: {e}")
                 return []
@@ -376,6 +362,23 @@ class Product:
                 conn.close()
         return []
 
+    @staticmethod
+    def get_variants_for_products(product_ids):
+        """Variants of many products at once: {product_id: [variant, ...]}."""
+        conn = get_connection()
+        if conn:
+            try:
+                result = {product_id: [] for product_id in product_ids}
+                for variant in Product.fetch_variants(conn.cursor(), product_ids=product_ids):
+                    result.setdefault(variant['product_id'], []).append(variant)
+                return result
+            except Exception as e:
+                print(f"Error getting variants: {e}")
+                return {}
+            finally:
+                conn.close()
+        return {}
+
     @staticmethod
     def get_stock_movements(product_id, variant_id=None):
         """Get stock movement history for a product"""
@@ -416,6 +419,130 @@ class Product:
             finally:
                 conn.close()
         return []
+
+    @staticmethod
+    def get_stock_movements_page(product_id, variant_id=None, before=None, limit=MOVEMENT_PAGE_SIZE,
+                                 movement_type=None, date_from=None, date_to=None):
+        """One page of a product's stock movements, newest first.
+
+        Without ``variant_id`` the movements of the product and all its
+        variants are listed. Filters: ``movement_type`` and the inclusive
+        'YYYY-MM-DD' range ``date_from`` / ``date_to``. ``before`` is the
+        cursor returned with the previous page, or None for the first page.
+
+        Pages are index range scans in (created_at, id) order. Each row
+        carries ``balance``, the stock after the movement. It is computed by
+        the query, going back from the current stock; the cursor carries
+        the balance reached so far, so a page never sums older history.
+        Filtered-out movements still count in the balances. ``reversed``
+        tells whether the movement was cancelled.
+
+        Returns (movements, next_cursor); next_cursor is None on the last page.
+        """
+        params = {
+            'product_id': product_id,
+            'variant_id': variant_id,
+            'movement_type': movement_type,
+            'date_from': date_from,
+            'date_to': date_to,
+            'limit': limit + 1,
+        }
+        scope = "sm.product_id = :product_id"
+        if variant_id:
+            scope += " AND sm.variant_id = :variant_id"
+
+        # Movements newer than the page: older than the cursor, or up to date_to
+        if before is not None:
+            key = "(sm.created_at, sm.id) < (:before_created_at, :before_id)"
+            params['before_created_at'], params['before_id'], params['balance'] = before
+        elif date_to:
+            key = "sm.created_at < date(:date_to, '+1 day')"
+        else:
+            key = "1"
+        filters = ""
+        if movement_type:
+            filters += " AND sm.movement_type = :movement_type"
+        if date_from:
+            filters += " AND sm.created_at >= :date_from"
+
+        conn = get_connection()
+        if conn:
+            try:
+                cursor = conn.cursor()
+                if before is None:
+                    # The first page counts back from the current stock
+                    if variant_id:
+                        cursor.execute("SELECT COALESCE(stock, 0) FROM ProductVariants WHERE id = ?", (variant_id,))
+                    else:
+                        cursor.execute("""
+                            SELECT COALESCE(stock, 0) + COALESCE((
+                                SELECT SUM(stock) FROM ProductVariants WHERE product_id = p.id
+                            ), 0)
+                            FROM Products p WHERE id = ?
+                        """, (product_id,))
+                    row = cursor.fetchone()
+                    params['balance'] = row[0] if row else 0
+                    if date_to:
+                        cursor.execute(f"""
+                            SELECT COALESCE(SUM(sm.quantity), 0) FROM StockMovements sm
+                            WHERE {scope} AND sm.created_at >= date(:date_to, '+1 day')
+                        """, params)
+                        params['balance'] -= cursor.fetchone()[0]
+
+                # span: every movement from the cursor down to the oldest row of
+                # the page, filtered or not, with the sum of those newer than it
+                cursor.execute(f"""
+                    WITH page AS MATERIALIZED (
+                        SELECT
+                            sm.id, sm.product_id, sm.variant_id,
+                            sm.movement_type, sm.quantity, sm.unit_price,
+                            sm.reference, sm.notes, sm.user_id,
+                            sm.sale_id, sm.reversal_of, sm.created_at
+                        FROM StockMovements sm
+                        WHERE {scope} AND {key}{filters}
+                        ORDER BY sm.created_at DESC, sm.id DESC
+                        LIMIT :limit
+                    ),
+                    span AS (
+                        SELECT
+                            sm.id,
+                            SUM(sm.quantity) OVER (
+                                ORDER BY sm.created_at DESC, sm.id DESC
+                                ROWS UNBOUNDED PRECEDING
+                            ) - sm.quantity as newer
+                        FROM StockMovements sm
+                        WHERE {scope} AND {key}
+                          AND (sm.created_at, sm.id) >= (
+                              SELECT created_at, id FROM page ORDER BY created_at, id LIMIT 1
+                          )
+                    )
+                    SELECT
+                        page.id, page.product_id, page.variant_id,
+                        page.movement_type, page.quantity, page.unit_price,
+                        page.reference, page.notes, u.username as user_name,
+                        page.sale_id, page.reversal_of,
+                        EXISTS (
+                            SELECT 1 FROM StockMovements r WHERE r.reversal_of = page.id
+                        ) as reversed,
+                        :balance - span.newer as balance,
+                        page.created_at
+                    FROM page
+                    JOIN span ON span.id = page.id
+                    LEFT JOIN Users u ON u.id = page.user_id
+                    ORDER BY page.created_at DESC, page.id DESC
+                """, params)
+                movements = fetch_records(cursor, 'StockMovementRow')
+                if len(movements) > limit:
+                    movements = movements[:limit]
+                    last = movements[-1]
+                    return movements, (last['created_at'], last['id'], last['balance'] - last['quantity'])
+                return movements, None
+            except Exception as e:
+                print(f"Error getting stock movements page: {e}")
+                return [], None
+            finally:
+                conn.close()
+        return [], None
     
     @staticmethod 
     def add_stock_movement(product_id, variant_id, movement_type, quantity, unit_price, reference, notes, user_id):
@@ -428,38 +555,18 @@ class Product:
                 # Start a transaction
                 cursor.execute("BEGIN TRANSACTION")
                 
-                # Insert movement record
-                cursor.execute("""
-                    INSERT INTO StockMovements (
-                        product_id, variant_id, movement_type, 
-                        quantity, unit_price, reference, 
-                        notes, user_id, created_at
-                    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
-                """, (
-                    product_id, variant_id, movement_type,
-                    quantity, unit_price, reference,
-                    notes, user_id
-                ))
-                
-                movement_id = cursor.lastrowid
-                
-                # Update product or variant stock
-                if variant_id:
-                    cursor.execute("""
-                        UPDATE ProductVariants
-                        SET stock = stock + ?,
-                            updated_at = CURRENT_TIMESTAMP
-                        WHERE id = ?
-                    """, (quantity, variant_id))
-                else:
-                    cursor.execute("""
-                        UPDATE Products
-                        SET stock = stock + ?,
-                            updated_at = CURRENT_TIMESTAMP
-                        WHERE id = ?
-                    """, (quantity, product_id))
+                # Append to the ledger; moves the stock and its cost layers too
+                movement_id = StockLedger.record(
+                    cursor, product_id, variant_id, quantity,
+                    movement_type=movement_type,
+                    unit_price=unit_price,
+                    reference=reference,
+                    notes=notes,
+                    user_id=user_id
+                )
                 
                 cursor.execute("COMMIT")
+                ProductCatalog.adjust_stock(product_id, variant_id, quantity)
                 return movement_id
             except Exception as e:
                 cursor.execute("ROLLBACK")
@@ -470,8 +577,12 @@ class Product:
         return None
     
     @staticmethod
-    def delete_stock_movement(movement_id):
-        """Delete a stock movement and revert its effects"""
+    def delete_stock_movement(movement_id, user_id=None):
+        """Cancel a stock movement.
+
+        The ledger is append-only: the movement stays and an opposite
+        adjustment is recorded, which reverts the stock and cost layers.
+        """
         conn = get_connection()
         if conn:
             try:
@@ -480,42 +591,13 @@ class Product:
                 # Start a transaction
                 cursor.execute("BEGIN TRANSACTION")
                 
-                # Get the movement details
-                cursor.execute("""
-                    SELECT product_id, variant_id, quantity
-                    FROM StockMovements
-                    WHERE id = ?
-                """, (movement_id,))
-                
-                movement = cursor.fetchone()
-                if not movement:
+                reversal = StockLedger.reverse(cursor, movement_id, user_id)
+                if reversal is None:
                     cursor.execute("ROLLBACK")
                     return False
                 
-                product_id = movement['product_id']
-                variant_id = movement['variant_id']
-                quantity = movement['quantity']
-                
-                # Reverse the stock change
-                if variant_id:
-                    cursor.execute("""
-                        UPDATE ProductVariants
-                        SET stock = stock - ?,
-                            updated_at = CURRENT_TIMESTAMP
-                        WHERE id = ?
-                    """, (quantity, variant_id))
-                else:
-                    cursor.execute("""
-                        UPDATE Products
-                        SET stock = stock - ?,
-                            updated_at = CURRENT_TIMESTAMP
-                        WHERE id = ?
-                    """, (quantity, product_id))
-                
-                # Delete the movement record
-                cursor.execute("DELETE FROM StockMovements WHERE id = ?", (movement_id,))
-                
                 cursor.execute("COMMIT")
+                ProductCatalog.adjust_stock(reversal['product_id'], reversal['variant_id'], reversal['quantity'])
                 return True
             except Exception as e:
                 cursor.execute("ROLLBACK")
@@ -554,8 +636,12 @@ class Product:
                     WHERE id = ?
                 """
                 
+                before = StockLedger.stock_levels(cursor, variant_ids=[variant_id]) if 'stock' in kwargs else None
                 cursor.execute(query, values)
+                if before is not None:
+                    StockLedger.record_stock_edits(cursor, before, variant_ids=[variant_id])
                 conn.commit()
+                ProductCatalog.refresh_variant(variant_id, conn)
                 return True
             except Exception as e:
                 print(f"Error updating variant: {e}")
@@ -563,10 +649,70 @@ class Product:
             finally:
                 conn.close()
         return False
+
+    @staticmethod
+    def update_variants(updates):
+        """Update many variants in one transaction.
+
+        ``updates`` is a list of dicts holding the variant ``id`` and the
+        columns to set. Rows setting the same columns share one executemany.
+        Returns the number of variants updated, or None if nothing was saved.
+        """
+        if not updates:
+            return 0
+        groups = {}
+        for update in updates:
+            fields = tuple(key for key in update if key != 'id')
+            values = []
+            for key in fields:
+                value = update[key]
+                if key == 'attribute_values' and isinstance(value, dict):
+                    value = json.dumps(value)
+                values.append(value)
+            groups.setdefault(fields, []).append(values + [update['id']])
+
+        conn = get_connection()
+        if conn:
+            try:
+                cursor = conn.cursor()
+                cursor.execute("BEGIN IMMEDIATE")
+                stocked = [update['id'] for update in updates if 'stock' in update]
+                before = StockLedger.stock_levels(cursor, variant_ids=stocked)
+                for fields, rows in groups.items():
+                    assignments = [f"{key} = ?" for key in fields]
+                    assignments.append("updated_at = CURRENT_TIMESTAMP")
+                    cursor.executemany(
+                        f"UPDATE ProductVariants SET {', '.join(assignments)} WHERE id = ?",
+                        rows
+                    )
+                StockLedger.record_stock_edits(cursor, before, variant_ids=stocked)
+                conn.commit()
+
+                variant_ids = [update['id'] for update in updates]
+                product_ids = set()
+                for chunk in Product._id_chunks(variant_ids):
+                    cursor.execute(
+                        f"SELECT DISTINCT product_id FROM ProductVariants WHERE id IN ({', '.join('?' for _ in chunk)})",
+                        chunk
+                    )
+                    product_ids.update(row[0] for row in cursor.fetchall())
+                for product_id in product_ids:
+                    ProductCatalog.refresh_product(product_id, conn)
+                return len(updates)
+            except Exception as e:
+                conn.rollback()
+                print(f"Error updating variants: {e}")
+                return None
+            finally:
+                conn.close()
+        return None
         
     @staticmethod
     def delete_variant(variant_id):
-        """Delete a product variant and its related data"""
+        """Delete a product variant and its related data.
+
+        Variants that were sold or moved in stock are never deleted.
+        """
         conn = get_connection()
         if conn:
             try:
@@ -574,7 +720,13 @@ class Product:
                 
                 # Begin transaction for data integrity
                 cursor.execute("BEGIN TRANSACTION")
+
+                # Sales and the append-only ledger keep referring to the variant
+                if Product._has_history(cursor, variant_id=variant_id):
+                    raise ValueError("La variante a des ventes ou un historique de stock")
                 
+                cursor.execute("DELETE FROM Cart WHERE variant_id = ?", (variant_id,))
+
                 try:
                     # First delete from ProductVariantCombination table (if it exists)
                     cursor.execute("""
@@ -585,16 +737,6 @@ class Product:
                     # Table might not exist or no records
                     pass
                 
-                try:
-                    # Delete from StockMovements if there are any for this variant
-                    cursor.execute("""
-                        DELETE FROM StockMovements 
-                        WHERE variant_id = ?
-                    """, (variant_id,))
-                except sqlite3.OperationalError:
-                    # Table might not exist or no records
-                    pass
-                
                 # Delete the variant itself
                 cursor.execute("""
                     DELETE FROM ProductVariants 
@@ -608,6 +750,7 @@ class Product:
                     return False
                 
                 cursor.execute("COMMIT")
+                ProductCatalog.remove_variant(variant_id)
                 print(f"Successfully deleted variant with ID {variant_id}")
                 return True
                 
@@ -645,7 +788,8 @@ class Product:
                 optional_fields = [
                     'barcode', 'description', 'image_path', 'unit', 
                     'weight', 'volume', 'status', 'product_type',
-                    'valuation_method', 'min_stock', 'reorder_point'
+                    'valuation_method', 'min_stock', 'reorder_point',
+                    'dynamic_variants'
                 ]
                 
                 for field in optional_fields:
@@ -698,32 +842,27 @@ class Product:
                 
                 # Add variants if provided
                 if has_variants and variants:
-                    for variant in variants:
-                        # Calculate variant price
-                        variant_price = variant.get('price', unit_price)
-                        
-                        # Prepare variant insert query
-                        cursor.execute("""
-                            INSERT INTO ProductVariants (
-                                product_id, name, barcode, unit_price, 
-                                purchase_price, stock, attributes, sku,
-                                created_at, updated_at
-                            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                        """, (
-                            product_id,
-                            variant.get('name', ''),
-                            variant.get('barcode', ''),
-                            variant_price,
-                            variant.get('purchase_price', purchase_price),
-                            variant.get('stock', 0),
-                            variant.get('attribute_values', '{}'),
-                            variant.get('sku', ''),
-                            current_time,
-                            current_time
-                        ))
+                    # Variants and their combination rows in a few executemany() calls
+                    ProductAttribute.insert_variants(cursor, product_id, [
+                        {
+                            **variant,
+                            'price': variant.get('price', unit_price),
+                            'purchase_price': variant.get('purchase_price', purchase_price)
+                        }
+                        for variant in variants
+                    ], base_price=unit_price or 0)
+                
+                # Dynamic variants are built from the attribute lines when sold or stocked
+                if has_variants and kwargs.get('dynamic_variants') and variant_attributes:
+                    attribute_names = json.loads(variant_attributes) if isinstance(variant_attributes, str) else variant_attributes
+                    ProductAttribute.ensure_attribute_lines(cursor, product_id, attribute_names)
+                
+                # Opening stock enters the ledger at the purchase price
+                StockLedger.record_stock_edits(cursor, {}, product_ids=[product_id], movement_type='in', notes=StockLedger.OPENING_NOTES)
                 
                 # Commit transaction
                 cursor.execute("COMMIT")
+                ProductCatalog.refresh_product(product_id, conn)
                 return product_id
                 
             except Exception as e:
@@ -783,8 +922,12 @@ class Product:
                     WHERE id = ?
                 """
                 
+                before = StockLedger.stock_levels(cursor, product_ids=[product_id]) if 'stock' in kwargs else None
                 cursor.execute(query, values)
+                if before is not None:
+                    StockLedger.record_stock_edits(cursor, before, product_ids=[product_id])
                 conn.commit()
+                ProductCatalog.refresh_product(product_id, conn)
                 return True
             except Exception as e:
                 print(f"Error updating product: {e}")
@@ -793,8 +936,67 @@ class Product:
                 conn.close()
         return False
 
+    @staticmethod
+    def _has_history(cursor, product_id=None, variant_id=None):
+        # The opening stock alone goes with the row: it was never sold or moved
+        if StockLedger.has_movements(cursor, product_id=product_id, variant_id=variant_id, include_opening=False):
+            return True
+        if variant_id:
+            cursor.execute("SELECT 1 FROM SaleItems WHERE variant_id = ? LIMIT 1", (variant_id,))
+        else:
+            cursor.execute("SELECT 1 FROM SaleItems WHERE product_id = ? LIMIT 1", (product_id,))
+        return cursor.fetchone() is not None
+
+    @staticmethod
+    def has_history(product_id=None, variant_id=None):
+        """Whether a product or variant was sold or moved in stock since it
+        was created.
+
+        Such rows cannot be deleted: sales and the stock ledger keep
+        referring to them. Products are archived instead (archive_product).
+        Deleting a row that only holds its opening stock drops that opening
+        movement and its cost layer with it.
+        """
+        conn = get_connection()
+        if conn:
+            try:
+                return Product._has_history(conn.cursor(), product_id, variant_id)
+            except Exception as e:
+                print(f"Error checking product history: {e}")
+                return True
+            finally:
+                conn.close()
+        return True
+
+    @staticmethod
+    def archive_product(product_id):
+        """Hide a product from the till and the product lists, keeping its
+        sales and stock history"""
+        conn = get_connection()
+        if conn:
+            try:
+                cursor = conn.cursor()
+                cursor.execute("""
+                    UPDATE Products
+                    SET status = ?, updated_at = CURRENT_TIMESTAMP
+                    WHERE id = ?
+                """, (ARCHIVED_STATUS, product_id))
+                archived = cursor.rowcount > 0
+                cursor.execute("DELETE FROM Cart WHERE product_id = ?", (product_id,))
+                conn.commit()
+                ProductCatalog.remove_product(product_id)
+                return archived
+            except Exception as e:
+                conn.rollback()
+                print(f"Error archiving product: {e}")
+                return False
+            finally:
+                conn.close()
+        return False
+
     @staticmethod
     def delete_product(product_id):
+        """Delete a product that was never sold nor moved in stock"""
         conn = get_connection()
         if conn:
             try:
@@ -802,15 +1004,14 @@ class Product:
                 # Begin transaction
                 cursor.execute("BEGIN TRANSACTION")
                 
+                # Sales and the append-only ledger keep referring to the product
+                if Product._has_history(cursor, product_id=product_id):
+                    raise ValueError("Le produit a des ventes ou un historique de stock")
+
                 # Delete related records first
+                cursor.execute("DELETE FROM Cart WHERE product_id = ?", (product_id,))
                 cursor.execute("DELETE FROM ProductVariants WHERE product_id = ?", (product_id,))
                 
-                # Try to delete from StockMovements if the table exists
-                try:
-                    cursor.execute("DELETE FROM StockMovements WHERE product_id = ?", (product_id,))
-                except sqlite3.OperationalError:
-                    pass  # Table might not exist
-                
                 # Try to delete from ProductSuppliers if the table exists
                 try:
                     cursor.execute("DELETE FROM ProductSuppliers WHERE product_id = ?", (product_id,))
@@ -821,6 +1022,7 @@ class Product:
                 cursor.execute("DELETE FROM Products WHERE id = ?", (product_id,))
                 
                 cursor.execute("COMMIT")
+                ProductCatalog.remove_product(product_id)
                 return True
             except Exception as e:
                 cursor.execute("ROLLBACK")
@@ -838,45 +1040,21 @@ class Product:
                 cursor = conn.cursor()
                 cursor.execute("BEGIN TRANSACTION")
 
-                # Get current stock and min_stock
-                cursor.execute("""
-                    SELECT stock, min_stock, reorder_point 
-                    FROM Products 
-                    WHERE id = ?
-                """, (product_id,))
-                product = cursor.fetchone()
-                
-                if not product:
+                cursor.execute("SELECT 1 FROM Products WHERE id = ?", (product_id,))
+                if not cursor.fetchone():
                     raise Exception("Product not found")
-                
-                new_stock = product['stock'] + quantity
 
-                # Update product stock
-                cursor.execute("""
-                    UPDATE Products 
-                    SET stock = ?,
-                        updated_at = CURRENT_TIMESTAMP
-                    WHERE id = ?
-                """, (new_stock, product_id))
-
-                # Try to record stock movement if table exists
-                try:
-                    cursor.execute("""
-                        INSERT INTO StockMovements (
-                            product_id, quantity, movement_type,
-                            reference, user_id, created_at
-                        ) VALUES (?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
-                    """, (product_id, quantity, movement_type, reference, user_id))
-                except sqlite3.OperationalError:
-                    pass  # StockMovements table might not exist
+                # Record the movement and update product stock
+                StockLedger.record(
+                    cursor, product_id, None, quantity,
+                    movement_type=movement_type,
+                    reference=reference,
+                    user_id=user_id
+                )
 
                 cursor.execute("COMMIT")
-                
-                # Check if stock is below minimum
-                if new_stock <= product['min_stock']:
-                    # Could trigger notifications or automatic reordering here
-                    print(f"Warning: Product {product_id} stock is below minimum!")
-                
+                ProductCatalog.adjust_stock(product_id, None, quantity)
+                # Threshold crossings are recorded by the StockAlerts triggers
                 return True
             except Exception as e:
                 cursor.execute("ROLLBACK")
@@ -906,27 +1084,72 @@ class Product:
         return None
 
     @staticmethod
-    def search_products(query):
+    def search_match_expression(query):
+        """Turn free text into an FTS5 prefix query: every word must match."""
+        words = re.findall(r"\w+", query or "")
+        return " ".join(f'"{word}"*' for word in words)
+
+    @staticmethod
+    def search_products(query, category_id=None, limit=200):
+        """Ranked prefix search over product and variant names, descriptions,
+        SKUs and barcodes (ProductSearch FTS5 index). A variant match returns
+        its parent product."""
+        match = Product.search_match_expression(query)
+        if not match:
+            return []
+
         conn = get_connection()
         if conn:
             try:
                 cursor = conn.cursor()
-                cursor.execute("""
+
+                # FTS5 answers "ORDER BY rank LIMIT n" without sorting every hit;
+                # a category filter is applied afterwards, so it gets all hits
+                fts_limit = "" if category_id is not None else " LIMIT ?"
+                sql = f"""
+                    WITH hits AS MATERIALIZED (
+                        SELECT product_id, rank as score
+                        FROM ProductSearch
+                        WHERE ProductSearch MATCH ?
+                        ORDER BY rank{fts_limit}
+                    )
                     SELECT 
                         p.id, 
                         p.name, 
                         p.barcode,
                         COALESCE(p.unit_price, 0) as unit_price, 
+                        COALESCE(p.purchase_price, 0) as purchase_price,
                         COALESCE(p.stock, 0) as stock,
+                        COALESCE(p.min_stock, 0) as min_stock,
                         p.image_path,
                         p.category_id,
-                        COALESCE(c.name, 'Non catégorisé') as category_name
-                    FROM Products p
+                        p.has_variants,
+                        p.variant_attributes,
+                        p.description,
+                        COALESCE(c.name, 'Non catégorisé') as category_name,
+                        MIN(h.score) as score
+                    FROM hits h
+                    JOIN Products p ON p.id = h.product_id
                     LEFT JOIN Categories c ON p.category_id = c.id
-                    WHERE p.name LIKE ? OR p.barcode LIKE ?
-                    ORDER BY p.name
-                """, (f"%{query}%", f"%{query}%"))
-                return cursor.fetchall()
+                    WHERE {ACTIVE_PRODUCT_CONDITION}
+                """
+                params = [match]
+
+                if category_id is not None:
+                    sql += " AND p.category_id = ? "
+                    params.append(category_id)
+                else:
+                    # Several variants of one product can share the top hits
+                    params.append(limit * 4)
+
+                sql += " GROUP BY p.id ORDER BY score, p.name LIMIT ?"
+                params.append(limit)
+
+                cursor.execute(sql, params)
+                return fetch_records(cursor, 'ProductRow')
+            except Exception as e:
+                print(f"Error searching products: {e}")
+                return []
             finally:
                 conn.close()
         return []
@@ -1,157 +1,108 @@
 from database import get_connection
+from migrations import COMBINATION_KEY_SQL
+from models.catalog import ProductCatalog
+from models.stock_ledger import StockLedger
 from datetime import datetime, UTC
+import itertools
 import json
+import math
+import threading
 
 class ProductAttribute:
+    # Attribute definitions with their values, loaded once per process and
+    # dropped by the methods below that change attributes or values
+    _attributes = None   # attribute id -> {..., 'values': [...]}, ordered by name
+    _attributes_lock = threading.RLock()
+
+    # Upper bound on product ids per IN (...) list of the bulk line loader
+    ID_CHUNK_SIZE = 500
+
     def __init__(self, name, description=None, display_type='radio'):
         self.name = name
         self.description = description
         self.display_type = display_type  # radio, select, color, pills
 
     @staticmethod
-    def create_tables():
-        """Ensure the attribute and variant tables exist"""
-        conn = get_connection()
-        if conn:
-            try:
-                cursor = conn.cursor()
-                
-                # Create ProductAttributes table
-                cursor.execute("""
-                    CREATE TABLE IF NOT EXISTS ProductAttributes (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        name TEXT NOT NULL UNIQUE,
-                        description TEXT,
-                        display_type TEXT DEFAULT 'radio' CHECK(display_type IN ('radio', 'select', 'color', 'pills')),
-                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                    )
-                """)
-                
-                # Create ProductAttributeValues table
-                cursor.execute("""
-                    CREATE TABLE IF NOT EXISTS ProductAttributeValues (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        attribute_id INTEGER NOT NULL,
-                        value TEXT NOT NULL,
-                        sequence INTEGER DEFAULT 0,
-                        html_color TEXT,
-                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                        FOREIGN KEY (attribute_id) REFERENCES ProductAttributes(id) ON DELETE CASCADE,
-                        UNIQUE(attribute_id, value)
-                    )
-                """)
-                
-                # Create ProductTemplateAttributeLine table
-                cursor.execute("""
-                    CREATE TABLE IF NOT EXISTS ProductTemplateAttributeLine (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        product_id INTEGER NOT NULL,
-                        attribute_id INTEGER NOT NULL,
-                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                        FOREIGN KEY (product_id) REFERENCES Products(id) ON DELETE CASCADE,
-                        FOREIGN KEY (attribute_id) REFERENCES ProductAttributes(id) ON DELETE CASCADE,
-                        UNIQUE(product_id, attribute_id)
-                    )
-                """)
-                
-                # Create ProductTemplateAttributeValue table
-                cursor.execute("""
-                    CREATE TABLE IF NOT EXISTS ProductTemplateAttributeValue (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        line_id INTEGER NOT NULL,
-                        value_id INTEGER NOT NULL,
-                        price_extra REAL DEFAULT 0,
-                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                        FOREIGN KEY (line_id) REFERENCES ProductTemplateAttributeLine(id) ON DELETE CASCADE,
-                        FOREIGN KEY (value_id) REFERENCES ProductAttributeValues(id) ON DELETE CASCADE,
-                        UNIQUE(line_id, value_id)
-                    )
-                """)
-                
-                # Create ProductVariantCombination table
-                cursor.execute("""
-                    CREATE TABLE IF NOT EXISTS ProductVariantCombination (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        product_id INTEGER NOT NULL,
-                        product_variant_id INTEGER NOT NULL,
-                        template_attribute_value_id INTEGER NOT NULL,
-                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                        FOREIGN KEY (product_id) REFERENCES Products(id) ON DELETE CASCADE,
-                        FOREIGN KEY (product_variant_id) REFERENCES ProductVariants(id) ON DELETE CASCADE,
-                        FOREIGN KEY (template_attribute_value_id) REFERENCES ProductTemplateAttributeValue(id) ON DELETE CASCADE,
-                        UNIQUE(product_variant_id, template_attribute_value_id)
-                    )
-                """)
-                
-                # Check if we need to add display_type to existing ProductAttributes table
-                cursor.execute("PRAGMA table_info(ProductAttributes)")
-                columns = [row[1] for row in cursor.fetchall()]
-                
-                if 'display_type' not in columns:
-                    print("Adding display_type column to ProductAttributes table...")
-                    cursor.execute("ALTER TABLE ProductAttributes ADD COLUMN display_type TEXT DEFAULT 'radio'")
-                
-                if 'updated_at' not in columns:
-                    print("Adding updated_at column to ProductAttributes table...")
-                    cursor.execute("ALTER TABLE ProductAttributes ADD COLUMN updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP")
-                
-                # Check if we need to add sequence and html_color to existing ProductAttributeValues table
-                cursor.execute("PRAGMA table_info(ProductAttributeValues)")
-                columns = [row[1] for row in cursor.fetchall()]
-                
-                if 'sequence' not in columns:
-                    print("Adding sequence column to ProductAttributeValues table...")
-                    cursor.execute("ALTER TABLE ProductAttributeValues ADD COLUMN sequence INTEGER DEFAULT 0")
-                
-                if 'html_color' not in columns:
-                    print("Adding html_color column to ProductAttributeValues table...")
-                    cursor.execute("ALTER TABLE ProductAttributeValues ADD COLUMN html_color TEXT")
-                
-                if 'updated_at' not in columns:
-                    print("Adding updated_at column to ProductAttributeValues table...")
-                    cursor.execute("ALTER TABLE ProductAttributeValues ADD COLUMN updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP")
-                
-                conn.commit()
-                return True
-            except Exception as e:
-                print(f"Error creating attribute tables: {e}")
-                return False
-            finally:
-                conn.close()
-        return False
+    def _load_attributes():
+        """Return the cached attribute tree, loading it with a single query"""
+        with ProductAttribute._attributes_lock:
+            if ProductAttribute._attributes is not None:
+                return ProductAttribute._attributes
+            conn = get_connection()
+            if conn:
+                try:
+                    cursor = conn.cursor()
+                    cursor.execute("""
+                        SELECT
+                            a.id, a.name, a.description, a.created_at, a.display_type,
+                            v.id, v.value, v.sequence, v.html_color
+                        FROM ProductAttributes a
+                        LEFT JOIN ProductAttributeValues v ON v.attribute_id = a.id
+                        ORDER BY a.name, a.id, v.value
+                    """)
+                    
+                    attributes = {}
+                    for row in cursor.fetchall():
+                        attribute = attributes.get(row[0])
+                        if attribute is None:
+                            attribute = attributes[row[0]] = {
+                                'id': row[0],
+                                'name': row[1],
+                                'description': row[2],
+                                'created_at': row[3],
+                                'display_type': row[4],
+                                'values': []
+                            }
+                        if row[5] is not None:
+                            attribute['values'].append({
+                                'id': row[5],
+                                'value': row[6],
+                                'sequence': row[7],
+                                'html_color': row[8]
+                            })
+                    ProductAttribute._attributes = attributes
+                    return attributes
+                except Exception as e:
+                    print(f"Error loading attributes: {e}")
+                    return None
+                finally:
+                    conn.close()
+            return None
+
+    @staticmethod
+    def invalidate_attribute_cache():
+        """Forget the cached attribute definitions; the next read reloads them"""
+        with ProductAttribute._attributes_lock:
+            ProductAttribute._attributes = None
 
     @staticmethod
     def get_all_attributes():
         """Get all product attributes"""
-        conn = get_connection()
-        if conn:
-            try:
-                cursor = conn.cursor()
-                cursor.execute("""
-                    SELECT id, name, description, created_at
-                    FROM ProductAttributes
-                    ORDER BY name
-                """)
-                
-                attributes = []
-                for row in cursor.fetchall():
-                    attributes.append({
-                        'id': row[0],
-                        'name': row[1],
-                        'description': row[2],
-                        'created_at': row[3]
-                    })
-                return attributes
-            except Exception as e:
-                print(f"Error getting attributes: {e}")
-                return []
-            finally:
-                conn.close()
-        return []
+        attributes = ProductAttribute._load_attributes()
+        if attributes is None:
+            return []
+        return [
+            {
+                'id': attribute['id'],
+                'name': attribute['name'],
+                'description': attribute['description'],
+                'created_at': attribute['created_at']
+            }
+            for attribute in attributes.values()
+        ]
+
+    @staticmethod
+    def get_attribute_by_name(name):
+        """Get an attribute with its values by name, or None"""
+        attributes = ProductAttribute._load_attributes()
+        if attributes is None:
+            return None
+        for attribute in attributes.values():
+            if attribute['name'] == name:
+                copy = dict(attribute)
+                copy['values'] = [dict(value) for value in attribute['values']]
+                return copy
+        return None
 
     @staticmethod
     def add_attribute(name, description=None, display_type='radio'):
@@ -189,6 +140,7 @@ class ProductAttribute:
                 
                 attribute_id = cursor.lastrowid
                 conn.commit()
+                ProductAttribute.invalidate_attribute_cache()
                 return attribute_id
             except Exception as e:
                 print(f"Error adding attribute: {e}")
@@ -211,6 +163,7 @@ class ProductAttribute:
                 """, (name, description, attribute_id))
                 
                 conn.commit()
+                ProductAttribute.invalidate_attribute_cache()
                 return cursor.rowcount > 0
             except Exception as e:
                 print(f"Error updating attribute: {e}")
@@ -237,6 +190,7 @@ class ProductAttribute:
                 cursor.execute("DELETE FROM ProductAttributes WHERE id = ?", (attribute_id,))
                 
                 cursor.execute("COMMIT")
+                ProductAttribute.invalidate_attribute_cache()
                 return True
             except Exception as e:
                 cursor.execute("ROLLBACK")
@@ -249,30 +203,13 @@ class ProductAttribute:
     @staticmethod
     def get_attribute_values(attribute_id):
         """Get all values for a specific attribute"""
-        conn = get_connection()
-        if conn:
-            try:
-                cursor = conn.cursor()
-                cursor.execute("""
-                    SELECT id, value
-                    FROM ProductAttributeValues
-                    WHERE attribute_id = ?
-                    ORDER BY value
-                """, (attribute_id,))
-                
-                values = []
-                for row in cursor.fetchall():
-                    values.append({
-                        'id': row[0],
-                        'value': row[1]
-                    })
-                return values
-            except Exception as e:
-                print(f"Error getting attribute values: {e}")
-                return []
-            finally:
-                conn.close()
-        return []
+        attributes = ProductAttribute._load_attributes()
+        if attributes is None or attribute_id not in attributes:
+            return []
+        return [
+            {'id': value['id'], 'value': value['value']}
+            for value in attributes[attribute_id]['values']
+        ]
 
     @staticmethod
     def add_attribute_value(attribute_id, value, sequence=0, html_color=None):
@@ -309,6 +246,7 @@ class ProductAttribute:
                 
                 value_id = cursor.lastrowid
                 conn.commit()
+                ProductAttribute.invalidate_attribute_cache()
                 return value_id
             except Exception as e:
                 print(f"Error adding attribute value: {e}")
@@ -326,6 +264,7 @@ class ProductAttribute:
                 cursor = conn.cursor()
                 cursor.execute("DELETE FROM ProductAttributeValues WHERE id = ?", (value_id,))
                 conn.commit()
+                ProductAttribute.invalidate_attribute_cache()
                 return cursor.rowcount > 0
             except Exception as e:
                 print(f"Error deleting attribute value: {e}")
@@ -396,6 +335,7 @@ class ProductAttribute:
                         WHERE id = ?
                     """, (price_extra, existing[0]))
                     conn.commit()
+                    ProductCatalog.refresh_attribute_line(line_id, conn)
                     return existing[0]
                 
                 # Get current timestamp
@@ -424,52 +364,77 @@ class ProductAttribute:
     @staticmethod
     def get_product_attribute_lines(product_id):
         """Get all attribute lines for a product with their values"""
+        return ProductAttribute.get_attribute_lines_for_products([product_id]).get(product_id, [])
+
+    @staticmethod
+    def fetch_attribute_lines(cursor, product_ids):
+        """
+        Load the attribute lines of many products with one joined query per chunk
+        
+        Returns a dict of product id -> list of lines (line_id, attribute_id,
+        attribute_name, display_type, values); products without lines are absent.
+        """
+        product_ids = list(dict.fromkeys(product_ids))
+        result = {}
+        for start in range(0, len(product_ids), ProductAttribute.ID_CHUNK_SIZE):
+            chunk = product_ids[start:start + ProductAttribute.ID_CHUNK_SIZE]
+            cursor.execute(f"""
+                SELECT 
+                    pal.product_id,
+                    pal.id as line_id, 
+                    pal.attribute_id,
+                    a.name as attribute_name,
+                    a.display_type,
+                    ptav.id as template_value_id,
+                    ptav.value_id,
+                    ptav.price_extra,
+                    pav.value,
+                    pav.sequence,
+                    pav.html_color
+                FROM ProductTemplateAttributeLine pal
+                JOIN ProductAttributes a ON pal.attribute_id = a.id
+                LEFT JOIN ProductTemplateAttributeValue ptav ON ptav.line_id = pal.id
+                LEFT JOIN ProductAttributeValues pav ON ptav.value_id = pav.id
+                WHERE pal.product_id IN ({', '.join('?' for _ in chunk)})
+                ORDER BY pal.product_id, pal.id, pav.sequence, pav.value
+            """, chunk)
+            
+            line = None
+            for row in cursor.fetchall():
+                if line is None or line['line_id'] != row['line_id']:
+                    line = {
+                        'line_id': row['line_id'],
+                        'attribute_id': row['attribute_id'],
+                        'attribute_name': row['attribute_name'],
+                        'display_type': row['display_type'],
+                        'values': []
+                    }
+                    result.setdefault(row['product_id'], []).append(line)
+                # Values whose attribute value was deleted drop out, as with an inner join
+                if row['value'] is not None:
+                    line['values'].append({
+                        'template_value_id': row['template_value_id'],
+                        'value_id': row['value_id'],
+                        'price_extra': row['price_extra'],
+                        'value': row['value'],
+                        'sequence': row['sequence'],
+                        'html_color': row['html_color']
+                    })
+        return result
+
+    @staticmethod
+    def get_attribute_lines_for_products(product_ids):
+        """Get the attribute lines with their values of one or many products in a single pass"""
         conn = get_connection()
         if conn:
             try:
-                cursor = conn.cursor()
-                
-                # Get attribute lines
-                cursor.execute("""
-                    SELECT 
-                        pal.id as line_id, 
-                        pal.attribute_id,
-                        a.name as attribute_name,
-                        a.display_type
-                    FROM ProductTemplateAttributeLine pal
-                    JOIN ProductAttributes a ON pal.attribute_id = a.id
-                    WHERE pal.product_id = ?
-                """, (product_id,))
-                
-                lines = []
-                for line in cursor.fetchall():
-                    line_dict = dict(line)
-                    
-                    # Get values for this line
-                    cursor.execute("""
-                        SELECT 
-                            ptav.id as template_value_id,
-                            ptav.value_id,
-                            ptav.price_extra,
-                            pav.value,
-                            pav.sequence,
-                            pav.html_color
-                        FROM ProductTemplateAttributeValue ptav
-                        JOIN ProductAttributeValues pav ON ptav.value_id = pav.id
-                        WHERE ptav.line_id = ?
-                        ORDER BY pav.sequence, pav.value
-                    """, (line_dict['line_id'],))
-                    
-                    line_dict['values'] = [dict(value) for value in cursor.fetchall()]
-                    lines.append(line_dict)
-                
-                return lines
+                return ProductAttribute.fetch_attribute_lines(conn.cursor(), product_ids)
             except Exception as e:
                 print(f"Error getting product attribute lines: {e}")
-                return []
+                return {}
             finally:
                 conn.close()
-        return []
+        return {}
     
     @staticmethod
     def add_variant_combination(product_id, variant_id, template_value_ids):
@@ -489,20 +454,18 @@ class ProductAttribute:
                 # Start a transaction
                 cursor.execute("BEGIN TRANSACTION")
                 
-                for template_value_id in template_value_ids:
-                    # Check if combination already exists
-                    cursor.execute("""
-                        SELECT id FROM ProductVariantCombination 
-                        WHERE product_variant_id = ? AND template_attribute_value_id = ?
-                    """, (variant_id, template_value_id))
-                    
-                    if not cursor.fetchone():
-                        # Create the combination
-                        cursor.execute("""
-                            INSERT INTO ProductVariantCombination (
-                                product_id, product_variant_id, template_attribute_value_id, created_at
-                            ) VALUES (?, ?, ?, CURRENT_TIMESTAMP)
-                        """, (product_id, variant_id, template_value_id))
+                # Existing pairs are skipped by the UNIQUE(product_variant_id, template_attribute_value_id) constraint
+                cursor.executemany("""
+                    INSERT OR IGNORE INTO ProductVariantCombination (
+                        product_id, product_variant_id, template_attribute_value_id, created_at
+                    ) VALUES (?, ?, ?, CURRENT_TIMESTAMP)
+                """, [(product_id, variant_id, template_value_id) for template_value_id in template_value_ids])
+                
+                # Re-key the variant from its complete set of values
+                cursor.execute(f"""
+                    UPDATE ProductVariants SET combination_key = {COMBINATION_KEY_SQL}
+                    WHERE id = ?
+                """, (variant_id,))
                 
                 cursor.execute("COMMIT")
                 return True
@@ -513,14 +476,65 @@ class ProductAttribute:
             finally:
                 conn.close()
         return False
-    
+
+    # Refuse to generate more combinations than this unless the caller raises the limit
+    MAX_VARIANT_COMBINATIONS = 10000
+
+    # Variants written per transaction by create_variants()
+    VARIANT_CHUNK_SIZE = 500
+
+    @staticmethod
+    def count_variant_combinations(attributes):
+        """
+        Number of variants the given attributes would generate, without building them
+        
+        Args:
+            attributes: Either a list of attribute lines (as returned by
+                get_product_attribute_lines) or a dict of attribute names to values
+        """
+        if not attributes:
+            return 0
+        if isinstance(attributes, dict):
+            sizes = [len(values) for values in attributes.values()]
+        else:
+            sizes = [len(line['values']) for line in attributes]
+        return math.prod(sizes)
+
     @staticmethod
-    def generate_variant_combinations(product_id_or_attributes):
+    def iter_variant_combinations(attribute_lines):
+        """
+        Yield the variant definitions of a list of attribute lines one at a time
+        
+        Each definition has the template value ids, the summed price extra and
+        an attribute name -> value dict, in the order of the lines.
+        """
+        if not attribute_lines:
+            return
+        names = [line['attribute_name'] for line in attribute_lines]
+        for values in itertools.product(*(line['values'] for line in attribute_lines)):
+            yield {
+                'attribute_value_ids': [value['template_value_id'] for value in values],
+                'price_extra': sum(value['price_extra'] or 0 for value in values),
+                'attributes': {name: value['value'] for name, value in zip(names, values)}
+            }
+
+    @staticmethod
+    def iter_variant_combinations_dict(attributes_values):
+        """Yield one {attribute name: value} dict per combination of attributes_values"""
+        if not attributes_values:
+            return
+        names = list(attributes_values.keys())
+        for values in itertools.product(*attributes_values.values()):
+            yield dict(zip(names, values))
+
+    @staticmethod
+    def generate_variant_combinations(product_id_or_attributes, limit=MAX_VARIANT_COMBINATIONS):
         """
         Generate all possible variant combinations for a product
         
         Args:
             product_id_or_attributes: Either a product ID or a dictionary of attribute names to values
+            limit: Maximum number of combinations; more than that returns an empty list (None disables the check)
             
         Returns:
             A list of variant definitions
@@ -528,90 +542,474 @@ class ProductAttribute:
         # Check if we received a dict of attributes instead of a product_id
         if isinstance(product_id_or_attributes, dict):
             # We received attributes_values directly, use the legacy dictionary method
-            return ProductAttribute.generate_variant_combinations_dict(product_id_or_attributes)
+            return ProductAttribute.generate_variant_combinations_dict(product_id_or_attributes, limit)
             
         # Otherwise, we have a product_id, proceed with the new implementation    
-        product_id = product_id_or_attributes
-        conn = get_connection()
-        if conn:
-            try:
-                cursor = conn.cursor()
-                
-                # Get all attribute lines for this product
-                attribute_lines = ProductAttribute.get_product_attribute_lines(product_id)
-                
-                if not attribute_lines:
-                    return []
-                
-                # Prepare data structure for generating combinations
-                line_values = {}
-                for line in attribute_lines:
-                    attribute_name = line['attribute_name']
-                    line_values[attribute_name] = line['values']
-                
-                # Generate all combinations
-                combinations = []
-                
-                def generate_combinations(lines, current_combination=None, index=0):
-                    if current_combination is None:
-                        current_combination = {
-                            'attribute_value_ids': [],
-                            'price_extra': 0,
-                            'attributes': {}
-                        }
-                    
-                    if index >= len(lines):
-                        combinations.append(current_combination.copy())
-                        return
-                    
-                    current_line = lines[index]
-                    attribute_name = current_line['attribute_name']
-                    
-                    for value in current_line['values']:
-                        # Add this attribute value to the combination
-                        new_combination = {
-                            'attribute_value_ids': current_combination['attribute_value_ids'] + [value['template_value_id']],
-                            'price_extra': current_combination['price_extra'] + value['price_extra'],
-                            'attributes': {**current_combination['attributes'], attribute_name: value['value']}
-                        }
-                        
-                        generate_combinations(lines, new_combination, index + 1)
-                
-                generate_combinations(attribute_lines)
-                return combinations
-            except Exception as e:
-                print(f"Error generating variant combinations: {e}")
-                return []
-            finally:
-                conn.close()
-        return []
+        attribute_lines = ProductAttribute.get_product_attribute_lines(product_id_or_attributes)
+        if not attribute_lines:
+            return []
+        
+        count = ProductAttribute.count_variant_combinations(attribute_lines)
+        if limit is not None and count > limit:
+            print(f"⚠️ {count} variant combinations exceed the limit of {limit}, nothing generated")
+            return []
+        
+        return list(ProductAttribute.iter_variant_combinations(attribute_lines))
         
     @staticmethod
-    def generate_variant_combinations_dict(attributes_values):
+    def generate_variant_combinations_dict(attributes_values, limit=MAX_VARIANT_COMBINATIONS):
         """
         Generate all possible combinations of attribute values
         
         Args:
             attributes_values: A dict where keys are attribute names and values are lists of values
                 e.g. {'Color': ['Red', 'Blue'], 'Size': ['S', 'M', 'L']}
+            limit: Maximum number of combinations; more than that returns an empty list (None disables the check)
         
         Returns:
             A list of dictionaries, each representing a variant combination
         """
-        def generate_combinations(attrs, current=None, index=0):
-            if current is None:
-                current = {}
+        count = ProductAttribute.count_variant_combinations(attributes_values)
+        if limit is not None and count > limit:
+            print(f"⚠️ {count} variant combinations exceed the limit of {limit}, nothing generated")
+            return []
+        
+        return list(ProductAttribute.iter_variant_combinations_dict(attributes_values))
+
+    @staticmethod
+    def ensure_attribute_lines(cursor, product_id, attribute_names):
+        """
+        Attach attributes to a product on an open transaction
+        
+        Each named attribute gets a template attribute line carrying all of
+        its values (existing lines and values are kept). Returns a dict of
+        attribute name -> line id; unknown attribute names are skipped.
+        """
+        try:
+            current_time = datetime.now(UTC).strftime("%Y-%m-%d %H:%M:%S")
+        except AttributeError:
+            current_time = datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S")
+        
+        lines = {}
+        for attribute_name in attribute_names:
+            cursor.execute("SELECT id FROM ProductAttributes WHERE name = ?", (attribute_name,))
+            attribute = cursor.fetchone()
+            if not attribute:
+                continue
+            attribute_id = attribute[0]
             
-            if index >= len(attrs):
-                return [current.copy()]
+            cursor.execute("""
+                INSERT OR IGNORE INTO ProductTemplateAttributeLine (
+                    product_id, attribute_id, created_at, updated_at
+                ) VALUES (?, ?, ?, ?)
+            """, (product_id, attribute_id, current_time, current_time))
+            cursor.execute("""
+                SELECT id FROM ProductTemplateAttributeLine
+                WHERE product_id = ? AND attribute_id = ?
+            """, (product_id, attribute_id))
+            line_id = cursor.fetchone()[0]
             
-            attr_name = list(attrs.keys())[index]
-            combinations = []
+            cursor.execute("""
+                INSERT OR IGNORE INTO ProductTemplateAttributeValue (
+                    line_id, value_id, price_extra, created_at, updated_at
+                )
+                SELECT ?, id, 0, ?, ? FROM ProductAttributeValues WHERE attribute_id = ?
+            """, (line_id, current_time, current_time, attribute_id))
+            lines[attribute_name] = line_id
+        return lines
+
+    @staticmethod
+    def _template_value_ids(cursor, product_id, pairs, cache):
+        """
+        Map (attribute name, value) pairs to the product's template value ids
+        
+        Missing attribute lines and template values are created for attributes
+        and values that exist in the catalogue; unknown ones are left unmapped.
+        ``cache`` keeps the mapping between calls for the same product.
+        """
+        missing = [pair for pair in pairs if pair not in cache]
+        if not missing:
+            return cache
+        
+        # Lines are created in the order the attributes first appear
+        lines = ProductAttribute.ensure_attribute_lines(cursor, product_id, dict.fromkeys(name for name, _ in missing))
+        for attribute_name, line_id in lines.items():
+            cursor.execute("""
+                SELECT pav.value, ptav.id
+                FROM ProductTemplateAttributeValue ptav
+                JOIN ProductAttributeValues pav ON ptav.value_id = pav.id
+                WHERE ptav.line_id = ?
+            """, (line_id,))
+            for value, template_value_id in cursor.fetchall():
+                cache[(attribute_name, value)] = template_value_id
+        
+        # Remember unknown pairs so they are not looked up again
+        for pair in missing:
+            cache.setdefault(pair, None)
+        return cache
+
+    @staticmethod
+    def insert_variants(cursor, product_id, variants, base_price=0, cache=None):
+        """
+        Insert variants and their combination rows on an open transaction
+        
+        Args:
+            cursor: Cursor of a connection inside a write transaction
+            product_id: The base product ID
+            variants: List of dicts with name, sku, barcode, stock, purchase_price,
+                either price (selling price, value extras included) or
+                price_adjustment, and the attributes dict (or its JSON in
+                attribute_values). Variants
+                carrying template_value_ids are linked to those values as is.
+            base_price: Product price used to turn a variant price into a price adjustment
+            cache: Dict reused across calls to map attribute values to template value ids
+        
+        Returns:
+            The variant ids, in the order of ``variants``; a combination
+            that already has a variant yields the existing id
+        """
+        if not variants:
+            return []
+        if cache is None:
+            cache = {}
+        
+        try:
+            current_time = datetime.now(UTC).strftime("%Y-%m-%d %H:%M:%S")
+        except AttributeError:
+            current_time = datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S")
+        
+        attribute_sets = []
+        for variant in variants:
+            attributes = variant.get('attributes')
+            if not isinstance(attributes, dict):
+                try:
+                    attributes = json.loads(variant.get('attribute_values') or '{}')
+                except (TypeError, ValueError):
+                    attributes = {}
+            attribute_sets.append(attributes)
+        
+        pairs = dict.fromkeys(
+            (name, value)
+            for variant, attributes in zip(variants, attribute_sets)
+            if variant.get('template_value_ids') is None
+            for name, value in attributes.items()
+        )
+        ProductAttribute._template_value_ids(cursor, product_id, pairs, cache)
+        
+        # Combinations that already have a variant are not inserted again
+        cursor.execute("""
+            SELECT combination_key, id FROM ProductVariants
+            WHERE product_id = ? AND combination_key IS NOT NULL
+        """, (product_id,))
+        existing = {row[0]: row[1] for row in cursor.fetchall()}
+        
+        resolved = []
+        for variant, attributes in zip(variants, attribute_sets):
+            template_value_ids = variant.get('template_value_ids')
+            if template_value_ids is None:
+                template_value_ids = [cache.get((name, value)) for name, value in attributes.items()]
+            resolved.append([value_id for value_id in template_value_ids if value_id])
+        
+        # Price extras of the linked values, added back by EFFECTIVE_PRICE_SQL
+        value_ids = list({value_id for template_value_ids in resolved for value_id in template_value_ids})
+        extras = {}
+        if value_ids:
+            cursor.execute(f"""
+                SELECT id, COALESCE(price_extra, 0) FROM ProductTemplateAttributeValue
+                WHERE id IN ({','.join('?' * len(value_ids))})
+            """, value_ids)
+            extras = dict(cursor.fetchall())
+        
+        rows = []
+        value_id_sets = []
+        keys = []
+        for variant, attributes, template_value_ids in zip(variants, attribute_sets, resolved):
+            key = ProductAttribute.combination_key(template_value_ids)
+            keys.append(key)
+            if key is not None:
+                if key in existing:
+                    continue
+                existing[key] = None  # filled in once inserted
+            value_id_sets.append(template_value_ids)
+            attributes_json = json.dumps(attributes)
             
-            for value in attrs[attr_name]:
-                current[attr_name] = value
-                combinations.extend(generate_combinations(attrs, current, index + 1))
+            if variant.get('price_adjustment') is not None:
+                price_adjustment = variant['price_adjustment']
+            elif variant.get('price') is not None:
+                if template_value_ids:
+                    price_extra = sum(extras.get(value_id, 0) for value_id in template_value_ids)
+                else:
+                    price_extra = variant.get('price_extra') or 0
+                price_adjustment = variant['price'] - base_price - price_extra
+            else:
+                price_adjustment = 0
             
-            return combinations
+            rows.append((
+                product_id,
+                variant.get('name', ''),
+                variant.get('sku', ''),
+                variant.get('barcode') or None,  # '' would collide on the UNIQUE barcode
+                variant.get('price'),
+                variant.get('purchase_price'),
+                variant.get('stock', 0),
+                attributes_json,
+                attributes_json,
+                price_adjustment,
+                current_time,
+                current_time
+            ))
+        
+        new_ids = [
+            cursor.execute("""
+                INSERT INTO ProductVariants (
+                    product_id, name, sku, barcode, unit_price, purchase_price,
+                    stock, attributes, attribute_values, price_adjustment,
+                    created_at, updated_at
+                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                RETURNING id
+            """, row).fetchone()[0]
+            for row in rows
+        ]
+        
+        cursor.executemany("""
+            INSERT OR IGNORE INTO ProductVariantCombination (
+                product_id, product_variant_id, template_attribute_value_id, created_at
+            ) VALUES (?, ?, ?, ?)
+        """, [
+            (product_id, variant_id, template_value_id, current_time)
+            for variant_id, template_value_ids in zip(new_ids, value_id_sets)
+            for template_value_id in template_value_ids
+        ])
+        
+        # Key the new variants from their complete sets of combination rows
+        cursor.executemany(f"""
+            UPDATE ProductVariants SET combination_key = {COMBINATION_KEY_SQL}
+            WHERE id = ?
+        """, [(variant_id,) for variant_id in new_ids])
+        
+        # Initial stock enters the ledger at the purchase price
+        stocked = [variant_id for variant_id, row in zip(new_ids, rows) if row[6]]
+        if stocked:
+            StockLedger.record_stock_edits(cursor, {}, variant_ids=stocked, movement_type='in', notes=StockLedger.OPENING_NOTES)
+        
+        variant_ids = []
+        inserted = iter(new_ids)
+        for key in keys:
+            if key is None or existing[key] is None:
+                variant_id = next(inserted)
+                if key is not None:
+                    existing[key] = variant_id
+            else:
+                variant_id = existing[key]
+            variant_ids.append(variant_id)
+        return variant_ids
+
+    @staticmethod
+    def create_variants(product_id, variants, chunk_size=VARIANT_CHUNK_SIZE):
+        """
+        Persist many variants of a product with their combination rows
+        
+        ``variants`` may be any iterable (a generator included) of the dicts
+        accepted by insert_variants(). Rows are written in transactions of
+        ``chunk_size`` variants, so a failure keeps the chunks already committed.
+        
+        Returns:
+            The list of variant ids, or None if a chunk failed
+        """
+        conn = get_connection()
+        if conn:
+            variant_ids = []
+            try:
+                cursor = conn.cursor()
+                cursor.execute("SELECT COALESCE(unit_price, 0) FROM Products WHERE id = ?", (product_id,))
+                product = cursor.fetchone()
+                if not product:
+                    print(f"Error creating variants: product {product_id} not found")
+                    return None
+                base_price = product[0]
+                
+                cache = {}
+                iterator = iter(variants)
+                while True:
+                    chunk = list(itertools.islice(iterator, chunk_size))
+                    if not chunk:
+                        break
+                    cursor.execute("BEGIN IMMEDIATE")
+                    try:
+                        variant_ids.extend(
+                            ProductAttribute.insert_variants(cursor, product_id, chunk, base_price, cache)
+                        )
+                        cursor.execute("COMMIT")
+                    except Exception:
+                        cursor.execute("ROLLBACK")
+                        raise
+                
+                return variant_ids
+            except Exception as e:
+                print(f"Error creating variants ({len(variant_ids)} saved): {e}")
+                return None
+            finally:
+                if variant_ids:
+                    ProductCatalog.refresh_product(product_id, conn)
+                conn.close()
+        return None
+
+    @staticmethod
+    def combination_key(template_value_ids):
+        """Canonical key of a combination: sorted template value ids, comma separated"""
+        ids = sorted({int(value_id) for value_id in template_value_ids})
+        return ",".join(str(value_id) for value_id in ids) if ids else None
+
+    @staticmethod
+    def find_variant(cursor, product_id, template_value_ids):
+        """Id of the product variant made of exactly these template values, or None"""
+        key = ProductAttribute.combination_key(template_value_ids)
+        if key is None:
+            return None
+        cursor.execute("""
+            SELECT id FROM ProductVariants
+            WHERE product_id = ? AND combination_key = ?
+        """, (product_id, key))
+        row = cursor.fetchone()
+        return row[0] if row else None
+
+    @staticmethod
+    def resolve_variant(product_id, template_value_ids):
+        """
+        Resolve a selection of template values to a variant
+        
+        Args:
+            product_id: The base product ID
+            template_value_ids: Selected template value ids, at most one per attribute line
+        
+        Returns:
+            A dict with:
+                variant_id: Variant of exactly this selection, or None
+                stock: Its stock (0 when there is no variant)
+                available: Template value ids that, swapped into the
+                    selection for their line, still give an existing variant
+                in_stock: The subset of available whose variant has stock
+            or None on error
+        """
+        selected = {int(value_id) for value_id in template_value_ids}
+        conn = get_connection()
+        if conn:
+            try:
+                cursor = conn.cursor()
+                result = {'variant_id': None, 'stock': 0, 'available': set(), 'in_stock': set()}
+                
+                key = ProductAttribute.combination_key(selected)
+                if key is not None:
+                    cursor.execute("""
+                        SELECT id, COALESCE(stock, 0) FROM ProductVariants
+                        WHERE product_id = ? AND combination_key = ?
+                    """, (product_id, key))
+                    row = cursor.fetchone()
+                    if row:
+                        result['variant_id'], result['stock'] = row[0], row[1]
+                
+                cursor.execute("""
+                    SELECT ptav.id, ptav.line_id
+                    FROM ProductTemplateAttributeValue ptav
+                    JOIN ProductTemplateAttributeLine pal ON ptav.line_id = pal.id
+                    WHERE pal.product_id = ?
+                """, (product_id,))
+                line_of = {row[0]: row[1] for row in cursor.fetchall()}
+                lines = set(line_of.values())
+                
+                # For each line, keep the selection on the other lines and
+                # collect this line's values found in the matching variants
+                for line_id in lines:
+                    others = sorted(value_id for value_id in selected if line_of.get(value_id) != line_id)
+                    if others:
+                        matching = f"""
+                            SELECT product_variant_id FROM ProductVariantCombination
+                            WHERE product_id = ?
+                              AND template_attribute_value_id IN ({', '.join('?' for _ in others)})
+                            GROUP BY product_variant_id
+                            HAVING COUNT(*) = ?
+                        """
+                        params = [product_id, *others, len(others)]
+                    else:
+                        matching = "SELECT id FROM ProductVariants WHERE product_id = ?"
+                        params = [product_id]
+                    cursor.execute(f"""
+                        SELECT pvc.template_attribute_value_id, MAX(COALESCE(v.stock, 0) > 0)
+                        FROM ProductVariantCombination pvc
+                        JOIN ProductVariants v ON v.id = pvc.product_variant_id
+                        JOIN ProductTemplateAttributeValue ptav ON ptav.id = pvc.template_attribute_value_id
+                        WHERE pvc.product_variant_id IN ({matching}) AND ptav.line_id = ?
+                        GROUP BY pvc.template_attribute_value_id
+                    """, (*params, line_id))
+                    for value_id, has_stock in cursor.fetchall():
+                        result['available'].add(value_id)
+                        if has_stock:
+                            result['in_stock'].add(value_id)
+                
+                return result
+            except Exception as e:
+                print(f"Error resolving variant: {e}")
+                return None
+            finally:
+                conn.close()
+        return None
+
+    @staticmethod
+    def ensure_variant(cursor, product_id, template_value_ids):
+        """
+        Return (variant id, created) for a combination of template values
+        
+        Used by products in dynamic variants mode, whose variant rows only
+        exist once a combination is sold or stocked. The row is created on
+        the caller's write transaction when it does not exist yet; the values
+        must belong to the product, one per attribute line.
+        """
+        variant_id = ProductAttribute.find_variant(cursor, product_id, template_value_ids)
+        if variant_id is not None:
+            return variant_id, False
+        
+        ids = sorted(set(template_value_ids))
+        if not ids:
+            raise ValueError("Aucune valeur d'attribut sélectionnée")
+        cursor.execute(f"""
+            SELECT ptav.id, ptav.line_id, pa.name, pav.value
+            FROM ProductTemplateAttributeValue ptav
+            JOIN ProductTemplateAttributeLine pal ON ptav.line_id = pal.id
+            JOIN ProductAttributeValues pav ON ptav.value_id = pav.id
+            JOIN ProductAttributes pa ON pav.attribute_id = pa.id
+            WHERE pal.product_id = ? AND ptav.id IN ({', '.join('?' for _ in ids)})
+            ORDER BY ptav.line_id
+        """, (product_id, *ids))
+        rows = cursor.fetchall()
+        if len(rows) != len(ids) or len({row[1] for row in rows}) != len(rows):
+            raise ValueError(f"Combinaison de variante invalide pour le produit {product_id}: {ids}")
         
-        return generate_combinations(attributes_values)
+        attributes = {row[2]: row[3] for row in rows}
+        variant_ids = ProductAttribute.insert_variants(cursor, product_id, [{
+            'name': " / ".join(attributes.values()),
+            'attributes': attributes,
+            'template_value_ids': ids,
+            'stock': 0
+        }])
+        return variant_ids[0], True
+
+    @staticmethod
+    def get_or_create_variant(product_id, template_value_ids):
+        """Variant id of a combination, creating its row on first use (e.g. when stocking it)"""
+        conn = get_connection()
+        if conn:
+            try:
+                cursor = conn.cursor()
+                cursor.execute("BEGIN IMMEDIATE")
+                variant_id, created = ProductAttribute.ensure_variant(cursor, product_id, template_value_ids)
+                cursor.execute("COMMIT")
+                if created:
+                    ProductCatalog.refresh_variant(variant_id, conn)
+                return variant_id
+            except Exception as e:
+                cursor.execute("ROLLBACK")
+                print(f"Error creating variant on demand: {e}")
+                return None
+            finally:
+                conn.close()
+        return None
@@ -0,0 +1,199 @@
+from functools import lru_cache
+import keyword
+
+_MISSING = object()
+
+
+class Record:
+    """Compact, dict-compatible row.
+
+    Column values live in ``__slots__`` (no per-row dict of keys), which makes
+    a record several times smaller than ``dict(row)``. Records still behave
+    like the dicts the UI has always received: ``record['name']``, ``get``,
+    ``keys``/``items``, ``in``, ``dict(record)`` and ``**record`` all work.
+    Keys that are not columns of the query (UI annotations) are kept in a
+    small side dict that is only created when such a key is first set.
+
+    Concrete types are created per column list by ``record_type``.
+    """
+    __slots__ = ('_extra',)
+    _fields = ()
+    _slots = {}  # field -> slot attribute
+
+    def __getitem__(self, key):
+        slot = self._slots.get(key)
+        if slot is not None:
+            value = getattr(self, slot)
+            if value is not _MISSING:
+                return value
+        elif self._extra is not None and key in self._extra:
+            return self._extra[key]
+        raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        slot = self._slots.get(key)
+        if slot is not None:
+            setattr(self, slot, value)
+        else:
+            if self._extra is None:
+                self._extra = {}
+            self._extra[key] = value
+
+    def __delitem__(self, key):
+        slot = self._slots.get(key)
+        if slot is not None:
+            if getattr(self, slot) is _MISSING:
+                raise KeyError(key)
+            setattr(self, slot, _MISSING)
+        elif self._extra is not None and key in self._extra:
+            del self._extra[key]
+        else:
+            raise KeyError(key)
+
+    def __contains__(self, key):
+        slot = self._slots.get(key)
+        if slot is not None:
+            return getattr(self, slot) is not _MISSING
+        return self._extra is not None and key in self._extra
+
+    def get(self, key, default=None):
+        slot = self._slots.get(key)
+        if slot is not None:
+            value = getattr(self, slot)
+            return default if value is _MISSING else value
+        if self._extra is not None:
+            return self._extra.get(key, default)
+        return default
+
+    def keys(self):
+        keys = [field for field, slot in self._slots.items() if getattr(self, slot) is not _MISSING]
+        if self._extra:
+            keys.extend(self._extra)
+        return keys
+
+    def values(self):
+        return [self[key] for key in self.keys()]
+
+    def items(self):
+        return [(key, self[key]) for key in self.keys()]
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.keys())
+
+    def pop(self, key, default=_MISSING):
+        if key in self:
+            value = self[key]
+            del self[key]
+            return value
+        if default is _MISSING:
+            raise KeyError(key)
+        return default
+
+    def setdefault(self, key, default=None):
+        if key not in self:
+            self[key] = default
+        return self[key]
+
+    def update(self, other=(), **kwargs):
+        if hasattr(other, 'keys'):
+            other = ((key, other[key]) for key in other.keys())
+        for key, value in other:
+            self[key] = value
+        for key, value in kwargs.items():
+            self[key] = value
+
+    def copy(self):
+        """Shallow copy of the same record type (annotations included)"""
+        record = object.__new__(type(self))
+        for slot in self._slots.values():
+            setattr(record, slot, getattr(self, slot))
+        record._extra = dict(self._extra) if self._extra else None
+        return record
+
+    def to_dict(self):
+        return dict(self.items())
+
+    def __eq__(self, other):
+        if isinstance(other, (Record, dict)):
+            return self.to_dict() == dict(other.items())
+        return NotImplemented
+
+    __hash__ = None
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.to_dict()!r})"
+
+
+def _slot_name(field, index):
+    # Column names become attributes when they can; anything else
+    # (expressions, keywords, clashes with Record methods) gets a positional slot
+    if (field.isidentifier() and not keyword.iskeyword(field)
+            and not field.startswith('_') and not hasattr(Record, field)):
+        return field
+    return f"_c{index}"
+
+
+@lru_cache(maxsize=256)
+def record_type(name, fields):
+    """Return the Record subclass for a tuple of column names (one class per shape)"""
+    # A repeated column keeps its position; like dict(row), the last one wins
+    slots = tuple(
+        _slot_name(field, i) if field not in fields[:i] else f"_c{i}"
+        for i, field in enumerate(fields)
+    )
+    args = [f"_a{i}" for i in range(len(fields))]
+
+    # Generated positional __init__ (as namedtuple does): much faster than a
+    # setattr loop when a whole catalog is loaded
+    body = "".join(f"    self.{slot} = {arg}\n" for slot, arg in zip(slots, args))
+    source = f"def __init__(self, {', '.join(args)}):\n    self._extra = None\n{body}"
+    if not fields:
+        source = "def __init__(self):\n    self._extra = None\n"
+    namespace = {}
+    exec(source, namespace)
+
+    return type(name, (Record,), {
+        '__slots__': slots,
+        '__init__': namespace['__init__'],
+        '_fields': tuple(dict.fromkeys(fields)),
+        '_slots': dict(zip(fields, slots)),
+    })
+
+
+def cursor_fields(cursor):
+    return tuple(column[0] for column in cursor.description)
+
+
+def fetch_records(cursor, name='Row', shared=()):
+    """Fetch the remaining rows of ``cursor`` as compact records
+
+    ``shared`` names low-cardinality columns (status, category name...) whose
+    equal values should be one object across all the fetched records instead
+    of one string per row.
+    """
+    fields = cursor_fields(cursor)
+    make = record_type(name, fields)
+    if not shared:
+        return [make(*row) for row in cursor.fetchall()]
+
+    indexes = [i for i, field in enumerate(fields) if field in shared]
+    pool = {}
+    records = []
+    for row in cursor.fetchall():
+        values = list(row)
+        for i in indexes:
+            value = values[i]
+            values[i] = pool.setdefault(value, value)
+        records.append(make(*values))
+    return records
+
+
+def fetch_record(cursor, name='Row'):
+    """Fetch one row of ``cursor`` as a record, or None"""
+    row = cursor.fetchone()
+    if row is None:
+        return None
+    return record_type(name, cursor_fields(cursor))(*row)
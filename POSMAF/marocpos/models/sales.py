@@ -1,4 +1,5 @@
 from database import get_connection
+from models.checkout import CheckoutService
 from datetime import datetime, UTC
 from escpos.printer import Usb
 from reportlab.pdfgen import canvas
@@ -8,112 +9,15 @@ from PIL import Image
 import os
 
 class Sales:
-    @staticmethod
-    def create_tables():
-        conn = get_connection()
-        if conn:
-            try:
-                cursor = conn.cursor()
-                
-                # Create Sales table
-                cursor.execute("""
-                    CREATE TABLE IF NOT EXISTS Sales (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        created_at TIMESTAMP NOT NULL,
-                        user_id INTEGER NOT NULL,
-                        total_amount REAL NOT NULL,
-                        discount REAL DEFAULT 0,
-                        tax_amount REAL DEFAULT 0,
-                        final_total REAL NOT NULL,
-                        payment_method TEXT DEFAULT 'CASH',
-                        payment_status TEXT DEFAULT 'COMPLETED',
-                        notes TEXT,
-                        FOREIGN KEY (user_id) REFERENCES Users(id)
-                    )
-                """)
-
-                # Create SaleItems table
-                cursor.execute("""
-                    CREATE TABLE IF NOT EXISTS SaleItems (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        sale_id INTEGER NOT NULL,
-                        product_id INTEGER NOT NULL,
-                        quantity REAL NOT NULL,
-                        unit_price REAL NOT NULL,
-                        subtotal REAL NOT NULL,
-                        FOREIGN KEY (sale_id) REFERENCES Sales(id),
-                        FOREIGN KEY (product_id) REFERENCES Products(id)
-                    )
-                """)
-
-                conn.commit()
-                return True
-            except Exception as e:
-                print(f"Error creating sales tables: {e}")
-                return False
-            finally:
-                conn.close()
-
     @staticmethod
     def create_sale(user_id, items, payment_method='CASH', discount=0, tax_rate=0):
-        conn = get_connection()
-        if conn:
-            try:
-                cursor = conn.cursor()
-                # Start transaction
-                cursor.execute("BEGIN TRANSACTION")
-
-                # Calculate totals
-                subtotal = sum(item['quantity'] * item['unit_price'] for item in items)
-                tax_amount = subtotal * (tax_rate / 100)
-                total_with_tax = subtotal + tax_amount
-                final_total = total_with_tax - discount
-
-                # Create sale record
-                cursor.execute("""
-                    INSERT INTO Sales (
-                        created_at, user_id, total_amount, 
-                        discount, tax_amount, final_total, 
-                        payment_method
-                    ) VALUES (?, ?, ?, ?, ?, ?, ?)
-                """, (
-                    datetime.now(UTC).strftime("%Y-%m-%d %H:%M:%S"),
-                    user_id, subtotal, discount, tax_amount,
-                    final_total, payment_method
-                ))
-                
-                sale_id = cursor.lastrowid
-
-                # Add sale items
-                for item in items:
-                    cursor.execute("""
-                        INSERT INTO SaleItems (
-                            sale_id, product_id, quantity,
-                            unit_price, subtotal
-                        ) VALUES (?, ?, ?, ?, ?)
-                    """, (
-                        sale_id, item['product_id'], 
-                        item['quantity'], item['unit_price'],
-                        item['quantity'] * item['unit_price']
-                    ))
-
-                    # Update product stock
-                    cursor.execute("""
-                        UPDATE Products 
-                        SET stock = stock - ? 
-                        WHERE id = ?
-                    """, (item['quantity'], item['product_id']))
-
-                cursor.execute("COMMIT")
-                return sale_id
-
-            except Exception as e:
-                cursor.execute("ROLLBACK")
-                print(f"Error creating sale: {e}")
-                return None
-            finally:
-                conn.close()
-        return None
+        return CheckoutService.checkout(
+            user_id, items,
+            payment_method=payment_method,
+            discount=discount,
+            tax_rate=tax_rate,
+            created_at=datetime.now(UTC)
+        )
 
 class ReceiptPrinter:
     def __init__(self):
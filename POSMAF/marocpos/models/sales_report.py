@@ -1,6 +1,7 @@
-from database import get_connection
+from database import get_read_connection
+from models.records import fetch_records
+from models.cost_layers import OPEN_LAYER_VALUE_SQL
 from datetime import datetime, timedelta
-import json
 import sqlite3
 
 class SalesReport:
@@ -12,7 +13,7 @@ class SalesReport:
         if date is None:
             date = datetime.now().strftime("%Y-%m-%d")
             
-        conn = get_connection()
+        conn = get_read_connection()
         if conn:
             try:
                 cursor = conn.cursor()
@@ -36,6 +37,16 @@ class SalesReport:
                 
                 summary = dict(cursor.fetchone() or {})
                 
+                # Cost of goods recorded on the lines at checkout
+                cursor.execute("""
+                    SELECT SUM(si.cost_amount) as cost_of_goods
+                    FROM SaleItems si
+                    JOIN Sales s ON si.sale_id = s.id
+                    WHERE s.created_at BETWEEN ? AND ?
+                """, (start_date, end_date))
+                summary['cost_of_goods'] = cursor.fetchone()[0] or 0
+                summary['gross_profit'] = (summary.get('total_sales') or 0) - summary['cost_of_goods']
+                
                 # Get sales by hour
                 cursor.execute("""
                     SELECT 
@@ -48,7 +59,7 @@ class SalesReport:
                     ORDER BY hour
                 """, (start_date, end_date))
                 
-                hourly_sales = [dict(row) for row in cursor.fetchall()]
+                hourly_sales = fetch_records(cursor, 'ReportRow')
                 
                 # Get sales by payment method
                 cursor.execute("""
@@ -64,7 +75,7 @@ class SalesReport:
                     ORDER BY total_amount DESC
                 """, (start_date, end_date))
                 
-                payment_methods = [dict(row) for row in cursor.fetchall()]
+                payment_methods = fetch_records(cursor, 'ReportRow')
                 
                 # Top selling products
                 cursor.execute("""
@@ -83,7 +94,7 @@ class SalesReport:
                     LIMIT 10
                 """, (start_date, end_date))
                 
-                top_products = [dict(row) for row in cursor.fetchall()]
+                top_products = fetch_records(cursor, 'ReportRow')
                 
                 # Top selling categories
                 cursor.execute("""
@@ -100,7 +111,7 @@ class SalesReport:
                     ORDER BY total_sales DESC
                 """, (start_date, end_date))
                 
-                top_categories = [dict(row) for row in cursor.fetchall()]
+                top_categories = fetch_records(cursor, 'ReportRow')
                 
                 result = {
                     'date': date,
@@ -122,7 +133,7 @@ class SalesReport:
     @staticmethod
     def get_sales_range(start_date, end_date):
         """Get sales data for a date range"""
-        conn = get_connection()
+        conn = get_read_connection()
         if conn:
             try:
                 cursor = conn.cursor()
@@ -160,7 +171,7 @@ class SalesReport:
                     ORDER BY day
                 """, (start_date, end_date))
                 
-                daily_sales = [dict(row) for row in cursor.fetchall()]
+                daily_sales = fetch_records(cursor, 'ReportRow')
                 
                 # Get sales by payment method
                 cursor.execute("""
@@ -176,7 +187,7 @@ class SalesReport:
                     ORDER BY total_amount DESC
                 """, (start_date, end_date))
                 
-                payment_methods = [dict(row) for row in cursor.fetchall()]
+                payment_methods = fetch_records(cursor, 'ReportRow')
                 
                 # Top selling products
                 cursor.execute("""
@@ -195,7 +206,7 @@ class SalesReport:
                     LIMIT 20
                 """, (start_date, end_date))
                 
-                top_products = [dict(row) for row in cursor.fetchall()]
+                top_products = fetch_records(cursor, 'ReportRow')
                 
                 # Top selling categories
                 cursor.execute("""
@@ -212,7 +223,7 @@ class SalesReport:
                     ORDER BY total_sales DESC
                 """, (start_date, end_date))
                 
-                top_categories = [dict(row) for row in cursor.fetchall()]
+                top_categories = fetch_records(cursor, 'ReportRow')
                 
                 # Get sales by user
                 cursor.execute("""
@@ -227,7 +238,7 @@ class SalesReport:
                     ORDER BY total_sales DESC
                 """, (start_date, end_date))
                 
-                sales_by_user = [dict(row) for row in cursor.fetchall()]
+                sales_by_user = fetch_records(cursor, 'ReportRow')
                 
                 result = {
                     'start_date': start_date.split()[0],
@@ -251,7 +262,7 @@ class SalesReport:
     @staticmethod
     def get_product_performance(product_id, start_date=None, end_date=None):
         """Get sales performance data for a specific product"""
-        conn = get_connection()
+        conn = get_read_connection()
         if conn:
             try:
                 cursor = conn.cursor()
@@ -314,7 +325,7 @@ class SalesReport:
                 query += " GROUP BY month ORDER BY month"
                 
                 cursor.execute(query, params)
-                monthly_sales = [dict(row) for row in cursor.fetchall()]
+                monthly_sales = fetch_records(cursor, 'ReportRow')
                 
                 # Get variant sales if product has variants
                 cursor.execute("""
@@ -328,7 +339,7 @@ class SalesReport:
                     query = """
                         SELECT 
                             si.variant_id,
-                            pv.attribute_values,
+                            pv.display_name as variant_name,
                             SUM(si.quantity) as quantity_sold,
                             SUM(si.subtotal) as total_sales,
                             COUNT(DISTINCT s.id) as number_of_sales
@@ -351,29 +362,9 @@ class SalesReport:
                     query += " GROUP BY si.variant_id ORDER BY quantity_sold DESC"
                     
                     cursor.execute(query, params)
-                    variant_rows = cursor.fetchall()
                     
-                    for row in variant_rows:
-                        variant_data = dict(row)
-                        
-                        # Parse attribute_values
-                        try:
-                            if variant_data['attribute_values']:
-                                if isinstance(variant_data['attribute_values'], str):
-                                    variant_data['attributes'] = json.loads(variant_data['attribute_values'])
-                                else:
-                                    variant_data['attributes'] = variant_data['attribute_values']
-                                    
-                                # Create a display name for the variant
-                                if isinstance(variant_data['attributes'], dict):
-                                    variant_data['variant_name'] = " / ".join(str(v) for v in variant_data['attributes'].values() if v)
-                                else:
-                                    variant_data['variant_name'] = f"Variant #{variant_data['variant_id']}"
-                        except:
-                            variant_data['attributes'] = {}
-                            variant_data['variant_name'] = f"Variant #{variant_data['variant_id']}"
-                            
-                        variant_sales.append(variant_data)
+                    # variant_name is the stored display name: no per-row decoding
+                    variant_sales = fetch_records(cursor, 'ReportRow')
                 
                 return {
                     'product': product_summary,
@@ -389,14 +380,19 @@ class SalesReport:
     
     @staticmethod
     def get_inventory_report():
-        """Get inventory status report for all products"""
-        conn = get_connection()
+        """Get inventory status report for all products
+
+        Stock is valued at the cost of its open cost layers (FIFO or average
+        cost, see CostLayers), falling back to purchase price x stock for
+        rows without layers.
+        """
+        conn = get_read_connection()
         if conn:
             try:
                 cursor = conn.cursor()
                 
                 # Get inventory status for regular products
-                cursor.execute("""
+                cursor.execute(f"""
                     SELECT 
                         p.id as product_id,
                         p.name as product_name,
@@ -412,66 +408,43 @@ class SalesReport:
                             WHEN p.stock <= p.reorder_point THEN 'warning'
                             ELSE 'ok'
                         END as stock_status,
-                        p.purchase_price * p.stock as stock_value,
+                        COALESCE(l.value, p.purchase_price * p.stock) as stock_value,
                         p.unit_price * p.stock as retail_value
                     FROM Products p
                     LEFT JOIN Categories c ON p.category_id = c.id
+                    LEFT JOIN ({OPEN_LAYER_VALUE_SQL}) l
+                        ON l.product_id = p.id AND l.variant_id IS NULL
                     ORDER BY stock_status, p.name
                 """)
                 
-                products = [dict(row) for row in cursor.fetchall()]
+                products = fetch_records(cursor, 'ReportRow')
                 
                 # Get inventory status for variants
-                cursor.execute("""
+                cursor.execute(f"""
                     SELECT 
                         pv.id as variant_id,
                         p.id as product_id,
                         p.name as product_name,
-                        pv.attribute_values,
+                        pv.display_name as variant_name,
                         pv.stock as current_stock,
                         pv.price_adjustment,
                         COALESCE(p.purchase_price, 0) as base_cost,
                         COALESCE(p.unit_price, 0) as base_price,
-                        COALESCE(p.unit_price, 0) + COALESCE(pv.price_adjustment, 0) as variant_price,
+                        COALESCE(pv.effective_price, 0) as variant_price,
                         CASE 
                             WHEN pv.stock <= 0 THEN 'low'
                             WHEN pv.stock <= 5 THEN 'warning'
                             ELSE 'ok'
-                        END as stock_status
+                        END as stock_status,
+                        COALESCE(l.value, COALESCE(pv.purchase_price, p.purchase_price, 0) * COALESCE(pv.stock, 0)) as stock_value
                     FROM ProductVariants pv
                     JOIN Products p ON pv.product_id = p.id
+                    LEFT JOIN ({OPEN_LAYER_VALUE_SQL}) l ON l.variant_id = pv.id
                     WHERE p.has_variants = 1
                     ORDER BY p.name, pv.id
                 """)
                 
-                variants_rows = cursor.fetchall()
-                variants = []
-                
-                for row in variants_rows:
-                    variant_data = dict(row)
-                    
-                    # Parse attribute_values
-                    try:
-                        if variant_data['attribute_values']:
-                            if isinstance(variant_data['attribute_values'], str):
-                                variant_data['attributes'] = json.loads(variant_data['attribute_values'])
-                            else:
-                                variant_data['attributes'] = variant_data['attribute_values']
-                                
-                            # Create a display name for the variant
-                            if isinstance(variant_data['attributes'], dict):
-                                variant_data['variant_name'] = " / ".join(str(v) for v in variant_data['attributes'].values() if v)
-                            else:
-                                variant_data['variant_name'] = f"Variant #{variant_data['variant_id']}"
-                    except:
-                        variant_data['attributes'] = {}
-                        variant_data['variant_name'] = f"Variant #{variant_data['variant_id']}"
-                        
-                    # Calculate stock value
-                    variant_price = variant_data.get('variant_price', 0)
-                    variant_data['stock_value'] = variant_price * variant_data.get('current_stock', 0)
-                        
-                    variants.append(variant_data)
+                variants = fetch_records(cursor, 'ReportRow')
                 
                 # Calculate summary statistics
                 total_products = len(products)
@@ -0,0 +1,132 @@
+import threading
+
+from database import DatabaseManager, get_connection, get_read_connection
+from models.records import fetch_records
+
+ALERT_QUERY = """
+    SELECT
+        a.id,
+        a.product_id,
+        a.variant_id,
+        a.alert_type,
+        CASE WHEN a.variant_id IS NULL THEN p.name
+             ELSE p.name || ' - ' || COALESCE(pv.display_name, pv.name)
+        END as name,
+        a.stock,
+        a.threshold,
+        a.created_at,
+        a.resolved_at
+    FROM StockAlerts a
+    JOIN Products p ON p.id = a.product_id
+    LEFT JOIN ProductVariants pv ON pv.id = a.variant_id
+"""
+
+
+class StockAlerts:
+    """Low-stock and reorder alerts.
+
+    The rows are written by the triggers of migrations.STOCK_ALERT_TRIGGERS,
+    in the transaction that moves the stock, whichever code path moved it.
+    Listeners registered with ``subscribe`` receive the new alerts once they
+    are committed: after every database write, a single lookup of the
+    highest alert id tells whether there is anything to deliver.
+    """
+
+    _listeners = []
+    _last_alert_id = 0
+    _lock = threading.Lock()
+
+    @classmethod
+    def subscribe(cls, callback):
+        """Call ``callback(alerts)`` with each batch of new alerts.
+
+        The callback runs on the thread that wrote the stock change.
+        """
+        with cls._lock:
+            if not cls._listeners:
+                conn = get_connection()
+                if conn:
+                    try:
+                        cls._last_alert_id = conn.execute(
+                            "SELECT COALESCE(MAX(id), 0) FROM StockAlerts"
+                        ).fetchone()[0]
+                    finally:
+                        conn.close()
+                DatabaseManager.add_change_listener(cls._check_new_alerts)
+            if callback not in cls._listeners:
+                cls._listeners.append(callback)
+
+    @classmethod
+    def unsubscribe(cls, callback):
+        with cls._lock:
+            if callback in cls._listeners:
+                cls._listeners.remove(callback)
+            if not cls._listeners:
+                DatabaseManager.remove_change_listener(cls._check_new_alerts)
+
+    @classmethod
+    def _check_new_alerts(cls, conn):
+        cursor = conn.cursor()
+        with cls._lock:
+            cursor.execute("SELECT COALESCE(MAX(id), 0) FROM StockAlerts")
+            last_alert_id = cursor.fetchone()[0]
+            if last_alert_id <= cls._last_alert_id:
+                return
+            cursor.execute(
+                ALERT_QUERY + " WHERE a.id > ? AND a.id <= ? ORDER BY a.id",
+                (cls._last_alert_id, last_alert_id)
+            )
+            alerts = fetch_records(cursor, 'StockAlert')
+            cls._last_alert_id = last_alert_id
+            listeners = list(cls._listeners)
+        for callback in listeners:
+            callback(alerts)
+
+    @staticmethod
+    def get_open_alerts(limit=None):
+        """Alerts neither resolved nor acknowledged, newest first"""
+        conn = get_read_connection()
+        if conn:
+            try:
+                cursor = conn.cursor()
+                query = ALERT_QUERY + """
+                    WHERE a.resolved_at IS NULL AND a.acknowledged_at IS NULL
+                    ORDER BY a.id DESC
+                """
+                params = []
+                if limit:
+                    query += " LIMIT ?"
+                    params.append(limit)
+                cursor.execute(query, params)
+                return fetch_records(cursor, 'StockAlert')
+            except Exception as e:
+                print(f"Error getting stock alerts: {e}")
+                return []
+            finally:
+                conn.close()
+        return []
+
+    @staticmethod
+    def acknowledge(alert_ids=None):
+        """Mark alerts as seen (every open alert without ``alert_ids``)"""
+        conn = get_connection()
+        if conn:
+            try:
+                cursor = conn.cursor()
+                query = """
+                    UPDATE StockAlerts SET acknowledged_at = CURRENT_TIMESTAMP
+                    WHERE resolved_at IS NULL AND acknowledged_at IS NULL
+                """
+                if alert_ids is None:
+                    cursor.execute(query)
+                else:
+                    cursor.executemany(query + " AND id = ?", [(alert_id,) for alert_id in alert_ids])
+                conn.commit()
+                return True
+            except Exception as e:
+                conn.rollback()
+                print(f"Error acknowledging stock alerts: {e}")
+                return False
+            finally:
+                conn.close()
+        return False
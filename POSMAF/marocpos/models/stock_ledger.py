@@ -0,0 +1,442 @@
+import logging
+
+from database import get_connection, get_read_connection
+from models.cost_layers import CostLayers
+from models.records import fetch_records
+
+logger = logging.getLogger('marocpos.stock_ledger')
+
+
+class StockLedger:
+    """Append-only stock ledger.
+
+    Every stock change (receipts, adjustments, sales, direct edits of a stock
+    field, cancellations) appends a StockMovements row. Products.stock and
+    ProductVariants.stock are running totals of that ledger, moved in the
+    same transaction, so screens keep reading a single column.
+
+    StockSnapshots records, from time to time, the on-hand quantity of every
+    row that moved, up to a movement id. The quantity at any moment is the
+    latest snapshot before it plus the movements recorded after that
+    snapshot. ``find_drift`` checks the running totals against the ledger.
+    """
+
+    ID_CHUNK_SIZE = 500
+
+    # Notes of the movement recording the stock a row was created with
+    OPENING_NOTES = "Stock initial"
+
+    @staticmethod
+    def _movement_type(movement):
+        if movement.get('movement_type'):
+            return movement['movement_type']
+        return 'in' if movement['quantity'] > 0 else 'out'
+
+    @staticmethod
+    def record_many(cursor, movements, update_stock=True):
+        """Append movements on an open write transaction.
+
+        ``movements`` are dicts with product_id and a signed quantity, and
+        optionally variant_id, movement_type ('in', 'out' or 'adjustment';
+        taken from the sign if missing), unit_price, reference, notes,
+        user_id, sale_id, reversal_of and created_at. Each movement updates
+        the cost layers; outgoing movements record what they consumed in
+        cost_amount. The stock of the product or variant is moved too,
+        unless ``update_stock`` is False because the caller already wrote it.
+
+        Returns one (movement id, cost of the units taken out) per movement.
+        """
+        results = []
+        costs = []
+        variant_updates = {}
+        product_updates = {}
+        for movement in movements:
+            product_id = movement['product_id']
+            variant_id = movement.get('variant_id') or None
+            quantity = movement['quantity']
+            cursor.execute("""
+                INSERT INTO StockMovements (
+                    product_id, variant_id, movement_type,
+                    quantity, unit_price, reference,
+                    notes, user_id, sale_id, reversal_of,
+                    created_at
+                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, COALESCE(?, CURRENT_TIMESTAMP))
+            """, (
+                product_id, variant_id, StockLedger._movement_type(movement),
+                quantity, movement.get('unit_price'), movement.get('reference'),
+                movement.get('notes'), movement.get('user_id'), movement.get('sale_id'),
+                movement.get('reversal_of'), movement.get('created_at')
+            ))
+            movement_id = cursor.lastrowid
+
+            if movement.get('reversal_of'):
+                CostLayers.revert_movement(cursor, movement['reversal_of'], product_id, variant_id, -quantity)
+                cost = 0.0
+            else:
+                cost = CostLayers.apply_movement(
+                    cursor, product_id, variant_id, quantity, movement.get('unit_price'), movement_id
+                )
+                if quantity < 0:
+                    costs.append((cost, movement_id))
+            results.append((movement_id, cost))
+
+            if variant_id:
+                variant_updates[variant_id] = variant_updates.get(variant_id, 0) + quantity
+            else:
+                product_updates[product_id] = product_updates.get(product_id, 0) + quantity
+
+        if costs:
+            cursor.executemany("UPDATE StockMovements SET cost_amount = ? WHERE id = ?", costs)
+        if update_stock:
+            # One statement per distinct stock row
+            if variant_updates:
+                cursor.executemany("""
+                    UPDATE ProductVariants
+                    SET stock = COALESCE(stock, 0) + ?,
+                        updated_at = CURRENT_TIMESTAMP
+                    WHERE id = ?
+                """, [(quantity, variant_id) for variant_id, quantity in variant_updates.items()])
+            if product_updates:
+                cursor.executemany("""
+                    UPDATE Products
+                    SET stock = COALESCE(stock, 0) + ?,
+                        updated_at = CURRENT_TIMESTAMP
+                    WHERE id = ?
+                """, [(quantity, product_id) for product_id, quantity in product_updates.items()])
+        return results
+
+    @staticmethod
+    def record(cursor, product_id, variant_id, quantity, update_stock=True, **fields):
+        """Append one movement (see record_many); returns its id"""
+        movement = dict(fields, product_id=product_id, variant_id=variant_id, quantity=quantity)
+        return StockLedger.record_many(cursor, [movement], update_stock)[0][0]
+
+    @staticmethod
+    def record_query(cursor, query, params=(), **fields):
+        """Append one movement per row of ``query`` on an open write transaction.
+
+        The bulk form of record_many: ``query`` selects product_id,
+        variant_id and a signed quantity, and ``fields`` (movement_type,
+        unit_price, reference, notes, user_id, created_at) apply to every
+        movement. The movements are inserted by a single INSERT ... SELECT
+        and the stock columns moved by one UPDATE per table; only the cost
+        layers are updated movement by movement.
+
+        Returns the new movements as (id, product_id, variant_id, quantity)
+        rows.
+        """
+        cursor.execute("SELECT COALESCE(MAX(id), 0) FROM StockMovements")
+        last_movement_id = cursor.fetchone()[0]
+        cursor.execute(f"""
+            INSERT INTO StockMovements (
+                product_id, variant_id, movement_type,
+                quantity, unit_price, reference,
+                notes, user_id, created_at
+            )
+            SELECT
+                product_id, variant_id,
+                COALESCE(?, CASE WHEN quantity > 0 THEN 'in' ELSE 'out' END),
+                quantity, ?, ?, ?, ?, COALESCE(?, CURRENT_TIMESTAMP)
+            FROM ({query})
+            WHERE quantity <> 0
+        """, (
+            fields.get('movement_type'), fields.get('unit_price'), fields.get('reference'),
+            fields.get('notes'), fields.get('user_id'), fields.get('created_at'),
+            *params
+        ))
+
+        cursor.execute("""
+            SELECT id, product_id, variant_id, quantity FROM StockMovements
+            WHERE id > ?
+            ORDER BY id
+        """, (last_movement_id,))
+        movements = cursor.fetchall()
+        costs = []
+        for movement in movements:
+            cost = CostLayers.apply_movement(
+                cursor, movement['product_id'], movement['variant_id'], movement['quantity'],
+                fields.get('unit_price'), movement['id']
+            )
+            if movement['quantity'] < 0:
+                costs.append((cost, movement['id']))
+        if costs:
+            cursor.executemany("UPDATE StockMovements SET cost_amount = ? WHERE id = ?", costs)
+
+        cursor.execute("""
+            UPDATE Products
+            SET stock = COALESCE(stock, 0) + (
+                    SELECT SUM(m.quantity) FROM StockMovements m
+                    WHERE m.product_id = Products.id AND m.variant_id IS NULL AND m.id > ?
+                ),
+                updated_at = CURRENT_TIMESTAMP
+            WHERE id IN (SELECT product_id FROM StockMovements WHERE id > ? AND variant_id IS NULL)
+        """, (last_movement_id, last_movement_id))
+        cursor.execute("""
+            UPDATE ProductVariants
+            SET stock = COALESCE(stock, 0) + (
+                    SELECT SUM(m.quantity) FROM StockMovements m
+                    WHERE m.product_id = ProductVariants.product_id
+                      AND m.variant_id = ProductVariants.id AND m.id > ?
+                ),
+                updated_at = CURRENT_TIMESTAMP
+            WHERE id IN (SELECT variant_id FROM StockMovements WHERE id > ? AND variant_id IS NOT NULL)
+        """, (last_movement_id, last_movement_id))
+        return movements
+
+    @staticmethod
+    def reverse(cursor, movement_id, user_id=None):
+        """Append the movement cancelling ``movement_id``.
+
+        Returns the new movement, or None if the movement does not exist or
+        was already cancelled.
+        """
+        cursor.execute("""
+            SELECT product_id, variant_id, quantity, unit_price, reference
+            FROM StockMovements
+            WHERE id = ?
+        """, (movement_id,))
+        movement = cursor.fetchone()
+        if movement is None:
+            return None
+        cursor.execute("SELECT 1 FROM StockMovements WHERE reversal_of = ?", (movement_id,))
+        if cursor.fetchone() is not None:
+            return None
+        movement_id = StockLedger.record(
+            cursor, movement['product_id'], movement['variant_id'], -movement['quantity'],
+            movement_type='adjustment',
+            unit_price=movement['unit_price'],
+            reference=movement['reference'],
+            notes=f"Annulation du mouvement #{movement_id}",
+            user_id=user_id,
+            reversal_of=movement_id
+        )
+        return {
+            'id': movement_id,
+            'product_id': movement['product_id'],
+            'variant_id': movement['variant_id'],
+            'quantity': -movement['quantity'],
+        }
+
+    @staticmethod
+    def has_movements(cursor, product_id=None, variant_id=None, include_opening=True):
+        """Whether the ledger holds any movement of a variant, or of a product
+        (its variants included). Without ``include_opening`` the movements
+        of the stock the rows were created with are not counted."""
+        if variant_id:
+            query, params = "SELECT 1 FROM StockMovements WHERE variant_id = ?", [variant_id]
+        else:
+            query, params = "SELECT 1 FROM StockMovements WHERE product_id = ?", [product_id]
+        if not include_opening:
+            query += " AND NOT (movement_type = 'in' AND notes IS ? AND sale_id IS NULL AND reversal_of IS NULL)"
+            params.append(StockLedger.OPENING_NOTES)
+        cursor.execute(query + " LIMIT 1", params)
+        return cursor.fetchone() is not None
+
+    @staticmethod
+    def _chunks(ids):
+        ids = list(ids)
+        for i in range(0, len(ids), StockLedger.ID_CHUNK_SIZE):
+            yield ids[i:i + StockLedger.ID_CHUNK_SIZE]
+
+    @staticmethod
+    def stock_levels(cursor, product_ids=(), variant_ids=()):
+        """Stock columns of products and variants: {(product_id, variant_id): stock}"""
+        levels = {}
+        for chunk in StockLedger._chunks(product_ids):
+            cursor.execute(
+                f"SELECT id, COALESCE(stock, 0) FROM Products WHERE id IN ({', '.join('?' for _ in chunk)})",
+                chunk
+            )
+            levels.update(((row[0], None), row[1]) for row in cursor.fetchall())
+        for chunk in StockLedger._chunks(variant_ids):
+            cursor.execute(
+                f"SELECT product_id, id, COALESCE(stock, 0) FROM ProductVariants WHERE id IN ({', '.join('?' for _ in chunk)})",
+                chunk
+            )
+            levels.update(((row[0], row[1]), row[2]) for row in cursor.fetchall())
+        return levels
+
+    @staticmethod
+    def record_stock_edits(cursor, before, product_ids=(), variant_ids=(), **fields):
+        """Append the movements of stock columns the caller wrote directly.
+
+        ``before`` holds the stock_levels() read before the write ({} for
+        rows just inserted). Each row whose stock changed gets a movement of
+        the difference, 'adjustment' unless ``fields`` say otherwise.
+        """
+        fields.setdefault('movement_type', 'adjustment')
+        movements = [
+            dict(fields, product_id=product_id, variant_id=variant_id, quantity=stock - before.get((product_id, variant_id), 0))
+            for (product_id, variant_id), stock in StockLedger.stock_levels(cursor, product_ids, variant_ids).items()
+            if stock != before.get((product_id, variant_id), 0)
+        ]
+        return StockLedger.record_many(cursor, movements, update_stock=False)
+
+    # ------------------------------------------------------------------
+    # Snapshots
+
+    @staticmethod
+    def on_hand(product_id, variant_id=None, at=None):
+        """Quantity of a product (or variant) from the ledger, now or at ``at``.
+
+        ``at`` is a 'YYYY-MM-DD HH:MM:SS' timestamp. Reads the latest snapshot
+        taken before that moment and the movements recorded after it.
+        """
+        conn = get_read_connection()
+        if conn:
+            try:
+                cursor = conn.cursor()
+                query = """
+                    SELECT quantity, last_movement_id FROM StockSnapshots
+                    WHERE product_id = ? AND variant_id IS ?
+                """
+                params = [product_id, variant_id]
+                if at is not None:
+                    query += " AND created_at <= ?"
+                    params.append(at)
+                cursor.execute(query + " ORDER BY last_movement_id DESC LIMIT 1", params)
+                snapshot = cursor.fetchone()
+                quantity, last_movement_id = (snapshot[0], snapshot[1]) if snapshot else (0, 0)
+
+                query = """
+                    SELECT COALESCE(SUM(quantity), 0) FROM StockMovements
+                    WHERE product_id = ? AND variant_id IS ? AND id > ?
+                """
+                params = [product_id, variant_id, last_movement_id]
+                if at is not None:
+                    query += " AND created_at <= ?"
+                    params.append(at)
+                cursor.execute(query, params)
+                return quantity + cursor.fetchone()[0]
+            except Exception as e:
+                print(f"Error computing stock on hand: {e}")
+                return None
+            finally:
+                conn.close()
+        return None
+
+    @staticmethod
+    def take_snapshot():
+        """Snapshot every stock row that moved since the previous snapshot.
+
+        Returns the number of rows written, or None on error.
+        """
+        conn = get_connection()
+        if conn:
+            try:
+                cursor = conn.cursor()
+                cursor.execute("BEGIN IMMEDIATE")
+                cursor.execute("SELECT COALESCE(MAX(last_movement_id), 0) FROM StockSnapshots")
+                previous = cursor.fetchone()[0]
+                cursor.execute("SELECT COALESCE(MAX(id), 0) FROM StockMovements")
+                last_movement_id = cursor.fetchone()[0]
+                if last_movement_id <= previous:
+                    conn.rollback()
+                    return 0
+
+                # Rows that did not move keep their previous snapshot
+                cursor.execute("""
+                    INSERT INTO StockSnapshots (product_id, variant_id, quantity, last_movement_id)
+                    SELECT
+                        m.product_id, m.variant_id,
+                        COALESCE((
+                            SELECT s.quantity FROM StockSnapshots s
+                            WHERE s.product_id = m.product_id AND s.variant_id IS m.variant_id
+                            ORDER BY s.last_movement_id DESC LIMIT 1
+                        ), 0) + SUM(m.quantity),
+                        ?
+                    FROM StockMovements m
+                    WHERE m.id > ? AND m.id <= ?
+                    GROUP BY m.product_id, m.variant_id
+                """, (last_movement_id, previous, last_movement_id))
+                count = cursor.rowcount
+                conn.commit()
+                return count
+            except Exception as e:
+                conn.rollback()
+                print(f"Error taking stock snapshot: {e}")
+                return None
+            finally:
+                conn.close()
+        return None
+
+    # ------------------------------------------------------------------
+    # Reconciliation
+
+    # On-hand quantity of every row from the ledger: latest snapshot plus the
+    # movements recorded since the last snapshot run
+    LEDGER_QUERY = """
+        SELECT product_id, variant_id, SUM(quantity) as quantity FROM (
+            SELECT product_id, variant_id, quantity FROM (
+                SELECT product_id, variant_id, quantity,
+                       ROW_NUMBER() OVER (
+                           PARTITION BY product_id, variant_id
+                           ORDER BY last_movement_id DESC
+                       ) as position
+                FROM StockSnapshots
+            ) WHERE position = 1
+            UNION ALL
+            SELECT product_id, variant_id, quantity FROM StockMovements
+            WHERE id > (SELECT COALESCE(MAX(last_movement_id), 0) FROM StockSnapshots)
+        )
+        GROUP BY product_id, variant_id
+    """
+
+    @staticmethod
+    def find_drift():
+        """Stock rows whose stock column disagrees with the ledger.
+
+        Returns records with product_id, variant_id, name, recorded_stock
+        (the column) and ledger_stock, or None on error.
+        """
+        conn = get_read_connection()
+        if conn:
+            try:
+                cursor = conn.cursor()
+                cursor.execute(f"""
+                    WITH ledger AS ({StockLedger.LEDGER_QUERY})
+                    SELECT
+                        p.id as product_id,
+                        NULL as variant_id,
+                        p.name as name,
+                        COALESCE(p.stock, 0) as recorded_stock,
+                        COALESCE(l.quantity, 0) as ledger_stock
+                    FROM Products p
+                    LEFT JOIN ledger l ON l.product_id = p.id AND l.variant_id IS NULL
+                    WHERE COALESCE(p.stock, 0) <> COALESCE(l.quantity, 0)
+                    UNION ALL
+                    SELECT
+                        pv.product_id,
+                        pv.id,
+                        p.name || ' - ' || COALESCE(pv.display_name, pv.name),
+                        COALESCE(pv.stock, 0),
+                        COALESCE(l.quantity, 0)
+                    FROM ProductVariants pv
+                    JOIN Products p ON p.id = pv.product_id
+                    LEFT JOIN ledger l ON l.variant_id = pv.id
+                    WHERE COALESCE(pv.stock, 0) <> COALESCE(l.quantity, 0)
+                """)
+                return fetch_records(cursor, 'DriftRow')
+            except Exception as e:
+                print(f"Error checking stock drift: {e}")
+                return None
+            finally:
+                conn.close()
+        return None
+
+    @staticmethod
+    def run_maintenance():
+        """Background job: snapshot the rows that moved, then check for drift.
+
+        Drifting rows are logged as warnings and returned (see find_drift)
+        for the caller to show.
+        """
+        StockLedger.take_snapshot()
+        drift = StockLedger.find_drift() or []
+        for row in drift:
+            logger.warning(
+                "Stock drift: %s (product %s, variant %s): stock %s, ledger %s",
+                row['name'], row['product_id'], row['variant_id'],
+                row['recorded_stock'], row['ledger_stock']
+            )
+        return drift
@@ -0,0 +1,334 @@
+from database import get_connection, get_read_connection
+from models.catalog import ProductCatalog
+from models.records import fetch_records
+from models.stock_ledger import StockLedger
+
+# Stock a count row expects: the stock column now, minus whatever the ledger
+# recorded for that row after it was counted (sales, receipts...). Counting
+# freezes nothing, so a sale made after a row was counted is kept. ``{row}``
+# is the name (or alias) of the StockTakeCounts row.
+EXPECTED_QUANTITY_SQL = """
+    COALESCE(
+        CASE WHEN {row}.variant_id IS NULL
+             THEN (SELECT stock FROM Products WHERE id = {row}.product_id)
+             ELSE (SELECT stock FROM ProductVariants WHERE id = {row}.variant_id)
+        END, 0
+    ) - (
+        SELECT COALESCE(SUM(m.quantity), 0) FROM StockMovements m
+        WHERE m.product_id = {row}.product_id AND m.variant_id IS {row}.variant_id
+          AND m.id > {row}.last_movement_id
+    )
+"""
+
+
+class StockTake:
+    """Physical inventory sessions.
+
+    Counts are staged in StockTakeCounts, one row per product or variant,
+    while the shop keeps selling. Each count remembers the last ledger
+    movement at the time it was entered, so closing the session compares it
+    with the stock of that moment, not with the stock at closing time: the
+    difference is appended to the ledger as an 'adjustment' and the sales
+    made since the count stay deducted.
+
+    Closing is set-based: the expected quantities are computed by one UPDATE
+    and the adjustments written by StockLedger.record_query, whatever the
+    number of counted rows.
+    """
+
+    @staticmethod
+    def start(name=None, category_id=None, notes=None, user_id=None):
+        """Open a stock-take session; returns its id or None"""
+        conn = get_connection()
+        if conn:
+            try:
+                cursor = conn.cursor()
+                cursor.execute("""
+                    INSERT INTO StockTakes (name, category_id, notes, user_id)
+                    VALUES (?, ?, ?, ?)
+                """, (name, category_id, notes, user_id))
+                conn.commit()
+                return cursor.lastrowid
+            except Exception as e:
+                conn.rollback()
+                print(f"Error starting stock take: {e}")
+                return None
+            finally:
+                conn.close()
+        return None
+
+    @staticmethod
+    def get(stock_take_id):
+        conn = get_read_connection()
+        if conn:
+            try:
+                cursor = conn.cursor()
+                cursor.execute("SELECT * FROM StockTakes WHERE id = ?", (stock_take_id,))
+                records = fetch_records(cursor, 'StockTake')
+                return records[0] if records else None
+            except Exception as e:
+                print(f"Error getting stock take: {e}")
+                return None
+            finally:
+                conn.close()
+        return None
+
+    @staticmethod
+    def get_open():
+        """The most recent open session, or None"""
+        conn = get_read_connection()
+        if conn:
+            try:
+                cursor = conn.cursor()
+                cursor.execute("""
+                    SELECT * FROM StockTakes
+                    WHERE status = 'open'
+                    ORDER BY id DESC
+                    LIMIT 1
+                """)
+                records = fetch_records(cursor, 'StockTake')
+                return records[0] if records else None
+            except Exception as e:
+                print(f"Error getting open stock take: {e}")
+                return None
+            finally:
+                conn.close()
+        return None
+
+    @staticmethod
+    def record_counts(stock_take_id, counts, replace=False, user_id=None):
+        """Stage a batch of counts in one transaction.
+
+        ``counts`` are (product_id, variant_id, quantity) tuples. Scans add
+        to the row's count; with ``replace`` the quantity is the full count
+        of the row. Either way the row is dated at the current end of the
+        ledger. Returns True on success.
+        """
+        if not counts:
+            return True
+        conn = get_connection()
+        if conn:
+            try:
+                cursor = conn.cursor()
+                cursor.execute("BEGIN IMMEDIATE")
+                cursor.execute("SELECT status FROM StockTakes WHERE id = ?", (stock_take_id,))
+                row = cursor.fetchone()
+                if row is None or row[0] != 'open':
+                    raise ValueError(f"Inventaire #{stock_take_id} n'est pas ouvert")
+                cursor.execute("SELECT COALESCE(MAX(id), 0) FROM StockMovements")
+                last_movement_id = cursor.fetchone()[0]
+                cursor.executemany(f"""
+                    INSERT INTO StockTakeCounts (
+                        stock_take_id, product_id, variant_id,
+                        counted_quantity, last_movement_id, user_id
+                    ) VALUES (?, ?, ?, ?, ?, ?)
+                    ON CONFLICT (stock_take_id, product_id, COALESCE(variant_id, 0)) DO UPDATE SET
+                        counted_quantity = {'' if replace else 'counted_quantity + '}excluded.counted_quantity,
+                        last_movement_id = excluded.last_movement_id,
+                        user_id = excluded.user_id,
+                        counted_at = CURRENT_TIMESTAMP
+                """, [
+                    (stock_take_id, product_id, variant_id or None, quantity, last_movement_id, user_id)
+                    for product_id, variant_id, quantity in counts
+                ])
+                conn.commit()
+                return True
+            except Exception as e:
+                conn.rollback()
+                print(f"Error recording stock take counts: {e}")
+                return False
+            finally:
+                conn.close()
+        return False
+
+    @staticmethod
+    def get_counts(stock_take_id, limit=None):
+        """Counts of a session, latest first, with the stock each one expects.
+
+        Returns records with id, product_id, variant_id, name, barcode,
+        counted_quantity, expected_quantity, difference and counted_at.
+        """
+        conn = get_read_connection()
+        if conn:
+            try:
+                cursor = conn.cursor()
+                expected = EXPECTED_QUANTITY_SQL.format(row='c')
+                query = f"""
+                    SELECT
+                        c.id,
+                        c.product_id,
+                        c.variant_id,
+                        CASE WHEN c.variant_id IS NULL THEN p.name
+                             ELSE p.name || ' - ' || COALESCE(pv.display_name, pv.name)
+                        END as name,
+                        COALESCE(pv.barcode, p.barcode) as barcode,
+                        c.counted_quantity,
+                        c.expected_quantity,
+                        c.counted_quantity - c.expected_quantity as difference,
+                        c.counted_at
+                    FROM (
+                        SELECT
+                            c.id, c.product_id, c.variant_id, c.counted_quantity, c.counted_at,
+                            COALESCE(c.expected_quantity, {expected}) as expected_quantity
+                        FROM StockTakeCounts c
+                        WHERE c.stock_take_id = ?
+                    ) c
+                    JOIN Products p ON p.id = c.product_id
+                    LEFT JOIN ProductVariants pv ON pv.id = c.variant_id
+                    ORDER BY c.counted_at DESC, c.id DESC
+                """
+                params = [stock_take_id]
+                if limit:
+                    query += " LIMIT ?"
+                    params.append(limit)
+                cursor.execute(query, params)
+                return fetch_records(cursor, 'StockTakeCount')
+            except Exception as e:
+                print(f"Error getting stock take counts: {e}")
+                return []
+            finally:
+                conn.close()
+        return []
+
+    @staticmethod
+    def get_summary(stock_take_id):
+        """Totals of a session: counted rows, rows off, units over and short"""
+        conn = get_read_connection()
+        if conn:
+            try:
+                cursor = conn.cursor()
+                cursor.execute(f"""
+                    SELECT
+                        COUNT(*) as counted_rows,
+                        COALESCE(SUM(difference <> 0), 0) as adjusted_rows,
+                        COALESCE(SUM(CASE WHEN difference > 0 THEN difference END), 0) as surplus,
+                        COALESCE(-SUM(CASE WHEN difference < 0 THEN difference END), 0) as shortage
+                    FROM (
+                        SELECT c.counted_quantity - COALESCE(c.expected_quantity, {EXPECTED_QUANTITY_SQL.format(row='c')}) as difference
+                        FROM StockTakeCounts c
+                        WHERE c.stock_take_id = ?
+                    )
+                """, (stock_take_id,))
+                return dict(cursor.fetchone())
+            except Exception as e:
+                print(f"Error summarizing stock take: {e}")
+                return None
+            finally:
+                conn.close()
+        return None
+
+    @staticmethod
+    def close(stock_take_id, user_id=None, zero_uncounted=False):
+        """Apply a session's differences to the stock and close it.
+
+        With ``zero_uncounted`` every stock row of the session's scope
+        (its category, or the whole catalogue) that holds stock but was not
+        counted is counted as zero. Returns a dict with counted_rows,
+        adjusted_rows and net (units added, negative when removed), or None.
+        """
+        conn = get_connection()
+        if conn:
+            try:
+                cursor = conn.cursor()
+                cursor.execute("BEGIN IMMEDIATE")
+                cursor.execute("SELECT status, category_id FROM StockTakes WHERE id = ?", (stock_take_id,))
+                session = cursor.fetchone()
+                if session is None or session['status'] != 'open':
+                    raise ValueError(f"Inventaire #{stock_take_id} n'est pas ouvert")
+                cursor.execute("SELECT COALESCE(MAX(id), 0) FROM StockMovements")
+                last_movement_id = cursor.fetchone()[0]
+
+                if zero_uncounted:
+                    scope = "" if session['category_id'] is None else "AND p.category_id = :category_id"
+                    params = {
+                        'stock_take_id': stock_take_id,
+                        'category_id': session['category_id'],
+                        'last_movement_id': last_movement_id,
+                    }
+                    cursor.execute(f"""
+                        INSERT INTO StockTakeCounts (stock_take_id, product_id, variant_id, counted_quantity, last_movement_id)
+                        SELECT :stock_take_id, p.id, NULL, 0, :last_movement_id
+                        FROM Products p
+                        WHERE COALESCE(p.stock, 0) <> 0 {scope}
+                          AND NOT EXISTS (SELECT 1 FROM ProductVariants pv WHERE pv.product_id = p.id)
+                          AND NOT EXISTS (
+                              SELECT 1 FROM StockTakeCounts c
+                              WHERE c.stock_take_id = :stock_take_id AND c.product_id = p.id
+                                AND COALESCE(c.variant_id, 0) = 0
+                          )
+                    """, params)
+                    cursor.execute(f"""
+                        INSERT INTO StockTakeCounts (stock_take_id, product_id, variant_id, counted_quantity, last_movement_id)
+                        SELECT :stock_take_id, pv.product_id, pv.id, 0, :last_movement_id
+                        FROM ProductVariants pv
+                        JOIN Products p ON p.id = pv.product_id
+                        WHERE COALESCE(pv.stock, 0) <> 0 {scope}
+                          AND NOT EXISTS (
+                              SELECT 1 FROM StockTakeCounts c
+                              WHERE c.stock_take_id = :stock_take_id AND c.product_id = pv.product_id
+                                AND COALESCE(c.variant_id, 0) = pv.id
+                          )
+                    """, params)
+
+                # Freeze what each count expected; the adjustments are the differences
+                cursor.execute(f"""
+                    UPDATE StockTakeCounts
+                    SET expected_quantity = {EXPECTED_QUANTITY_SQL.format(row='StockTakeCounts')}
+                    WHERE stock_take_id = ?
+                """, (stock_take_id,))
+                movements = StockLedger.record_query(cursor, """
+                    SELECT product_id, variant_id, counted_quantity - expected_quantity as quantity
+                    FROM StockTakeCounts
+                    WHERE stock_take_id = ?
+                    ORDER BY id
+                """, (stock_take_id,),
+                    movement_type='adjustment',
+                    reference=f"Inventaire #{stock_take_id}",
+                    user_id=user_id
+                )
+
+                cursor.execute("""
+                    UPDATE StockTakes
+                    SET status = 'closed', closed_at = CURRENT_TIMESTAMP
+                    WHERE id = ?
+                """, (stock_take_id,))
+                cursor.execute("SELECT COUNT(*) FROM StockTakeCounts WHERE stock_take_id = ?", (stock_take_id,))
+                counted_rows = cursor.fetchone()[0]
+                conn.commit()
+
+                for movement in movements:
+                    ProductCatalog.adjust_stock(movement['product_id'], movement['variant_id'], movement['quantity'])
+                return {
+                    'counted_rows': counted_rows,
+                    'adjusted_rows': len(movements),
+                    'net': sum(movement['quantity'] for movement in movements),
+                }
+            except Exception as e:
+                conn.rollback()
+                print(f"Error closing stock take: {e}")
+                return None
+            finally:
+                conn.close()
+        return None
+
+    @staticmethod
+    def cancel(stock_take_id):
+        """Abandon an open session without touching the stock"""
+        conn = get_connection()
+        if conn:
+            try:
+                cursor = conn.cursor()
+                cursor.execute("""
+                    UPDATE StockTakes
+                    SET status = 'cancelled', closed_at = CURRENT_TIMESTAMP
+                    WHERE id = ? AND status = 'open'
+                """, (stock_take_id,))
+                conn.commit()
+                return cursor.rowcount > 0
+            except Exception as e:
+                conn.rollback()
+                print(f"Error cancelling stock take: {e}")
+                return False
+            finally:
+                conn.close()
+        return False
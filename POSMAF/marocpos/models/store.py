@@ -8,30 +8,6 @@ class Store:
         self.email = email
         self.active = active
 
-    @staticmethod
-    def create_table():
-        """Create the Stores table if it doesn't exist."""
-        conn = get_connection()
-        if conn:
-            try:
-                cursor = conn.cursor()
-                cursor.execute("""
-                    CREATE TABLE IF NOT EXISTS Stores (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        name TEXT NOT NULL UNIQUE,
-                        address TEXT,
-                        phone TEXT,
-                        email TEXT,
-                        active INTEGER NOT NULL DEFAULT 1,
-                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                    );
-                """)
-                conn.commit()
-            except Exception as e:
-                print(f"Error creating Stores table: {e}")
-            finally:
-                conn.close()
-
     @staticmethod
     def get_all_stores():
         """Fetch all stores from the database."""
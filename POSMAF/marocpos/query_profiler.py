@@ -0,0 +1,182 @@
+import logging
+import os
+import re
+import sqlite3
+import sys
+import threading
+import time
+from functools import lru_cache
+from logging.handlers import RotatingFileHandler
+
+# Upper bounds (ms) of the latency histogram buckets; the last bucket is open
+HISTOGRAM_BOUNDS_MS = (1, 5, 10, 50, 100, 500, 1000)
+
+_COMMENT_RE = re.compile(r"--[^\n]*|/\*.*?\*/", re.DOTALL)
+_STRING_RE = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_RE = re.compile(r"\b\d+(?:\.\d+)?\b")
+_PARAM_LIST_RE = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_SPACE_RE = re.compile(r"\s+")
+
+# Frames from these modules are skipped when attributing a slow statement
+_INTERNAL_MODULES = {__name__, 'database'}
+
+
+@lru_cache(maxsize=1024)
+def fingerprint(sql):
+    """Normalize SQL text so statements differing only by literals group together."""
+    text = _COMMENT_RE.sub(" ", sql)
+    text = _STRING_RE.sub("?", text)
+    text = _NUMBER_RE.sub("?", text)
+    text = _PARAM_LIST_RE.sub("(?+)", text)
+    return _SPACE_RE.sub(" ", text).strip()
+
+
+def _caller():
+    """Return 'module.function' of the first frame outside the database layer."""
+    frame = sys._getframe(2)
+    while frame is not None:
+        module = frame.f_globals.get('__name__', '')
+        if module not in _INTERNAL_MODULES:
+            return f"{module}.{frame.f_code.co_name}"
+        frame = frame.f_back
+    return "?"
+
+
+class QueryProfiler:
+    """Process-wide statement timing, grouped by SQL fingerprint.
+
+    Profiling is off by default. While it is off, the connection pool opens
+    plain sqlite3 connections, so the only cost is a flag check when a
+    connection is opened.
+    """
+    enabled = False
+    slow_threshold_ms = 100.0
+    log_path = None
+
+    _lock = threading.Lock()
+    _stats = {}
+    _logger = None
+
+    @classmethod
+    def configure(cls, enabled=True, slow_threshold_ms=None, log_path=None):
+        cls.enabled = enabled
+        if slow_threshold_ms is not None:
+            cls.slow_threshold_ms = float(slow_threshold_ms)
+        if log_path is not None and log_path != cls.log_path:
+            cls.log_path = log_path
+            cls._logger = None
+
+    @classmethod
+    def _slow_logger(cls):
+        if cls._logger is None:
+            logger = logging.getLogger('marocpos.slow_queries')
+            logger.setLevel(logging.INFO)
+            logger.propagate = False
+            for handler in list(logger.handlers):
+                logger.removeHandler(handler)
+                handler.close()
+            os.makedirs(os.path.dirname(cls.log_path), exist_ok=True)
+            handler = RotatingFileHandler(cls.log_path, maxBytes=1_000_000, backupCount=5, encoding='utf-8')
+            handler.setFormatter(logging.Formatter("%(asctime)s %(message)s"))
+            logger.addHandler(handler)
+            cls._logger = logger
+        return cls._logger
+
+    @classmethod
+    def record(cls, sql, elapsed):
+        """Account one statement execution of ``elapsed`` seconds."""
+        key = fingerprint(sql)
+        elapsed_ms = elapsed * 1000.0
+        bucket = len(HISTOGRAM_BOUNDS_MS)
+        for i, bound in enumerate(HISTOGRAM_BOUNDS_MS):
+            if elapsed_ms <= bound:
+                bucket = i
+                break
+
+        with cls._lock:
+            entry = cls._stats.get(key)
+            if entry is None:
+                entry = cls._stats[key] = {
+                    'count': 0,
+                    'total_ms': 0.0,
+                    'max_ms': 0.0,
+                    'histogram': [0] * (len(HISTOGRAM_BOUNDS_MS) + 1),
+                }
+            entry['count'] += 1
+            entry['total_ms'] += elapsed_ms
+            if elapsed_ms > entry['max_ms']:
+                entry['max_ms'] = elapsed_ms
+            entry['histogram'][bucket] += 1
+
+        if elapsed_ms >= cls.slow_threshold_ms and cls.log_path:
+            try:
+                cls._slow_logger().info("%.1f ms [%s] %s", elapsed_ms, _caller(), key)
+            except OSError as e:
+                print(f"Error writing slow query log: {e}")
+
+    @classmethod
+    def snapshot(cls):
+        """Return per-fingerprint statistics, slowest total first."""
+        with cls._lock:
+            rows = [
+                {
+                    'sql': key,
+                    'count': entry['count'],
+                    'total_ms': entry['total_ms'],
+                    'avg_ms': entry['total_ms'] / entry['count'],
+                    'max_ms': entry['max_ms'],
+                    'histogram': dict(zip(
+                        [f"<={b}ms" for b in HISTOGRAM_BOUNDS_MS] + [f">{HISTOGRAM_BOUNDS_MS[-1]}ms"],
+                        entry['histogram']
+                    )),
+                }
+                for key, entry in cls._stats.items()
+            ]
+        rows.sort(key=lambda row: row['total_ms'], reverse=True)
+        return rows
+
+    @classmethod
+    def reset(cls):
+        with cls._lock:
+            cls._stats.clear()
+
+
+class ProfiledCursor(sqlite3.Cursor):
+    """Cursor that reports the duration of every statement to QueryProfiler."""
+
+    def execute(self, sql, parameters=()):
+        start = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            QueryProfiler.record(sql, time.perf_counter() - start)
+
+    def executemany(self, sql, seq_of_parameters):
+        start = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            QueryProfiler.record(sql, time.perf_counter() - start)
+
+    def executescript(self, sql_script):
+        start = time.perf_counter()
+        try:
+            return super().executescript(sql_script)
+        finally:
+            QueryProfiler.record(sql_script, time.perf_counter() - start)
+
+
+class ProfiledConnection(sqlite3.Connection):
+    """Connection whose cursors (and execute shortcuts) are ProfiledCursor."""
+
+    def cursor(self, factory=ProfiledCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def executescript(self, sql_script):
+        return self.cursor().executescript(sql_script)
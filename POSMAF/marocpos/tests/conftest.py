@@ -0,0 +1,17 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database  # noqa: E402
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    """A freshly migrated database in a temporary directory"""
+    monkeypatch.setattr(database.DatabaseManager, 'DB_PATH', str(tmp_path / 'pos.db'))
+    assert database.initialize_database()
+    yield
+    database.DatabaseManager.close_all_connections()
@@ -0,0 +1,37 @@
+from database import get_connection
+from models.checkout import CheckoutService
+from models.product import Product
+
+
+def count(query, params=()):
+    conn = get_connection()
+    try:
+        return conn.execute(query, params).fetchone()[0]
+    finally:
+        conn.close()
+
+
+def test_product_with_only_opening_stock_can_be_deleted(db):
+    product_id = Product.add_product("Erreur", unit_price=10, purchase_price=4, stock=5)
+
+    assert not Product.has_history(product_id)
+    assert Product.delete_product(product_id)
+    assert count("SELECT COUNT(*) FROM StockMovements WHERE product_id = ?", (product_id,)) == 0
+    assert count("SELECT COUNT(*) FROM StockCostLayers WHERE product_id = ?", (product_id,)) == 0
+
+
+def test_variant_with_only_opening_stock_can_be_deleted(db):
+    product_id = Product.add_product("Tee", unit_price=10)
+    variant_id = Product.add_variant(product_id, {'Taille': 'M'}, stock=3)
+
+    assert not Product.has_history(variant_id=variant_id)
+    assert Product.delete_variant(variant_id)
+
+
+def test_sold_product_is_kept(db):
+    product_id = Product.add_product("Vendu", unit_price=10, purchase_price=4, stock=5)
+    CheckoutService.checkout(1, [{'product_id': product_id, 'quantity': 1, 'unit_price': 10}])
+
+    assert Product.has_history(product_id)
+    assert not Product.delete_product(product_id)
+    assert count("SELECT COUNT(*) FROM StockMovements WHERE product_id = ?", (product_id,)) == 2
@@ -0,0 +1,29 @@
+from database import get_connection
+from models.product import Product
+from models.product_attribute import ProductAttribute
+
+
+def test_variant_price_includes_value_extras(db):
+    product_id = Product.add_product("T-shirt", unit_price=80)
+    attribute_id = ProductAttribute.add_attribute("Couleur")
+    red = ProductAttribute.add_attribute_value(attribute_id, "Rouge")
+    blue = ProductAttribute.add_attribute_value(attribute_id, "Bleu")
+    line_id = ProductAttribute.associate_attribute_to_product(product_id, attribute_id)
+    ProductAttribute.add_attribute_value_to_line(line_id, red, price_extra=20)
+    ProductAttribute.add_attribute_value_to_line(line_id, blue)
+
+    variant_ids = ProductAttribute.create_variants(product_id, [
+        {'name': "Rouge", 'price': 100, 'attributes': {'Couleur': "Rouge"}},
+        {'name': "Bleu", 'price': 90, 'attributes': {'Couleur': "Bleu"}},
+    ])
+
+    conn = get_connection()
+    try:
+        rows = conn.execute(
+            "SELECT id, unit_price, effective_price FROM ProductVariants ORDER BY id"
+        ).fetchall()
+    finally:
+        conn.close()
+    assert [row['id'] for row in rows] == variant_ids
+    for row in rows:
+        assert row['effective_price'] == row['unit_price']
@@ -141,6 +141,14 @@ class AddProductDialog(QDialog):
         attr_group.setLayout(attr_layout)
         variant_frame_layout.addWidget(attr_group)
         
+        # Dynamic mode: variants are composed at the till and stored when first sold or stocked
+        self.dynamic_variants = QCheckBox("Variantes dynamiques (créées à la première vente ou entrée en stock)")
+        self.dynamic_variants.setToolTip(
+            "Pour les produits avec beaucoup de combinaisons: seules les combinaisons "
+            "vendues ou stockées sont enregistrées."
+        )
+        variant_frame_layout.addWidget(self.dynamic_variants)
+        
         # Variant management section
         variant_mgmt_layout = QHBoxLayout()
         
@@ -437,6 +445,7 @@ class AddProductDialog(QDialog):
             # Variants
             has_variants = self.product.get('has_variants', False)
             self.has_variants.setChecked(has_variants)
+            self.dynamic_variants.setChecked(bool(self.product.get('dynamic_variants')))
             
             # Variant attributes
             if has_variants and self.product.get('variant_attributes'):
@@ -527,6 +536,7 @@ class AddProductDialog(QDialog):
             'category_id': self.category_combo.currentData(),
             'image_path': self.image_path,
             'has_variants': self.has_variants.isChecked(),
+            'dynamic_variants': self.has_variants.isChecked() and self.dynamic_variants.isChecked(),
             'variant_attributes': json.dumps(selected_attrs) if selected_attrs else None
         }
         
@@ -3,16 +3,27 @@ from PyQt5.QtWidgets import (
     QFrame, QGridLayout, QSizePolicy, QMainWindow, QAction,
     QMenu, QMessageBox, QDialog
 )
-from PyQt5.QtCore import Qt, QSize
+from PyQt5.QtCore import Qt, QSize, QTimer
 from PyQt5.QtGui import QIcon, QPixmap, QFont
+from models.stock_ledger import StockLedger
+from models.stock_alerts import StockAlerts
+from .db_worker import run_in_background
+from .stock_alert_notifier import StockAlertNotifier
 import os
 import sys
 
 class DashboardWindow(QMainWindow):
+    # Stock snapshot and drift check, shortly after start-up then hourly
+    STOCK_MAINTENANCE_DELAY = 30 * 1000
+    STOCK_MAINTENANCE_INTERVAL = 60 * 60 * 1000
+
     def __init__(self, user=None):
         super().__init__()
         self.user = user
+        self.stock_alerts = []
         self.init_ui()
+        self.start_stock_maintenance()
+        self.start_stock_alerts()
         
     def init_ui(self):
         self.setWindowTitle("MarocPOS - Tableau de Bord")
@@ -37,7 +48,81 @@ class DashboardWindow(QMainWindow):
         
         # Status bar info
         self.statusBar().showMessage(f"Connecté en tant que: {self.user['username'] if self.user else 'Invité'}")
+
+    def start_stock_maintenance(self):
+        """Run the stock ledger job in the background at regular intervals"""
+        self.stock_maintenance_timer = QTimer(self)
+        self.stock_maintenance_timer.setInterval(self.STOCK_MAINTENANCE_INTERVAL)
+        self.stock_maintenance_timer.timeout.connect(self.run_stock_maintenance)
+        self.stock_maintenance_timer.start()
+        QTimer.singleShot(self.STOCK_MAINTENANCE_DELAY, self.run_stock_maintenance)
+
+    def run_stock_maintenance(self):
+        run_in_background(
+            StockLedger.run_maintenance,
+            on_result=self.show_stock_drift,
+            key=(id(self), 'stock_maintenance'),
+        )
+
+    def show_stock_drift(self, drift):
+        """Flag stock columns that disagree with the stock ledger"""
+        if drift:
+            self.statusBar().showMessage(
+                f"⚠️ {len(drift)} écart(s) entre le stock et le registre des mouvements détecté(s)"
+            )
         
+    def start_stock_alerts(self):
+        """Show the open stock alerts and follow new ones as they are raised"""
+        self.stock_alerts_button = QPushButton()
+        self.stock_alerts_button.setFlat(True)
+        self.stock_alerts_button.setStyleSheet("color: #dc3545; font-weight: bold;")
+        self.stock_alerts_button.clicked.connect(self.show_stock_alerts)
+        self.stock_alerts_button.hide()
+        self.statusBar().addPermanentWidget(self.stock_alerts_button)
+        StockAlertNotifier.instance().alerts_raised.connect(self.on_stock_alerts_raised)
+        self.refresh_stock_alerts()
+
+    def refresh_stock_alerts(self):
+        run_in_background(
+            StockAlerts.get_open_alerts,
+            on_result=self.set_stock_alerts,
+            key=(id(self), 'stock_alerts'),
+        )
+
+    def set_stock_alerts(self, alerts):
+        self.stock_alerts = alerts
+        self.stock_alerts_button.setText(f"🔔 {len(alerts)} alerte(s) de stock")
+        self.stock_alerts_button.setVisible(bool(alerts))
+
+    def on_stock_alerts_raised(self, alerts):
+        self.statusBar().showMessage(self.stock_alert_text(alerts[-1]))
+        self.refresh_stock_alerts()
+
+    def stock_alert_text(self, alert):
+        if alert['alert_type'] == 'reorder':
+            return f"🛒 À commander: {alert['name']} ({alert['stock']:g} ≤ {alert['threshold']:g})"
+        return f"⚠️ Stock bas: {alert['name']} ({alert['stock']:g} ≤ {alert['threshold']:g})"
+
+    def show_stock_alerts(self):
+        """List the open stock alerts and let the user mark them as read"""
+        alerts = StockAlerts.get_open_alerts()
+        self.set_stock_alerts(alerts)
+        if not alerts:
+            return
+        lines = [self.stock_alert_text(alert) for alert in alerts[:20]]
+        if len(alerts) > 20:
+            lines.append(f"... et {len(alerts) - 20} autre(s)")
+
+        box = QMessageBox(self)
+        box.setWindowTitle("Alertes de stock")
+        box.setText("\n".join(lines))
+        acknowledge_btn = box.addButton("Marquer comme lues", QMessageBox.AcceptRole)
+        box.addButton(QMessageBox.Close)
+        box.exec_()
+        if box.clickedButton() == acknowledge_btn:
+            StockAlerts.acknowledge([alert['id'] for alert in alerts])
+            self.refresh_stock_alerts()
+
     def create_header(self):
         header_frame = QFrame()
         header_frame.setStyleSheet("""
@@ -140,6 +225,13 @@ class DashboardWindow(QMainWindow):
                 "color": "#20c997",
                 "description": "Rapports et statistiques",
                 "callback": self.open_reports
+            },
+            {
+                "title": "Inventaire",
+                "icon": "icons/inventory.png",
+                "color": "#795548",
+                "description": "Comptage physique du stock",
+                "callback": self.open_stock_take
             }
         ]
         
@@ -291,3 +383,11 @@ class DashboardWindow(QMainWindow):
             self.reports_window.show()
         except Exception as e:
             QMessageBox.warning(self, "Erreur", f"Erreur lors de l'ouverture des rapports: {str(e)}")
+
+    def open_stock_take(self):
+        try:
+            from .stock_take_dialog import StockTakeDialog
+            self.stock_take_dialog = StockTakeDialog(self.user, self)
+            self.stock_take_dialog.show()
+        except Exception as e:
+            QMessageBox.warning(self, "Erreur", f"Erreur lors de l'ouverture de l'inventaire: {str(e)}")
@@ -0,0 +1,136 @@
+import itertools
+import threading
+from concurrent.futures import ThreadPoolExecutor, CancelledError
+
+from PyQt5.QtCore import QObject, pyqtSignal
+from PyQt5.QtWidgets import QApplication
+
+from database import DatabaseManager
+
+
+class DbWorker(QObject):
+    """Runs model calls off the GUI thread.
+
+    Each worker thread draws its own connection from the per-thread pool, so
+    model methods can be submitted unchanged. Results come back through Qt
+    signals and are handed to the callbacks on the GUI thread.
+
+    Requests submitted with a ``key`` replace any earlier request with the
+    same key: the earlier one is cancelled if it has not started yet, and its
+    result is dropped if it has. This keeps fast category taps or date range
+    changes from painting stale data.
+    """
+    MAX_WORKERS = 2
+
+    # (request id, result) / (request id, error message); emitted from worker threads
+    finished = pyqtSignal(int, object)
+    failed = pyqtSignal(int, str)
+
+    _instance = None
+
+    def __init__(self, max_workers=MAX_WORKERS):
+        super().__init__()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="marocpos-db")
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._pending = {}   # request id -> (future, on_result, on_error, key)
+        self._latest = {}    # key -> request id
+        self.finished.connect(self._deliver_result)
+        self.failed.connect(self._deliver_error)
+
+    @classmethod
+    def instance(cls):
+        """Return the process-wide worker, created on first use."""
+        if cls._instance is None:
+            cls._instance = cls()
+            app = QApplication.instance()
+            if app is not None:
+                app.aboutToQuit.connect(cls._instance.shutdown)
+        return cls._instance
+
+    def submit(self, func, *args, on_result=None, on_error=None, key=None, **kwargs):
+        """Queue ``func(*args, **kwargs)`` and return (request id, Future).
+
+        ``on_result(result)`` and ``on_error(message)`` run on the GUI thread.
+        """
+        request_id = next(self._ids)
+        with self._lock:
+            if key is not None:
+                previous = self._latest.get(key)
+                if previous is not None:
+                    self._cancel_locked(previous)
+                self._latest[key] = request_id
+            future = self._executor.submit(self._run, request_id, func, args, kwargs)
+            self._pending[request_id] = (future, on_result, on_error, key)
+        return request_id, future
+
+    def cancel(self, request_id):
+        """Cancel a request; its callbacks will not be called."""
+        with self._lock:
+            self._cancel_locked(request_id)
+
+    def cancel_key(self, key):
+        """Cancel the outstanding request registered under ``key``, if any."""
+        with self._lock:
+            request_id = self._latest.get(key)
+            if request_id is not None:
+                self._cancel_locked(request_id)
+
+    def _cancel_locked(self, request_id):
+        entry = self._pending.pop(request_id, None)
+        if entry is None:
+            return
+        future, _, _, key = entry
+        future.cancel()
+        if key is not None and self._latest.get(key) == request_id:
+            del self._latest[key]
+
+    def _run(self, request_id, func, args, kwargs):
+        # Worker thread: skip work that became stale while queued
+        with self._lock:
+            if request_id not in self._pending:
+                raise CancelledError()
+        try:
+            result = func(*args, **kwargs)
+        except Exception as e:
+            print(f"Erreur de requête en arrière-plan ({getattr(func, '__qualname__', func)}): {e}")
+            self.failed.emit(request_id, str(e))
+            raise
+        self.finished.emit(request_id, result)
+        return result
+
+    def _take(self, request_id):
+        with self._lock:
+            entry = self._pending.pop(request_id, None)
+            if entry is not None and entry[3] is not None and self._latest.get(entry[3]) == request_id:
+                del self._latest[entry[3]]
+        return entry
+
+    def _deliver_result(self, request_id, result):
+        entry = self._take(request_id)
+        if entry is not None and entry[1] is not None:
+            entry[1](result)
+
+    def _deliver_error(self, request_id, message):
+        entry = self._take(request_id)
+        if entry is not None and entry[2] is not None:
+            entry[2](message)
+
+    def shutdown(self):
+        """Drop queued requests and release the worker threads' connections."""
+        with self._lock:
+            for future, _, _, _ in self._pending.values():
+                future.cancel()
+            self._pending.clear()
+            self._latest.clear()
+        self._executor.shutdown(wait=True, cancel_futures=True)
+        DatabaseManager.close_all_connections()
+        if DbWorker._instance is self:
+            DbWorker._instance = None
+
+
+def run_in_background(func, *args, on_result=None, on_error=None, key=None, **kwargs):
+    """Shortcut for ``DbWorker.instance().submit(...)``."""
+    return DbWorker.instance().submit(
+        func, *args, on_result=on_result, on_error=on_error, key=key, **kwargs
+    )
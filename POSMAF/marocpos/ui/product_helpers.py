@@ -1,6 +1,8 @@
 from PyQt5.QtWidgets import QMessageBox
 from models.product import Product
 from models.category import Category
+from models.catalog import parse_json_attributes, SHARED_PRODUCT_COLUMNS
+from models.records import fetch_records
 from database import get_connection
 import json
 import traceback
@@ -37,27 +39,16 @@ def get_all_products_reliable():
                 ORDER BY p.name
             """)
             
-            rows = cursor.fetchall()
+            rows = fetch_records(cursor, 'ProductRow', SHARED_PRODUCT_COLUMNS)
             products = []
             
             for row in rows:
                 try:
-                    product_dict = dict(row)
+                    # Parse variant attributes if present (decoded once per distinct text)
+                    if row.get('variant_attributes'):
+                        row['variant_attributes'] = parse_json_attributes(row['variant_attributes']) or []
                     
-                    # Parse variant attributes if present
-                    if product_dict.get('variant_attributes'):
-                        try:
-                            if isinstance(product_dict['variant_attributes'], str):
-                                product_dict['variant_attributes'] = json.loads(product_dict['variant_attributes'])
-                            # Validate it's iterable
-                            if product_dict['variant_attributes'] is not None:
-                                if not isinstance(product_dict['variant_attributes'], (list, dict)):
-                                    product_dict['variant_attributes'] = []
-                        except Exception as e:
-                            debug_log(f"Error parsing variant attributes for product {product_dict.get('id')}: {e}")
-                            product_dict['variant_attributes'] = []
-                    
-                    products.append(product_dict)
+                    products.append(row)
                 except Exception as e:
                     debug_log(f"Error processing product row: {e}")
                     debug_log(f"Row data: {row}")
@@ -99,27 +90,16 @@ def get_products_by_category_reliable(category_id):
                 ORDER BY p.name
             """, (category_id,))
             
-            rows = cursor.fetchall()
+            rows = fetch_records(cursor, 'ProductRow', SHARED_PRODUCT_COLUMNS)
             products = []
             
             for row in rows:
                 try:
-                    product_dict = dict(row)
-                    
-                    # Parse variant attributes if present
-                    if product_dict.get('variant_attributes'):
-                        try:
-                            if isinstance(product_dict['variant_attributes'], str):
-                                product_dict['variant_attributes'] = json.loads(product_dict['variant_attributes'])
-                            # Validate it's iterable
-                            if product_dict['variant_attributes'] is not None:
-                                if not isinstance(product_dict['variant_attributes'], (list, dict)):
-                                    product_dict['variant_attributes'] = []
-                        except Exception as e:
-                            debug_log(f"Error parsing variant attributes for product {product_dict.get('id')}: {e}")
-                            product_dict['variant_attributes'] = []
+                    # Parse variant attributes if present (decoded once per distinct text)
+                    if row.get('variant_attributes'):
+                        row['variant_attributes'] = parse_json_attributes(row['variant_attributes']) or []
                     
-                    products.append(product_dict)
+                    products.append(row)
                 except Exception as e:
                     debug_log(f"Error processing product row: {e}")
                     debug_log(f"Row data: {row}")
@@ -260,18 +240,9 @@ def get_product_by_id(product_id):
             try:
                 product_dict = dict(row)
                 
-                # Parse variant attributes if present
+                # Parse variant attributes if present (decoded once per distinct text)
                 if product_dict.get('variant_attributes'):
-                    try:
-                        if isinstance(product_dict['variant_attributes'], str):
-                            product_dict['variant_attributes'] = json.loads(product_dict['variant_attributes'])
-                        # Validate it's iterable
-                        if product_dict['variant_attributes'] is not None:
-                            if not isinstance(product_dict['variant_attributes'], (list, dict)):
-                                product_dict['variant_attributes'] = []
-                    except Exception as e:
-                        debug_log(f"Error parsing variant attributes for product {product_id}: {e}")
-                        product_dict['variant_attributes'] = []
+                    product_dict['variant_attributes'] = parse_json_attributes(product_dict['variant_attributes']) or []
                 
                 debug_log(f"Successfully retrieved product {product_id}")
                 return product_dict
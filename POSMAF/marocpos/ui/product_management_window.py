@@ -1,14 +1,14 @@
 from PyQt5.QtWidgets import (
-    QWidget, QVBoxLayout, QHBoxLayout, QTableWidget, QTableWidgetItem, 
+    QWidget, QVBoxLayout, QHBoxLayout, QTableView, QAbstractItemView,
     QPushButton, QLabel, QHeaderView, QMessageBox, QComboBox, QLineEdit,
-    QSpinBox, QDoubleSpinBox, QFrame, QCheckBox, QDialog
+    QSpinBox, QDoubleSpinBox, QFrame, QCheckBox, QDialog, QMenu
 )
-from PyQt5.QtCore import Qt
-from PyQt5.QtGui import QPixmap
+from PyQt5.QtCore import Qt, QTimer
 from models.product import Product
+from models.product_attribute import ProductAttribute
 from models.category import Category
+from ui.product_table_model import ProductTableModel
 import json
-import os
 
 class ProductManagementWindow(QWidget):
     def __init__(self):
@@ -32,11 +32,21 @@ class ProductManagementWindow(QWidget):
         self.search_input = QLineEdit()
         self.search_input.setPlaceholderText("Nom de produit, code-barres...")
         self.search_input.textChanged.connect(self.filter_products)
+
+        # Run the search once typing pauses rather than on every keystroke
+        self.search_timer = QTimer(self)
+        self.search_timer.setSingleShot(True)
+        self.search_timer.setInterval(200)
+        self.search_timer.timeout.connect(self.apply_filter)
         
         # Category filter
         category_label = QLabel("Catégorie:")
         self.category_filter = QComboBox()
         self.category_filter.currentIndexChanged.connect(self.filter_products)
+
+        # Low stock filter
+        self.low_stock_filter = QCheckBox("Stock bas")
+        self.low_stock_filter.toggled.connect(self.filter_products)
         
         # Add New Product button
         add_product_btn = QPushButton("+ Ajouter un produit")
@@ -59,47 +69,72 @@ class ProductManagementWindow(QWidget):
         top_layout.addWidget(self.search_input)
         top_layout.addWidget(category_label)
         top_layout.addWidget(self.category_filter)
+        top_layout.addWidget(self.low_stock_filter)
         top_layout.addStretch()
         top_layout.addWidget(add_product_btn)
         
         main_layout.addLayout(top_layout)
 
-        # Products table
-        self.products_table = QTableWidget()
-        self.products_table.setColumnCount(12)
-        self.products_table.setHorizontalHeaderLabels([
-            "ID", "Image", "Code-barres", "Nom", "Prix vente", "Prix achat", 
-            "Stock", "Stock min", "Catégorie", "Variantes", "Marge", "Actions"
-        ])
+        # Products table: rows are fetched page by page as the user scrolls
+        self.products_model = ProductTableModel(self)
+        self.products_model.modelReset.connect(self.update_count_label)
+        self.products_model.rowsInserted.connect(self.update_count_label)
+
+        self.products_table = QTableView()
+        self.products_table.setModel(self.products_model)
+        self.products_table.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.products_table.setSelectionMode(QAbstractItemView.SingleSelection)
+        self.products_table.setContextMenuPolicy(Qt.CustomContextMenu)
+        self.products_table.customContextMenuRequested.connect(self.show_product_menu)
+        self.products_table.doubleClicked.connect(lambda index: self.edit_product(self.products_model.product(index.row())))
+        self.products_table.selectionModel().selectionChanged.connect(self.update_action_buttons)
+
+        # Fixed row heights: the view never measures rows it does not paint
+        vertical_header = self.products_table.verticalHeader()
+        vertical_header.setSectionResizeMode(QHeaderView.Fixed)
+        vertical_header.setDefaultSectionSize(44)
+        vertical_header.hide()
 
         # Set column widths
-        self.products_table.horizontalHeader().setSectionResizeMode(0, QHeaderView.Fixed)
-        self.products_table.horizontalHeader().setSectionResizeMode(1, QHeaderView.Fixed)
-        self.products_table.horizontalHeader().setSectionResizeMode(2, QHeaderView.Fixed)
-        self.products_table.horizontalHeader().setSectionResizeMode(3, QHeaderView.Stretch)
-        self.products_table.horizontalHeader().setSectionResizeMode(4, QHeaderView.Fixed)
-        self.products_table.horizontalHeader().setSectionResizeMode(5, QHeaderView.Fixed)
-        self.products_table.horizontalHeader().setSectionResizeMode(6, QHeaderView.Fixed)
-        self.products_table.horizontalHeader().setSectionResizeMode(7, QHeaderView.Fixed)
-        self.products_table.horizontalHeader().setSectionResizeMode(8, QHeaderView.Fixed)
-        self.products_table.horizontalHeader().setSectionResizeMode(9, QHeaderView.Fixed)
-        self.products_table.horizontalHeader().setSectionResizeMode(10, QHeaderView.Fixed)
-        self.products_table.horizontalHeader().setSectionResizeMode(11, QHeaderView.Fixed)
-        
-        self.products_table.setColumnWidth(0, 50)  # ID
-        self.products_table.setColumnWidth(1, 70)  # Image
-        self.products_table.setColumnWidth(2, 100) # Barcode
-        # Column 3 (Name) is set to stretch
-        self.products_table.setColumnWidth(4, 80)  # Sell price
-        self.products_table.setColumnWidth(5, 80)  # Purchase price
-        self.products_table.setColumnWidth(6, 60)  # Stock
-        self.products_table.setColumnWidth(7, 60)  # Min stock
-        self.products_table.setColumnWidth(8, 120) # Category
-        self.products_table.setColumnWidth(9, 120) # Variants
-        self.products_table.setColumnWidth(10, 80) # Margin
-        self.products_table.setColumnWidth(11, 180) # Actions
+        header = self.products_table.horizontalHeader()
+        header.setSectionResizeMode(QHeaderView.Fixed)
+        header.setSectionResizeMode(ProductTableModel.COL_NAME, QHeaderView.Stretch)
+
+        self.products_table.setColumnWidth(ProductTableModel.COL_ID, 50)
+        self.products_table.setColumnWidth(ProductTableModel.COL_IMAGE, 70)
+        self.products_table.setColumnWidth(ProductTableModel.COL_BARCODE, 100)
+        # Name column is set to stretch
+        self.products_table.setColumnWidth(ProductTableModel.COL_PRICE, 80)
+        self.products_table.setColumnWidth(ProductTableModel.COL_COST, 80)
+        self.products_table.setColumnWidth(ProductTableModel.COL_STOCK, 60)
+        self.products_table.setColumnWidth(ProductTableModel.COL_MIN_STOCK, 60)
+        self.products_table.setColumnWidth(ProductTableModel.COL_CATEGORY, 120)
+        self.products_table.setColumnWidth(ProductTableModel.COL_VARIANTS, 120)
+        self.products_table.setColumnWidth(ProductTableModel.COL_MARGIN, 80)
         
         main_layout.addWidget(self.products_table)
+
+        # Actions on the selected product
+        actions_layout = QHBoxLayout()
+
+        self.count_label = QLabel()
+        actions_layout.addWidget(self.count_label)
+        actions_layout.addStretch()
+
+        self.edit_btn = QPushButton("✏️ Modifier")
+        self.edit_btn.clicked.connect(lambda: self.edit_product(self.selected_product()))
+        self.delete_btn = QPushButton("🗑️ Supprimer")
+        self.delete_btn.clicked.connect(lambda: self.delete_product(self.selected_product()['id']))
+        self.stock_btn = QPushButton("📦 Gérer le stock")
+        self.stock_btn.clicked.connect(lambda: self.manage_stock(self.selected_product()))
+        self.variants_btn = QPushButton("🔄 Gérer les variantes")
+        self.variants_btn.clicked.connect(lambda: self.manage_variants(self.selected_product()))
+
+        for button in (self.edit_btn, self.delete_btn, self.stock_btn, self.variants_btn):
+            actions_layout.addWidget(button)
+
+        main_layout.addLayout(actions_layout)
+        self.update_action_buttons()
         
         # Load categories for the filter
         self.load_categories()
@@ -113,212 +148,67 @@ class ProductManagementWindow(QWidget):
         for category in categories:
             self.category_filter.addItem(category[1], category[0])
 
-    def load_products(self, category_id=None):
-        """Load products from database"""
+    def load_products(self):
+        """Reload the list with the current search and filters"""
         try:
-            # Clear table
-            self.products_table.setRowCount(0)
-            
-            # Get products using raw SQL for maximum reliability
-            from database import get_connection
-            conn = get_connection()
-            if not conn:
-                QMessageBox.critical(self, "Erreur", "Impossible de se connecter à la base de données")
-                return
-                
-            try:
-                cursor = conn.cursor()
-                
-                if category_id:
-                    cursor.execute("""
-                        SELECT 
-                            p.id, p.barcode, p.name, p.unit_price, p.purchase_price,
-                            p.stock, p.min_stock, p.category_id, c.name as category_name,
-                            p.image_path, p.has_variants, p.variant_attributes, p.description
-                        FROM Products p
-                        LEFT JOIN Categories c ON p.category_id = c.id
-                        WHERE p.category_id = ?
-                        ORDER BY p.name
-                    """, (category_id,))
-                else:
-                    cursor.execute("""
-                        SELECT 
-                            p.id, p.barcode, p.name, p.unit_price, p.purchase_price,
-                            p.stock, p.min_stock, p.category_id, c.name as category_name,
-                            p.image_path, p.has_variants, p.variant_attributes, p.description
-                        FROM Products p
-                        LEFT JOIN Categories c ON p.category_id = c.id
-                        ORDER BY p.name
-                    """)
-                
-                products = []
-                columns = [column[0] for column in cursor.description]
-                for row in cursor.fetchall():
-                    product_dict = dict(zip(columns, row))
-                    products.append(product_dict)
-                
-                conn.close()
-            except Exception as e:
-                print(f"Database error: {e}")
-                if conn:
-                    conn.close()
-                QMessageBox.critical(self, "Erreur", f"Erreur de base de données: {str(e)}")
-                return
-            
-            print(f"Chargement de {len(products)} produits")
-            
-            # Set row count
-            self.products_table.setRowCount(len(products))
-            
-            # Fill table with product data
-            for row, product in enumerate(products):
-                # ID column
-                id_item = QTableWidgetItem(str(product['id']))
-                id_item.setData(Qt.UserRole, product['id'])
-                self.products_table.setItem(row, 0, id_item)
-                
-                # Image column
-                image_item = QTableWidgetItem()
-                self.products_table.setItem(row, 1, image_item)
-                if product['image_path'] and os.path.exists(product['image_path']):
-                    pixmap = QPixmap(product['image_path']).scaled(40, 40, Qt.KeepAspectRatio, Qt.SmoothTransformation)
-                    image_label = QLabel()
-                    image_label.setPixmap(pixmap)
-                    image_label.setAlignment(Qt.AlignCenter)
-                    self.products_table.setCellWidget(row, 1, image_label)
-                
-                # Barcode column
-                barcode_item = QTableWidgetItem(str(product['barcode'] or ''))
-                self.products_table.setItem(row, 2, barcode_item)
-                
-                # Name column
-                name_item = QTableWidgetItem(product['name'])
-                self.products_table.setItem(row, 3, name_item)
-                
-                # Selling price column
-                sell_price = float(product['unit_price'] or 0)
-                sell_item = QTableWidgetItem(f"{sell_price:.2f} MAD")
-                sell_item.setTextAlignment(Qt.AlignRight | Qt.AlignVCenter)
-                self.products_table.setItem(row, 4, sell_item)
-                
-                # Purchase price column
-                purchase_price = float(product['purchase_price'] or 0)
-                purchase_item = QTableWidgetItem(f"{purchase_price:.2f} MAD")
-                purchase_item.setTextAlignment(Qt.AlignRight | Qt.AlignVCenter)
-                self.products_table.setItem(row, 5, purchase_item)
-                
-                # Stock column
-                stock = int(product['stock'] or 0)
-                stock_item = QTableWidgetItem(str(stock))
-                stock_item.setTextAlignment(Qt.AlignCenter)
-                
-                # Set color based on stock level
-                min_stock = int(product['min_stock'] or 0)
-                if stock <= min_stock:
-                    stock_item.setForeground(Qt.red)
-                self.products_table.setItem(row, 6, stock_item)
-                
-                # Min stock column
-                min_stock_item = QTableWidgetItem(str(min_stock))
-                min_stock_item.setTextAlignment(Qt.AlignCenter)
-                self.products_table.setItem(row, 7, min_stock_item)
-                
-                # Category column
-                category_name = product['category_name'] or 'Non catégorisé'
-                category_item = QTableWidgetItem(category_name)
-                self.products_table.setItem(row, 8, category_item)
-                
-                # Variants column
-                has_variants = bool(product['has_variants'])
-                variant_text = "Oui" if has_variants else "Non"
-                variant_item = QTableWidgetItem(variant_text)
-                variant_item.setTextAlignment(Qt.AlignCenter)
-                self.products_table.setItem(row, 9, variant_item)
-                
-                # Margin column
-                if purchase_price > 0:
-                    margin = ((sell_price - purchase_price) / purchase_price) * 100
-                    margin_item = QTableWidgetItem(f"{margin:.1f}%")
-                else:
-                    margin_item = QTableWidgetItem("N/A")
-                margin_item.setTextAlignment(Qt.AlignRight | Qt.AlignVCenter)
-                self.products_table.setItem(row, 10, margin_item)
-                
-                # Actions column - create a widget with buttons
-                actions_widget = QWidget()
-                actions_layout = QHBoxLayout(actions_widget)
-                actions_layout.setContentsMargins(2, 2, 2, 2)
-                actions_layout.setSpacing(2)
-                
-                # Edit button
-                edit_btn = QPushButton("✏️")
-                edit_btn.setToolTip("Modifier")
-                edit_btn.setFixedSize(40, 25)
-                edit_btn.clicked.connect(lambda checked, p=product: self.edit_product(p))
-                
-                # Delete button
-                delete_btn = QPushButton("🗑️")
-                delete_btn.setToolTip("Supprimer")
-                delete_btn.setFixedSize(40, 25)
-                delete_btn.clicked.connect(lambda checked, pid=product['id']: self.delete_product(pid))
-                
-                # Stock management button
-                stock_btn = QPushButton("📦")
-                stock_btn.setToolTip("Gérer le stock")
-                stock_btn.setFixedSize(40, 25)
-                stock_btn.clicked.connect(lambda checked, p=product: self.manage_stock(p))
-                
-                actions_layout.addWidget(edit_btn)
-                actions_layout.addWidget(delete_btn)
-                actions_layout.addWidget(stock_btn)
-                
-                # Add variant button if product has variants
-                if has_variants:
-                    variant_btn = QPushButton("🔄")
-                    variant_btn.setToolTip("Gérer les variantes")
-                    variant_btn.setFixedSize(40, 25)
-                    variant_btn.clicked.connect(lambda checked, p=product: self.manage_variants(p))
-                    actions_layout.addWidget(variant_btn)
-                
-                self.products_table.setCellWidget(row, 11, actions_widget)
-                
+            search_text = self.search_input.text().strip()
+            category_id = self.category_filter.currentData()
+            low_stock = self.low_stock_filter.isChecked()
+
+            if search_text:
+                products = Product.search_products(search_text, category_id)
+                if low_stock:
+                    products = [p for p in products if int(p['stock'] or 0) <= int(p['min_stock'] or 0)]
+                self.products_model.set_products(products)
+            else:
+                # Only the first page is read; the view fetches the rest on scroll
+                self.products_model.set_filters(category_id=category_id, low_stock=low_stock)
+
         except Exception as e:
             import traceback
             print(f"Error loading products: {e}")
             print(traceback.format_exc())
             QMessageBox.critical(self, "Erreur", f"Erreur lors du chargement des produits: {str(e)}")
 
+    def update_count_label(self):
+        count = self.products_model.rowCount()
+        suffix = "+" if self.products_model.has_more() else ""
+        self.count_label.setText(f"{count}{suffix} produit(s) affiché(s)")
+
+    def selected_product(self):
+        rows = self.products_table.selectionModel().selectedRows()
+        if not rows:
+            return None
+        return self.products_model.product(rows[0].row())
+
+    def update_action_buttons(self, *args):
+        product = self.selected_product()
+        for button in (self.edit_btn, self.delete_btn, self.stock_btn):
+            button.setEnabled(product is not None)
+        self.variants_btn.setEnabled(product is not None and bool(product['has_variants']))
+
+    def show_product_menu(self, position):
+        """Context menu with the actions of the product under the cursor"""
+        index = self.products_table.indexAt(position)
+        product = self.products_model.product(index.row()) if index.isValid() else None
+        if product is None:
+            return
+
+        menu = QMenu(self)
+        menu.addAction("✏️ Modifier", lambda: self.edit_product(product))
+        menu.addAction("🗑️ Supprimer", lambda: self.delete_product(product['id']))
+        menu.addAction("📦 Gérer le stock", lambda: self.manage_stock(product))
+        if product['has_variants']:
+            menu.addAction("🔄 Gérer les variantes", lambda: self.manage_variants(product))
+        menu.exec_(self.products_table.viewport().mapToGlobal(position))
+
     def filter_products(self):
         """Filter products based on search text and category"""
-        search_text = self.search_input.text().lower()
-        category_id = self.category_filter.currentData()
-        
-        if category_id:
-            # Filter by category first, then by search text
-            self.load_products(category_id)
-            
-            # Then filter by search text
-            for row in range(self.products_table.rowCount()):
-                found = False
-                for col in [2, 3]:  # barcode and name columns
-                    item = self.products_table.item(row, col)
-                    if item and search_text in item.text().lower():
-                        found = True
-                        break
-                self.products_table.setRowHidden(row, not found)
-        else:
-            # Load all products and filter by search text
-            self.load_products()
-            
-            # Then filter by search text
-            for row in range(self.products_table.rowCount()):
-                found = False
-                for col in [2, 3]:  # barcode and name columns
-                    item = self.products_table.item(row, col)
-                    if item and search_text in item.text().lower():
-                        found = True
-                        break
-                self.products_table.setRowHidden(row, not found)
+        self.search_timer.start()
+
+    def apply_filter(self):
+        """Query the search index (or a page of the category) and show the matches"""
+        self.load_products()
 
     def add_product(self):
         """Open add product dialog"""
@@ -379,7 +269,25 @@ class ProductManagementWindow(QWidget):
             handle_error(self, "Erreur d'édition", "Impossible de modifier le produit", e)
 
     def delete_product(self, product_id):
-        """Delete a product"""
+        """Delete a product, or archive it once it has sales or stock history"""
+        if Product.has_history(product_id):
+            reply = QMessageBox.question(
+                self, 'Archiver le produit',
+                "Ce produit a des ventes ou des mouvements de stock: il ne peut pas être "
+                "supprimé sans perdre cet historique.\n\n"
+                "Voulez-vous l'archiver? Il n'apparaîtra plus à la caisse ni dans la liste "
+                "des produits, mais ses ventes et ses mouvements de stock sont conservés.",
+                QMessageBox.Yes | QMessageBox.No,
+                QMessageBox.No
+            )
+            if reply == QMessageBox.Yes:
+                if Product.archive_product(product_id):
+                    self.load_products()
+                    QMessageBox.information(self, "Succès", "Produit archivé avec succès!")
+                else:
+                    QMessageBox.warning(self, "Erreur", "Erreur lors de l'archivage du produit.")
+            return
+
         reply = QMessageBox.question(
             self, 'Confirmation',
             'Êtes-vous sûr de vouloir supprimer ce produit? Cette action est irréversible.',
@@ -454,9 +362,15 @@ class ProductManagementWindow(QWidget):
                     # Update the product in the database
                     Product.update_product(product['id'], **update_data)
                     
-                    # Update the variants
-                    # Here we would need to add code to update/delete existing variants
-                    # For now we'll just show a success message
+                    # Save the newly generated variants in chunked bulk inserts;
+                    # existing ones were already saved from the dialog
+                    new_variants = [variant for variant in variants_data if not variant.get('id')]
+                    if new_variants and ProductAttribute.create_variants(product['id'], new_variants) is None:
+                        QMessageBox.warning(
+                            self,
+                            "Erreur",
+                            "Erreur lors de l'enregistrement des nouvelles variantes."
+                        )
                     self.load_products()
                     QMessageBox.information(
                         self,
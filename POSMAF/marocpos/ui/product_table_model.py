@@ -0,0 +1,169 @@
+import os
+
+from PyQt5.QtCore import Qt, QAbstractTableModel, QModelIndex
+from PyQt5.QtGui import QColor, QPixmap, QPixmapCache
+
+from models.product import Product
+
+
+class ProductTableModel(QAbstractTableModel):
+    """Product list of ProductManagementWindow, loaded page by page.
+
+    Rows come from Product.get_products_page: the first page is read when the
+    filters are set, and the view asks for the next one (fetchMore) as the
+    user scrolls to the end. Opening the screen therefore reads one page
+    whatever the size of the catalogue. Thumbnails are scaled when a row is
+    first painted and kept in QPixmapCache.
+    """
+    (COL_ID, COL_IMAGE, COL_BARCODE, COL_NAME, COL_PRICE, COL_COST,
+     COL_STOCK, COL_MIN_STOCK, COL_CATEGORY, COL_VARIANTS, COL_MARGIN) = range(11)
+    HEADERS = [
+        "ID", "Image", "Code-barres", "Nom", "Prix vente", "Prix achat",
+        "Stock", "Stock min", "Catégorie", "Variantes", "Marge"
+    ]
+
+    THUMBNAIL_SIZE = 40
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.products = []
+        self._filters = {}
+        self._cursor = None
+        self._exhausted = True
+        self._missing_images = set()
+
+    # ------------------------------------------------------------------
+    # Loading
+
+    def set_filters(self, category_id=None, status=None, low_stock=False):
+        """Restart the listing with new filters and load its first page"""
+        self.beginResetModel()
+        self.products = []
+        self._filters = {'category_id': category_id, 'status': status, 'low_stock': low_stock}
+        self._cursor = None
+        self._exhausted = False
+        self.endResetModel()
+        self.fetchMore(QModelIndex())
+
+    def set_products(self, products):
+        """Show a fixed list (search results); nothing more is fetched"""
+        self.beginResetModel()
+        self.products = list(products)
+        self._exhausted = True
+        self.endResetModel()
+
+    def reload(self):
+        """Reload from the first page with the current filters"""
+        if self._filters:
+            self.set_filters(**self._filters)
+
+    def has_more(self):
+        return not self._exhausted
+
+    def canFetchMore(self, parent=QModelIndex()):
+        return not parent.isValid() and not self._exhausted
+
+    def fetchMore(self, parent=QModelIndex()):
+        if parent.isValid() or self._exhausted:
+            return
+        page, self._cursor = Product.get_products_page(after=self._cursor, **self._filters)
+        self._exhausted = self._cursor is None
+        if page:
+            first = len(self.products)
+            self.beginInsertRows(QModelIndex(), first, first + len(page) - 1)
+            self.products.extend(page)
+            self.endInsertRows()
+
+    def product(self, row):
+        if 0 <= row < len(self.products):
+            return self.products[row]
+        return None
+
+    # ------------------------------------------------------------------
+    # Qt model interface
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.products)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.HEADERS)
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and orientation == Qt.Horizontal:
+            return self.HEADERS[section]
+        return None
+
+    def flags(self, index):
+        if not index.isValid():
+            return Qt.NoItemFlags
+        return Qt.ItemIsEnabled | Qt.ItemIsSelectable
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        product = self.products[index.row()]
+        column = index.column()
+
+        if role == Qt.DisplayRole:
+            if column == self.COL_ID:
+                return str(product['id'])
+            if column == self.COL_BARCODE:
+                return str(product['barcode'] or '')
+            if column == self.COL_NAME:
+                return product['name']
+            if column == self.COL_PRICE:
+                return f"{float(product['unit_price'] or 0):.2f} MAD"
+            if column == self.COL_COST:
+                return f"{float(product['purchase_price'] or 0):.2f} MAD"
+            if column == self.COL_STOCK:
+                return str(int(product['stock'] or 0))
+            if column == self.COL_MIN_STOCK:
+                return str(int(product['min_stock'] or 0))
+            if column == self.COL_CATEGORY:
+                return product['category_name'] or 'Non catégorisé'
+            if column == self.COL_VARIANTS:
+                return "Oui" if product['has_variants'] else "Non"
+            if column == self.COL_MARGIN:
+                purchase_price = float(product['purchase_price'] or 0)
+                if purchase_price > 0:
+                    sell_price = float(product['unit_price'] or 0)
+                    return f"{(sell_price - purchase_price) / purchase_price * 100:.1f}%"
+                return "N/A"
+            return None
+
+        if role == Qt.DecorationRole and column == self.COL_IMAGE:
+            return self.thumbnail(product['image_path'])
+
+        if role == Qt.UserRole and column == self.COL_ID:
+            return product['id']
+
+        if role == Qt.ForegroundRole and column == self.COL_STOCK:
+            if int(product['stock'] or 0) <= int(product['min_stock'] or 0):
+                return QColor(Qt.red)
+            return None
+
+        if role == Qt.TextAlignmentRole:
+            if column in (self.COL_PRICE, self.COL_COST, self.COL_MARGIN):
+                return int(Qt.AlignRight | Qt.AlignVCenter)
+            if column in (self.COL_IMAGE, self.COL_STOCK, self.COL_MIN_STOCK, self.COL_VARIANTS):
+                return int(Qt.AlignCenter)
+        return None
+
+    def thumbnail(self, image_path):
+        """Scaled product image, loaded the first time its row is painted"""
+        if not image_path or image_path in self._missing_images:
+            return None
+        key = f"product-thumbnail:{image_path}"
+        pixmap = QPixmapCache.find(key)
+        if pixmap is None or pixmap.isNull():
+            if not os.path.exists(image_path):
+                self._missing_images.add(image_path)
+                return None
+            pixmap = QPixmap(image_path).scaled(
+                self.THUMBNAIL_SIZE, self.THUMBNAIL_SIZE, Qt.KeepAspectRatio, Qt.SmoothTransformation
+            )
+            if pixmap.isNull():
+                self._missing_images.add(image_path)
+                return None
+            QPixmapCache.insert(key, pixmap)
+        return pixmap
@@ -6,6 +6,7 @@ from PyQt5.QtCore import Qt
 from PyQt5.QtGui import QPixmap, QPainter, QFont
 from PyQt5.QtPrintSupport import QPrintDialog, QPrinter
 from models.sales import Sales
+from models.records import fetch_records
 from database import get_connection
 import os
 from datetime import datetime
@@ -62,7 +63,7 @@ class ReceiptGenerator:
                     JOIN Products p ON si.product_id = p.id
                     WHERE si.sale_id = ?
                 """, (self.sale_id,))
-                self.items = [dict(item) for item in cursor.fetchall()]
+                self.items = fetch_records(cursor, 'SaleItemRow')
                 
             except Exception as e:
                 print(f"Error loading sale data: {e}")
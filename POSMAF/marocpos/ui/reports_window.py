@@ -8,6 +8,8 @@ from PyQt5.QtCore import Qt, QDate
 from PyQt5.QtGui import QColor
 from models.sales_report import SalesReport
 from models.payment import Payment
+from database import DatabaseManager
+from .db_worker import run_in_background
 import json
 from datetime import datetime, timedelta
 
@@ -545,14 +547,8 @@ class ReportsWindow(QMainWindow):
             start_date = self.start_date.date().toString("yyyy-MM-dd")
             end_date = self.end_date.date().toString("yyyy-MM-dd")
             
-            # Load sales report
-            self.load_sales_report(start_date, end_date)
-            
-            # Load inventory report
-            self.load_inventory_report()
-            
-            # Load payment analysis
-            self.load_payment_analysis(start_date, end_date)
+            # Load sales, inventory and payment reports
+            self.load_reports(start_date, end_date)
             
             # Update product analysis if a product is selected
             if hasattr(self, 'selected_product_id') and self.selected_product_id:
@@ -561,12 +557,39 @@ class ReportsWindow(QMainWindow):
         except Exception as e:
             QMessageBox.warning(self, "Erreur", f"Erreur lors du chargement des rapports: {str(e)}")
     
-    def load_sales_report(self, start_date, end_date):
-        """Load sales report data"""
+    def report_error(self, message):
+        """Show a background report query failure"""
+        QMessageBox.warning(self, "Erreur", f"Erreur lors du chargement des rapports: {message}")
+
+    @staticmethod
+    def collect_reports(start_date, end_date):
+        """Compute the sales, inventory and payment reports from one snapshot"""
+        with DatabaseManager.report_snapshot():
+            return (
+                SalesReport.get_sales_range(start_date, end_date),
+                SalesReport.get_inventory_report(),
+                Payment.get_payment_summary(start_date, end_date),
+            )
+
+    def load_reports(self, start_date, end_date):
+        """Load the report tabs in the background"""
+        run_in_background(
+            ReportsWindow.collect_reports, start_date, end_date,
+            on_result=self.show_reports,
+            on_error=self.report_error,
+            key=(id(self), 'reports'),
+        )
+
+    def show_reports(self, reports):
+        """Fill the sales, inventory and payment tabs"""
+        sales_data, inventory_data, payment_data = reports
+        self.show_sales_report(sales_data)
+        self.show_inventory_report(inventory_data)
+        self.show_payment_analysis(payment_data)
+
+    def show_sales_report(self, report_data):
+        """Fill the sales tab from a get_sales_range() result"""
         try:
-            # Get sales report data
-            report_data = SalesReport.get_sales_range(start_date, end_date)
-            
             if not report_data:
                 return
                 
@@ -643,14 +666,11 @@ class ReportsWindow(QMainWindow):
             
         except Exception as e:
             print(f"Error loading sales report: {e}")
-            raise
+            self.report_error(str(e))
     
-    def load_inventory_report(self):
-        """Load inventory report data"""
+    def show_inventory_report(self, report_data):
+        """Fill the inventory tab from a get_inventory_report() result"""
         try:
-            # Get inventory report data
-            report_data = SalesReport.get_inventory_report()
-            
             if not report_data:
                 return
                 
@@ -736,14 +756,11 @@ class ReportsWindow(QMainWindow):
                 
         except Exception as e:
             print(f"Error loading inventory report: {e}")
-            raise
+            self.report_error(str(e))
     
-    def load_payment_analysis(self, start_date, end_date):
-        """Load payment analysis data"""
+    def show_payment_analysis(self, payment_data):
+        """Fill the payments tab from a get_payment_summary() result"""
         try:
-            # Get payment summary data
-            payment_data = Payment.get_payment_summary(start_date, end_date)
-            
             if not payment_data:
                 return
                 
@@ -798,7 +815,7 @@ class ReportsWindow(QMainWindow):
             
         except Exception as e:
             print(f"Error loading payment analysis: {e}")
-            raise
+            self.report_error(str(e))
     
     def load_product_list(self):
         """Load the list of products for the product selector"""
@@ -835,15 +852,24 @@ class ReportsWindow(QMainWindow):
         
         # Store selected product for report refresh
         self.selected_product_id = product_id
-            
+
+        # Get date range
+        start_date = self.start_date.date().toString("yyyy-MM-dd")
+        end_date = self.end_date.date().toString("yyyy-MM-dd")
+
+        # Get product performance data in the background
+        run_in_background(
+            SalesReport.get_product_performance, product_id, start_date, end_date,
+            on_result=self.show_product_performance,
+            on_error=lambda message: QMessageBox.warning(
+                self, "Erreur", f"Erreur lors de l'analyse du produit: {message}"
+            ),
+            key=(id(self), 'product_performance'),
+        )
+
+    def show_product_performance(self, performance):
+        """Fill the product tab from a get_product_performance() result"""
         try:
-            # Get date range
-            start_date = self.start_date.date().toString("yyyy-MM-dd")
-            end_date = self.end_date.date().toString("yyyy-MM-dd")
-            
-            # Get product performance data
-            performance = SalesReport.get_product_performance(product_id, start_date, end_date)
-            
             if not performance:
                 QMessageBox.warning(self, "Erreur", "Aucune donnée trouvée pour ce produit.")
                 return
@@ -1,13 +1,14 @@
 from PyQt5.QtWidgets import (
     QWidget, QVBoxLayout, QHBoxLayout, QGridLayout, QTableWidget, QTableWidgetItem,
-    QPushButton, QLabel, QFrame, QHeaderView, QScrollArea, QMessageBox, QComboBox
+    QPushButton, QLabel, QFrame, QHeaderView, QScrollArea, QMessageBox, QComboBox,
+    QLineEdit
 )
 from PyQt5.QtCore import Qt, QTimer
 from PyQt5.QtGui import QFont, QCursor
 from models.category import Category
-from models.product import Product
-from database import get_connection
-from datetime import datetime
+from models.checkout import CheckoutService
+from models.catalog import ProductCatalog
+from .db_worker import run_in_background
 import pytz
 import os
 
@@ -82,7 +83,6 @@ class SalesManagementWindow(QWidget):
     def __init__(self, user=None):
         super().__init__()
         self.user_id = user['id'] if user else 1  # Default to user ID 1 if not provided
-        self.current_datetime = datetime.now()
         self.current_amount = 0.0
         self.selected_row = None
         self.selected_product = None
@@ -124,6 +124,20 @@ class SalesManagementWindow(QWidget):
         cart_header = QLabel("Panier")
         cart_header.setStyleSheet("font-size: 18px; font-weight: bold;")
         cart_layout.addWidget(cart_header)
+
+        # Barcode scanner input (scanners type the code followed by Enter)
+        self.barcode_input = QLineEdit()
+        self.barcode_input.setPlaceholderText("Scanner un code-barres...")
+        self.barcode_input.setStyleSheet("""
+            QLineEdit {
+                padding: 8px;
+                border: 1px solid #ced4da;
+                border-radius: 5px;
+                font-size: 14px;
+            }
+        """)
+        self.barcode_input.returnPressed.connect(self.scan_barcode)
+        cart_layout.addWidget(self.barcode_input)
         
         # Cart table
         self.cart_table = QTableWidget()
@@ -395,98 +409,25 @@ class SalesManagementWindow(QWidget):
                 QMessageBox.warning(self, "Erreur", "Aucun paiement n'a été enregistré.")
                 return
                 
-            # Now process the sale with payment information
-            conn = get_connection()
-            cursor = conn.cursor()
-            
-            # Start transaction
-            cursor.execute("BEGIN TRANSACTION")
-            
-            try:
-                # Create sale record
-                cursor.execute("""
-                    INSERT INTO Sales (
-                        created_at, 
-                        total_amount, 
-                        user_id,
-                        discount,
-                        tax_amount,
-                        final_total,
-                        payment_method,
-                        payment_status
-                    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-                """, (
-                    self.current_datetime.strftime("%Y-%m-%d %H:%M:%S"),
-                    self.current_amount,
-                    self.user_id,
-                    0.0,  # discount (default to 0)
-                    0.0,  # tax_amount (default to 0)
-                    self.current_amount,  # final_total
-                    "MULTIPLE" if len(payments_data) > 1 else payments_data[0]['method_name'],  # payment_method
-                    "COMPLETED"  # payment_status
-                ))
-                
-                sale_id = cursor.lastrowid
-                
-                # Add payment records
-                from models.payment import Payment
-                for payment in payments_data:
-                    Payment.add_sale_payment(
-                        sale_id=sale_id,
-                        payment_method_id=payment['method_id'],
-                        amount=payment['amount'],
-                        reference_number=payment.get('reference', ''),
-                        notes=payment.get('notes', '')
-                    )
-                
-                # Add sale items
-                for row in range(self.cart_table.rowCount()):
-                    product_name = self.cart_table.item(row, 0).text()
-                    quantity = float(self.cart_table.item(row, 1).text())
-                    price = float(self.cart_table.item(row, 2).text())
-                    
-                    # Get product ID and variant ID from the item
-                    product_id = self.cart_table.item(row, 0).data(Qt.UserRole)
-                    variant_id = self.cart_table.item(row, 0).data(Qt.UserRole + 1)
-                    
-                    if not product_id:
-                        # Fallback to old method if ID not stored in item
-                        cursor.execute("SELECT id FROM Products WHERE name = ?", (product_name,))
-                        product_id = cursor.fetchone()[0]
-                    
-                    # Calculate subtotal
-                    subtotal = quantity * price
-                    
-                    # Add sale item
-                    cursor.execute("""
-                        INSERT INTO SaleItems (
-                            sale_id,
-                            product_id,
-                            variant_id,
-                            quantity,
-                            unit_price,
-                            subtotal
-                        ) VALUES (?, ?, ?, ?, ?, ?)
-                    """, (sale_id, product_id, variant_id, quantity, price, subtotal))
-                    
-                    # Update stock - different approach for variants vs regular products
-                    if variant_id:
-                        # Update variant stock
-                        cursor.execute("""
-                            UPDATE ProductVariants 
-                            SET stock = stock - ? 
-                            WHERE id = ?
-                        """, (quantity, variant_id))
-                    else:
-                        # Update product stock
-                        cursor.execute("""
-                            UPDATE Products 
-                            SET stock = stock - ? 
-                            WHERE id = ?
-                        """, (quantity, product_id))
-                
-                cursor.execute("COMMIT")
-                
+            # Collect the cart lines
+            items = []
+            for row in range(self.cart_table.rowCount()):
+                items.append({
+                    'product_name': self.cart_table.item(row, 0).text(),
+                    'product_id': self.cart_table.item(row, 0).data(Qt.UserRole),
+                    'variant_id': self.cart_table.item(row, 0).data(Qt.UserRole + 1),
+                    'template_value_ids': self.cart_table.item(row, 0).data(Qt.UserRole + 2),
+                    'quantity': float(self.cart_table.item(row, 1).text()),
+                    'unit_price': float(self.cart_table.item(row, 2).text()),
+                })
+
+            # Sale, items, payments and stock are committed together
+            sale_id = CheckoutService.checkout(
+                self.user_id, items,
+                payments=payments_data
+            )
+
+            if sale_id:
                 # Show success message with payment details
                 if len(payments_data) > 1:
                     payment_details = "\n".join([f"- {p['method_name']}: {p['amount']:.2f} MAD" for p in payments_data])
@@ -530,15 +471,11 @@ class SalesManagementWindow(QWidget):
                 # Clear the cart
                 self.clear_cart()
                 
-            except Exception as e:
-                cursor.execute("ROLLBACK")
-                QMessageBox.warning(self, "Erreur", f"Erreur lors de l'enregistrement de la vente: {str(e)}")
+            else:
+                QMessageBox.warning(self, "Erreur", "Erreur lors de l'enregistrement de la vente.")
                 
         except Exception as e:
             QMessageBox.warning(self, "Erreur", f"Erreur lors du traitement de la vente: {str(e)}")
-        finally:
-            if 'conn' in locals() and conn:
-                conn.close()
 
     def remove_from_cart(self, row):
         """Remove an item from the cart"""
@@ -617,15 +554,28 @@ class SalesManagementWindow(QWidget):
             col += 1
 
     def load_products(self, category_id=None):
+        # Once the catalog is in memory, switching category never touches the database
+        if ProductCatalog.is_loaded():
+            self.show_products(ProductCatalog.products_in_category(category_id))
+            return
+
+        # First load happens off the GUI thread; a newer category tap supersedes it
+        run_in_background(
+            ProductCatalog.products_in_category, category_id,
+            on_result=self.show_products,
+            on_error=lambda message: QMessageBox.warning(
+                self, "Erreur", f"Erreur lors du chargement des produits: {message}"
+            ),
+            key=(id(self), 'load_products'),
+        )
+
+    def show_products(self, products):
         # Clear existing products
         while self.products_layout.count():
             item = self.products_layout.takeAt(0)
             if item.widget():
                 item.widget().deleteLater()
 
-        # Get products
-        products = Product.get_products_by_category(category_id)
-
         # Add products to grid
         row = 0
         col = 0
@@ -643,6 +593,33 @@ class SalesManagementWindow(QWidget):
     def filter_by_category(self, category_id):
         self.load_products(category_id)
 
+    def scan_barcode(self):
+        """Add the product or variant matching the scanned code to the cart"""
+        code = self.barcode_input.text().strip()
+        self.barcode_input.clear()
+        if not code:
+            return
+
+        if ProductCatalog.is_loaded():
+            self.add_scanned_item(ProductCatalog.find_by_barcode(code), code)
+        else:
+            # Catalog still loading: resolve once it is ready without freezing the till
+            run_in_background(
+                ProductCatalog.find_by_barcode, code,
+                on_result=lambda match: self.add_scanned_item(match, code)
+            )
+
+    def add_scanned_item(self, match, code):
+        product, variant = match
+        if product is None:
+            QMessageBox.warning(self, "Code-barres inconnu", f"Aucun produit ne correspond au code {code}.")
+        elif variant is not None:
+            # The code identifies the exact variant: no selection dialog
+            self.add_variant_to_cart(product, variant)
+        else:
+            self.add_to_cart(product)
+        self.barcode_input.setFocus()
+
     def add_to_cart(self, product):
         # Check if product has variants
         if product.get('has_variants'):
@@ -721,97 +698,25 @@ class SalesManagementWindow(QWidget):
             for row in range(self.cart_table.rowCount()):
                 product_id = self.cart_table.item(row, 0).data(Qt.UserRole)
                 variant_id = self.cart_table.item(row, 0).data(Qt.UserRole + 1)
+                template_value_ids = self.cart_table.item(row, 0).data(Qt.UserRole + 2)
                 
-                # Match if same product and same variant
-                if product_id == product['id'] and variant_id == variant['id']:
+                # Match if same product and same variant (same combination for a variant not created yet)
+                if product_id == product['id'] and variant_id == variant['id'] and \
+                        template_value_ids == variant.get('template_value_ids'):
                     # Update quantity
                     current_qty = int(self.cart_table.item(row, 1).text())
                     self.cart_table.setItem(row, 1, QTableWidgetItem(str(current_qty + 1)))
                     self.update_total()
                     return
             
-            # Create variant name from product name + variant attributes
-            attr_values = {}
-            
-            # Try both possible keys for attributes (for compatibility)
-            for key in ['attributes', 'attribute_values']:
-                if variant.get(key):
-                    try:
-                        # Handle different data structures
-                        if isinstance(variant[key], str):
-                            # Try to parse as JSON
-                            try:
-                                parsed_values = json.loads(variant[key])
-                                attr_values = parsed_values
-                                # Store the parsed result back in the variant for future use
-                                variant[key] = parsed_values
-                                # Also store in the other key for compatibility
-                                other_key = 'attributes' if key == 'attribute_values' else 'attribute_values'
-                                variant[other_key] = parsed_values
-                            except json.JSONDecodeError:
-                                # Not valid JSON, use as a simple string-value dictionary
-                                attr_values = {key: variant[key]}
-                        else:
-                            attr_values = variant[key]
-                            # Copy to other key for compatibility
-                            other_key = 'attributes' if key == 'attribute_values' else 'attribute_values'
-                            if other_key not in variant or not variant[other_key]:
-                                variant[other_key] = attr_values
-                    
-                        # If we got values, no need to check the other key
-                        if attr_values:
-                            print(f"Successfully parsed {key}: {attr_values}")
-                            break
-                    except Exception as e:
-                        print(f"Error parsing variant {key}: {e}")
-                        
-            # Debug output
-            print(f"Variant in cart: {variant}")
-            print(f"Extracted attribute values: {attr_values}")
-            
-            variant_desc = ""
-            if attr_values:
-                try:
-                    # Handle different structures of attr_values
-                    attr_vals = []
-                    
-                    # If attr_values is a dictionary with values
-                    if isinstance(attr_values, dict):
-                        attr_vals = [str(val) for val in attr_values.values() if val]
-                    # If attr_values is a list
-                    elif isinstance(attr_values, list):
-                        attr_vals = [str(val) for val in attr_values if val]
-                    # If it's some other structure, try to convert to string
-                    else:
-                        attr_vals = [str(attr_values)]
-                    
-                    # Join the values to create a description if we have values
-                    if attr_vals:
-                        variant_desc = " (" + " / ".join(attr_vals) + ")"
-                except Exception as e:
-                    print(f"Error creating variant description: {e}")
-                    variant_desc = f" (Variante #{variant.get('id', '')})"
+            # Precomputed from the variant's attribute values; no JSON decoding here
+            display_name = variant.get('display_name') or variant.get('name') or f"Variante #{variant.get('id', '')}"
+            variant_desc = f" ({display_name})"
             
             variant_name = product['name'] + variant_desc
             
-            # Determine the correct price for the variant
-            if 'unit_price' in variant and variant['unit_price'] is not None:
-                # Preferred method: Use the variant's direct unit price (already includes all adjustments)
-                final_price = float(variant['unit_price'])
-                print(f"Cart: Using variant's direct unit_price: {final_price}")
-            else:
-                # Fallback method: Calculate from base + adjustments
-                base_price = float(product['unit_price'])
-                
-                # Use total_price_adjustment if available
-                if 'total_price_adjustment' in variant:
-                    price_adj = float(variant.get('total_price_adjustment', 0))
-                else:
-                    # Fallback to just the variant's direct price adjustment
-                    price_adj = float(variant.get('price_adjustment', 0))
-                    
-                final_price = base_price + price_adj
-                print(f"Cart: Calculating price from base ({base_price}) + adjustment ({price_adj}) = {final_price}")
+            # Stored selling price: base + variant adjustment + attribute extras
+            final_price = float(variant.get('effective_price') or variant.get('unit_price') or 0)
             
             # Validate the final price - cannot be zero or negative
             if final_price <= 0:
@@ -820,10 +725,6 @@ class SalesManagementWindow(QWidget):
                 print(f"Warning: Invalid variant price ({final_price}), using base product price: {base_price}")
                 final_price = base_price
                 
-            # Show detailed debug info
-            print(f"Cart final variant price: {final_price} MAD")
-            print(f"Variant data: unit_price={variant.get('unit_price')}, price_adjustment={variant.get('price_adjustment')}, total_adjustment={variant.get('total_price_adjustment')}")
-            
             # Add to cart
             row = self.cart_table.rowCount()
             self.cart_table.insertRow(row)
@@ -832,6 +733,8 @@ class SalesManagementWindow(QWidget):
             name_item = QTableWidgetItem(variant_name)
             name_item.setData(Qt.UserRole, product['id'])   # Store product ID
             name_item.setData(Qt.UserRole + 1, variant['id'])  # Store variant ID
+            # Dynamic variant not created yet: checkout creates it from its values
+            name_item.setData(Qt.UserRole + 2, variant.get('template_value_ids'))
             self.cart_table.setItem(row, 0, name_item)
             
             # Quantity and price
@@ -0,0 +1,38 @@
+from PyQt5.QtCore import QObject, pyqtSignal
+from PyQt5.QtWidgets import QApplication
+
+from models.stock_alerts import StockAlerts
+
+
+class StockAlertNotifier(QObject):
+    """Pushes new stock alerts to the open windows.
+
+    StockAlerts hands new alerts over on whichever thread wrote the stock
+    change (the till, a DbWorker thread...). ``alerts_raised`` is emitted
+    from there; Qt queues it to the receivers on the GUI thread.
+    """
+
+    # list of StockAlert records
+    alerts_raised = pyqtSignal(object)
+
+    _instance = None
+
+    def __init__(self):
+        super().__init__()
+        StockAlerts.subscribe(self.publish)
+
+    @classmethod
+    def instance(cls):
+        """Return the process-wide notifier, created on first use."""
+        if cls._instance is None:
+            cls._instance = cls()
+            app = QApplication.instance()
+            if app is not None:
+                app.aboutToQuit.connect(cls._instance.shutdown)
+        return cls._instance
+
+    def publish(self, alerts):
+        self.alerts_raised.emit(alerts)
+
+    def shutdown(self):
+        StockAlerts.unsubscribe(self.publish)
@@ -1,13 +1,14 @@
 from PyQt5.QtWidgets import (
     QDialog, QVBoxLayout, QHBoxLayout, QLabel, QLineEdit,
     QPushButton, QFormLayout, QSpinBox, QDoubleSpinBox,
-    QComboBox, QTextEdit, QMessageBox, QTableWidget,
-    QTableWidgetItem, QHeaderView, QFrame, QGroupBox,
-    QDialogButtonBox, QDateEdit
+    QComboBox, QTextEdit, QMessageBox, QTableView,
+    QAbstractItemView, QHeaderView, QFrame, QGroupBox,
+    QDialogButtonBox, QDateEdit, QCheckBox
 )
 from PyQt5.QtCore import Qt, QDate
 from PyQt5.QtGui import QIcon
 from models.product import Product
+from .stock_movement_table_model import StockMovementTableModel
 from datetime import datetime
 import json
 
@@ -103,22 +104,56 @@ class StockManagementDialog(QDialog):
         # Stock movement history
         history_group = QGroupBox("Historique des mouvements")
         history_layout = QVBoxLayout(history_group)
-        
-        self.movements_table = QTableWidget()
-        self.movements_table.setColumnCount(7)
-        self.movements_table.setHorizontalHeaderLabels([
-            "Date", "Type", "Quantité", "Prix unitaire", "Total", "Référence", "Actions"
-        ])
-        
-        self.movements_table.horizontalHeader().setSectionResizeMode(0, QHeaderView.ResizeToContents)
-        self.movements_table.horizontalHeader().setSectionResizeMode(1, QHeaderView.ResizeToContents)
-        self.movements_table.horizontalHeader().setSectionResizeMode(2, QHeaderView.ResizeToContents)
-        self.movements_table.horizontalHeader().setSectionResizeMode(3, QHeaderView.ResizeToContents)
-        self.movements_table.horizontalHeader().setSectionResizeMode(4, QHeaderView.ResizeToContents)
-        self.movements_table.horizontalHeader().setSectionResizeMode(5, QHeaderView.Stretch)
-        self.movements_table.horizontalHeader().setSectionResizeMode(6, QHeaderView.Fixed)
-        self.movements_table.setColumnWidth(6, 80)
-        
+
+        # Filters
+        filter_layout = QHBoxLayout()
+        filter_layout.addWidget(QLabel("Type:"))
+        self.type_filter = QComboBox()
+        self.type_filter.addItem("Tous", None)
+        self.type_filter.addItem("Entrées", 'in')
+        self.type_filter.addItem("Sorties", 'out')
+        self.type_filter.addItem("Ajustements", 'adjustment')
+        self.type_filter.currentIndexChanged.connect(self.load_stock_movements)
+        filter_layout.addWidget(self.type_filter)
+
+        self.date_filter = QCheckBox("Du")
+        self.date_filter.toggled.connect(self.load_stock_movements)
+        filter_layout.addWidget(self.date_filter)
+        self.date_from = QDateEdit(QDate.currentDate().addMonths(-1))
+        self.date_from.setCalendarPopup(True)
+        self.date_from.dateChanged.connect(self.date_range_changed)
+        filter_layout.addWidget(self.date_from)
+        filter_layout.addWidget(QLabel("au"))
+        self.date_to = QDateEdit(QDate.currentDate())
+        self.date_to.setCalendarPopup(True)
+        self.date_to.dateChanged.connect(self.date_range_changed)
+        filter_layout.addWidget(self.date_to)
+        filter_layout.addStretch()
+
+        self.cancel_movement_btn = QPushButton("↩️ Annuler le mouvement")
+        self.cancel_movement_btn.setEnabled(False)
+        self.cancel_movement_btn.clicked.connect(lambda: self.delete_movement(self.selected_movement()))
+        filter_layout.addWidget(self.cancel_movement_btn)
+        history_layout.addLayout(filter_layout)
+
+        # Pages of movements are read as the user scrolls (fetchMore)
+        self.movements_model = StockMovementTableModel(self.product['id'], self)
+        self.movements_table = QTableView()
+        self.movements_table.setModel(self.movements_model)
+        self.movements_table.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.movements_table.setSelectionMode(QAbstractItemView.SingleSelection)
+        self.movements_table.selectionModel().selectionChanged.connect(self.update_action_buttons)
+        self.movements_model.modelReset.connect(self.update_action_buttons)
+
+        vertical_header = self.movements_table.verticalHeader()
+        vertical_header.setSectionResizeMode(QHeaderView.Fixed)
+        vertical_header.hide()
+
+        header = self.movements_table.horizontalHeader()
+        for column in range(len(StockMovementTableModel.HEADERS)):
+            header.setSectionResizeMode(column, QHeaderView.ResizeToContents)
+        header.setSectionResizeMode(StockMovementTableModel.COL_REFERENCE, QHeaderView.Stretch)
+
         history_layout.addWidget(self.movements_table)
         
         main_layout.addWidget(history_group)
@@ -149,78 +184,55 @@ class StockManagementDialog(QDialog):
         
         # Current stock and value info
         stock_layout = QVBoxLayout()
-        current_stock = QLabel(f"Stock actuel: {self.product['stock']}")
-        current_stock.setStyleSheet("font-size: 16px; font-weight: bold;")
-        stock_layout.addWidget(current_stock)
+        self.current_stock_label = QLabel()
+        self.current_stock_label.setStyleSheet("font-size: 16px; font-weight: bold;")
+        stock_layout.addWidget(self.current_stock_label)
         
-        # Calculate stock value
-        purchase_price = float(self.product.get('purchase_price', 0))
-        stock_value = purchase_price * float(self.product['stock'])
-        value_label = QLabel(f"Valeur: {stock_value:.2f} MAD")
-        value_label.setStyleSheet("color: #28a745;")
-        stock_layout.addWidget(value_label)
+        self.value_label = QLabel()
+        self.value_label.setStyleSheet("color: #28a745;")
+        stock_layout.addWidget(self.value_label)
+        self.update_stock_labels()
         
         header_layout.addLayout(stock_layout)
         
         layout.addWidget(header_frame)
 
+    def update_stock_labels(self):
+        """Show the current stock and its value at purchase price"""
+        self.current_stock_label.setText(f"Stock actuel: {self.product['stock']}")
+        purchase_price = float(self.product.get('purchase_price', 0) or 0)
+        stock_value = purchase_price * float(self.product['stock'] or 0)
+        self.value_label.setText(f"Valeur: {stock_value:.2f} MAD")
+
     def load_stock_movements(self):
-        """Load stock movement history for the product"""
-        movements = Product.get_stock_movements(self.product['id'])
-        
-        self.movements_table.setRowCount(len(movements))
-        
-        for row, movement in enumerate(movements):
-            # Date column
-            date_item = QTableWidgetItem(movement['created_at'])
-            self.movements_table.setItem(row, 0, date_item)
-            
-            # Movement type
-            type_text = {
-                'in': "Entrée ↑",
-                'out': "Sortie ↓",
-                'adjustment': "Ajustement ↔"
-            }.get(movement['movement_type'], movement['movement_type'])
-            
-            type_item = QTableWidgetItem(type_text)
-            type_item.setForeground(Qt.green if movement['movement_type'] == 'in' else 
-                                   Qt.red if movement['movement_type'] == 'out' else
-                                   Qt.blue)
-            self.movements_table.setItem(row, 1, type_item)
-            
-            # Quantity
-            quantity = movement['quantity']
-            prefix = "+" if movement['movement_type'] == 'in' else "-" if movement['movement_type'] == 'out' else "±"
-            quantity_item = QTableWidgetItem(f"{prefix}{abs(quantity)}")
-            self.movements_table.setItem(row, 2, quantity_item)
-            
-            # Unit price
-            unit_price = movement.get('unit_price', 0) or 0
-            price_item = QTableWidgetItem(f"{unit_price:.2f} MAD")
-            self.movements_table.setItem(row, 3, price_item)
-            
-            # Total value
-            total = quantity * unit_price
-            total_item = QTableWidgetItem(f"{total:.2f} MAD")
-            self.movements_table.setItem(row, 4, total_item)
-            
-            # Reference
-            ref_item = QTableWidgetItem(movement.get('reference', ''))
-            self.movements_table.setItem(row, 5, ref_item)
-            
-            # Actions
-            actions_widget = QWidget()
-            actions_layout = QHBoxLayout(actions_widget)
-            actions_layout.setContentsMargins(0, 0, 0, 0)
-            
-            delete_btn = QPushButton("🗑️")
-            delete_btn.setMaximumWidth(30)
-            delete_btn.clicked.connect(lambda checked, m=movement: self.delete_movement(m))
-            
-            actions_layout.addWidget(delete_btn)
-            actions_layout.addStretch()
-            
-            self.movements_table.setCellWidget(row, 6, actions_widget)
+        """Load the first page of movement history with the current filters"""
+        date_from = date_to = None
+        if self.date_filter.isChecked():
+            date_from = self.date_from.date().toString("yyyy-MM-dd")
+            date_to = self.date_to.date().toString("yyyy-MM-dd")
+        self.movements_model.set_filters(
+            movement_type=self.type_filter.currentData(),
+            date_from=date_from,
+            date_to=date_to
+        )
+
+    def date_range_changed(self, *args):
+        # The dates only filter the history while the "Du" box is ticked
+        if self.date_filter.isChecked():
+            self.load_stock_movements()
+
+    def selected_movement(self):
+        rows = self.movements_table.selectionModel().selectedRows()
+        if not rows:
+            return None
+        return self.movements_model.movement(rows[0].row())
+
+    def update_action_buttons(self, *args):
+        # Cancelled movements and cancellations themselves cannot be cancelled
+        movement = self.selected_movement()
+        self.cancel_movement_btn.setEnabled(
+            movement is not None and not movement['reversed'] and not movement['reversal_of']
+        )
 
     def apply_stock_adjustment(self):
         """Apply a stock adjustment"""
@@ -261,15 +273,11 @@ class StockManagementDialog(QDialog):
             )
             
             if result:
-                # Update the product stock cache
-                new_stock = int(self.product['stock']) + quantity
-                Product.update_product(self.product['id'], stock=new_stock)
-                
-                # Update local product data
-                self.product['stock'] = new_stock
+                # The movement already moved the stock; update local product data
+                self.product['stock'] = int(self.product['stock']) + quantity
                 
                 # Refresh UI
-                self.create_product_header(QVBoxLayout())  # Create a dummy layout to update header
+                self.update_stock_labels()
                 self.load_stock_movements()
                 
                 # Clear inputs
@@ -296,41 +304,37 @@ class StockManagementDialog(QDialog):
             )
 
     def delete_movement(self, movement):
-        """Delete a stock movement and revert its effects"""
+        """Cancel a stock movement by recording the opposite movement"""
+        if movement is None:
+            return
         reply = QMessageBox.question(
             self,
             "Confirmation",
-            "Etes-vous sûr de vouloir supprimer ce mouvement de stock? Cette action annulera également les changements de stock associés.",
+            "Etes-vous sûr de vouloir annuler ce mouvement de stock? Un mouvement inverse sera enregistré pour annuler les changements de stock associés.",
             QMessageBox.Yes | QMessageBox.No,
             QMessageBox.No
         )
         
         if reply == QMessageBox.Yes:
-            # Delete the movement and revert stock changes
+            # Record the reversing movement
             if Product.delete_stock_movement(movement['id']):
-                # Update product stock by reverting the movement
-                quantity = movement['quantity']
-                # Reverse the quantity - add what was removed, remove what was added
-                new_stock = int(self.product['stock']) - quantity
-                
-                # Update product stock
-                Product.update_product(self.product['id'], stock=new_stock)
-                
-                # Update local product data
-                self.product['stock'] = new_stock
+                # The reversal already moved the stock; a variant movement
+                # leaves the product's own stock unchanged
+                if not movement['variant_id']:
+                    self.product['stock'] = int(self.product['stock']) - movement['quantity']
                 
                 # Refresh UI
-                self.create_product_header(QVBoxLayout())  # Create a dummy layout to update header
+                self.update_stock_labels()
                 self.load_stock_movements()
                 
                 QMessageBox.information(
                     self,
                     "Succès",
-                    "Le mouvement de stock a été supprimé et les changements annulés."
+                    "Le mouvement de stock a été annulé par un mouvement inverse."
                 )
             else:
                 QMessageBox.warning(
                     self,
                     "Erreur",
-                    "Une erreur est survenue lors de la suppression du mouvement."
+                    "Une erreur est survenue lors de l'annulation du mouvement (il a peut-être déjà été annulé)."
                 )
@@ -0,0 +1,135 @@
+from PyQt5.QtCore import Qt, QAbstractTableModel, QModelIndex
+from PyQt5.QtGui import QColor
+
+from models.product import Product
+
+
+class StockMovementTableModel(QAbstractTableModel):
+    """Movement history of StockManagementDialog, loaded page by page.
+
+    Rows come from Product.get_stock_movements_page, newest first: the first
+    page is read when the filters are set, the next ones (fetchMore) as the
+    user scrolls to the end of the view.
+    """
+    (COL_DATE, COL_TYPE, COL_QUANTITY, COL_PRICE, COL_TOTAL,
+     COL_BALANCE, COL_REFERENCE, COL_USER) = range(8)
+    HEADERS = [
+        "Date", "Type", "Quantité", "Prix unitaire", "Total",
+        "Solde", "Référence", "Utilisateur"
+    ]
+
+    TYPE_LABELS = {
+        'in': "Entrée ↑",
+        'out': "Sortie ↓",
+        'adjustment': "Ajustement ↔",
+    }
+    TYPE_COLORS = {
+        'in': Qt.darkGreen,
+        'out': Qt.red,
+        'adjustment': Qt.blue,
+    }
+
+    def __init__(self, product_id, parent=None):
+        super().__init__(parent)
+        self.product_id = product_id
+        self.movements = []
+        self._filters = {}
+        self._cursor = None
+        self._exhausted = True
+
+    # ------------------------------------------------------------------
+    # Loading
+
+    def set_filters(self, movement_type=None, date_from=None, date_to=None):
+        """Restart the history with new filters and load its first page"""
+        self.beginResetModel()
+        self.movements = []
+        self._filters = {'movement_type': movement_type, 'date_from': date_from, 'date_to': date_to}
+        self._cursor = None
+        self._exhausted = False
+        self.endResetModel()
+        self.fetchMore(QModelIndex())
+
+    def reload(self):
+        """Reload from the first page with the current filters"""
+        self.set_filters(**self._filters)
+
+    def canFetchMore(self, parent=QModelIndex()):
+        return not parent.isValid() and not self._exhausted
+
+    def fetchMore(self, parent=QModelIndex()):
+        if parent.isValid() or self._exhausted:
+            return
+        page, self._cursor = Product.get_stock_movements_page(
+            self.product_id, before=self._cursor, **self._filters
+        )
+        self._exhausted = self._cursor is None
+        if page:
+            first = len(self.movements)
+            self.beginInsertRows(QModelIndex(), first, first + len(page) - 1)
+            self.movements.extend(page)
+            self.endInsertRows()
+
+    def movement(self, row):
+        if 0 <= row < len(self.movements):
+            return self.movements[row]
+        return None
+
+    # ------------------------------------------------------------------
+    # Qt model interface
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.movements)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.HEADERS)
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and orientation == Qt.Horizontal:
+            return self.HEADERS[section]
+        return None
+
+    def flags(self, index):
+        if not index.isValid():
+            return Qt.NoItemFlags
+        return Qt.ItemIsEnabled | Qt.ItemIsSelectable
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        movement = self.movements[index.row()]
+        column = index.column()
+
+        if role == Qt.DisplayRole:
+            if column == self.COL_DATE:
+                return movement['created_at']
+            if column == self.COL_TYPE:
+                label = self.TYPE_LABELS.get(movement['movement_type'], movement['movement_type'])
+                if movement['reversed']:
+                    label += " (annulé)"
+                return label
+            if column == self.COL_QUANTITY:
+                return f"{movement['quantity']:+g}"
+            if column == self.COL_PRICE:
+                return f"{float(movement['unit_price'] or 0):.2f} MAD"
+            if column == self.COL_TOTAL:
+                return f"{movement['quantity'] * float(movement['unit_price'] or 0):.2f} MAD"
+            if column == self.COL_BALANCE:
+                return f"{movement['balance']:g}"
+            if column == self.COL_REFERENCE:
+                return movement['reference'] or ''
+            if column == self.COL_USER:
+                return movement['user_name'] or ''
+            return None
+
+        if role == Qt.ForegroundRole:
+            if movement['reversed'] or movement['reversal_of']:
+                return QColor(Qt.gray)
+            if column == self.COL_TYPE:
+                return QColor(self.TYPE_COLORS.get(movement['movement_type'], Qt.black))
+            return None
+
+        if role == Qt.TextAlignmentRole:
+            if column in (self.COL_QUANTITY, self.COL_PRICE, self.COL_TOTAL, self.COL_BALANCE):
+                return int(Qt.AlignRight | Qt.AlignVCenter)
+        return None
@@ -0,0 +1,332 @@
+from PyQt5.QtWidgets import (
+    QDialog, QVBoxLayout, QHBoxLayout, QLabel, QLineEdit,
+    QPushButton, QSpinBox, QComboBox, QCheckBox, QMessageBox,
+    QTableWidget, QTableWidgetItem, QHeaderView, QGroupBox,
+    QDialogButtonBox
+)
+from PyQt5.QtCore import Qt, QTimer
+from models.catalog import ProductCatalog
+from models.category import Category
+from models.stock_take import StockTake
+from .db_worker import DbWorker, run_in_background
+
+
+class StockTakeDialog(QDialog):
+    """Physical inventory screen.
+
+    Scanned or typed counts are buffered and written to the session's staging
+    table in batches (see StockTake.record_counts); the stock itself only
+    changes when the session is closed.
+    """
+    FLUSH_INTERVAL = 1000  # ms between two writes of buffered scans
+    RECENT_COUNTS = 200
+
+    def __init__(self, user=None, parent=None):
+        super().__init__(parent)
+        self.user = user
+        self.stock_take = None
+        self.pending_counts = []
+        self.flush_timer = QTimer(self)
+        self.flush_timer.setSingleShot(True)
+        self.flush_timer.setInterval(self.FLUSH_INTERVAL)
+        self.flush_timer.timeout.connect(self.flush_counts)
+        self.init_ui()
+        self.load_session()
+
+    def user_id(self):
+        return self.user['id'] if self.user else None
+
+    def init_ui(self):
+        """Initialize the UI elements"""
+        self.setWindowTitle("Inventaire physique")
+        self.setMinimumSize(800, 600)
+        self.setWindowFlags(self.windowFlags() | Qt.WindowMaximizeButtonHint)
+
+        main_layout = QVBoxLayout(self)
+
+        self.session_label = QLabel()
+        self.session_label.setStyleSheet("font-size: 16px; font-weight: bold;")
+        main_layout.addWidget(self.session_label)
+
+        # New session
+        self.start_group = QGroupBox("Nouvel inventaire")
+        start_layout = QHBoxLayout(self.start_group)
+        start_layout.addWidget(QLabel("Nom:"))
+        self.name_edit = QLineEdit()
+        self.name_edit.setPlaceholderText("Ex: Inventaire annuel")
+        start_layout.addWidget(self.name_edit)
+        start_layout.addWidget(QLabel("Catégorie:"))
+        self.category_combo = QComboBox()
+        self.category_combo.addItem("Tous les produits", None)
+        for category in Category.get_all_categories():
+            self.category_combo.addItem(category['name'], category['id'])
+        start_layout.addWidget(self.category_combo)
+        self.start_btn = QPushButton("Commencer")
+        self.start_btn.clicked.connect(self.start_session)
+        start_layout.addWidget(self.start_btn)
+        main_layout.addWidget(self.start_group)
+
+        # Counting
+        self.count_group = QGroupBox("Comptage")
+        count_layout = QVBoxLayout(self.count_group)
+
+        scan_layout = QHBoxLayout()
+        self.barcode_input = QLineEdit()
+        self.barcode_input.setPlaceholderText("Scanner ou saisir un code-barres puis Entrée")
+        self.barcode_input.returnPressed.connect(self.scan_code)
+        scan_layout.addWidget(self.barcode_input)
+        scan_layout.addWidget(QLabel("Quantité:"))
+        self.quantity_spin = QSpinBox()
+        self.quantity_spin.setRange(0, 100000)
+        self.quantity_spin.setValue(1)
+        scan_layout.addWidget(self.quantity_spin)
+        self.replace_check = QCheckBox("Remplacer la quantité comptée")
+        self.replace_check.setToolTip("Sinon, chaque saisie s'ajoute au comptage de l'article")
+        scan_layout.addWidget(self.replace_check)
+        count_layout.addLayout(scan_layout)
+
+        self.counts_table = QTableWidget()
+        self.counts_table.setColumnCount(5)
+        self.counts_table.setHorizontalHeaderLabels([
+            "Article", "Code-barres", "Compté", "Attendu", "Écart"
+        ])
+        self.counts_table.setEditTriggers(QTableWidget.NoEditTriggers)
+        self.counts_table.verticalHeader().setVisible(False)
+        header = self.counts_table.horizontalHeader()
+        header.setSectionResizeMode(0, QHeaderView.Stretch)
+        for column in range(1, 5):
+            header.setSectionResizeMode(column, QHeaderView.ResizeToContents)
+        count_layout.addWidget(self.counts_table)
+
+        self.summary_label = QLabel()
+        count_layout.addWidget(self.summary_label)
+
+        close_layout = QHBoxLayout()
+        self.zero_uncounted_check = QCheckBox("Mettre à zéro les articles non comptés")
+        close_layout.addWidget(self.zero_uncounted_check)
+        close_layout.addStretch()
+        self.cancel_session_btn = QPushButton("Abandonner")
+        self.cancel_session_btn.clicked.connect(self.cancel_session)
+        close_layout.addWidget(self.cancel_session_btn)
+        self.close_session_btn = QPushButton("Clôturer l'inventaire")
+        self.close_session_btn.setStyleSheet("""
+            QPushButton {
+                background-color: #28a745;
+                color: white;
+                padding: 8px 16px;
+                border-radius: 4px;
+                font-weight: bold;
+            }
+            QPushButton:hover {
+                background-color: #218838;
+            }
+        """)
+        self.close_session_btn.clicked.connect(self.close_session)
+        close_layout.addWidget(self.close_session_btn)
+        count_layout.addLayout(close_layout)
+
+        main_layout.addWidget(self.count_group)
+
+        # Dialog buttons
+        buttons = QDialogButtonBox(QDialogButtonBox.Close)
+        buttons.rejected.connect(self.reject)
+        main_layout.addWidget(buttons)
+
+    # ------------------------------------------------------------------
+    # Session
+
+    def load_session(self):
+        """Resume the open session, if there is one"""
+        self.show_session(StockTake.get_open())
+
+    def show_session(self, stock_take):
+        self.stock_take = stock_take
+        self.start_group.setVisible(stock_take is None)
+        self.count_group.setEnabled(stock_take is not None)
+        if stock_take is None:
+            self.session_label.setText("Aucun inventaire en cours")
+            self.counts_table.setRowCount(0)
+            self.summary_label.clear()
+            return
+        title = f"Inventaire #{stock_take['id']}"
+        if stock_take['name']:
+            title += f" - {stock_take['name']}"
+        if stock_take['category_id'] is not None:
+            title += f" ({ProductCatalog.category_name(stock_take['category_id']) or 'catégorie'})"
+        self.session_label.setText(f"{title}, commencé le {stock_take['created_at']}")
+        self.refresh_counts()
+        self.barcode_input.setFocus()
+
+    def start_session(self):
+        stock_take_id = StockTake.start(
+            name=self.name_edit.text().strip() or None,
+            category_id=self.category_combo.currentData(),
+            user_id=self.user_id()
+        )
+        if stock_take_id is None:
+            QMessageBox.warning(self, "Erreur", "Impossible de commencer l'inventaire.")
+            return
+        self.show_session(StockTake.get(stock_take_id))
+
+    # ------------------------------------------------------------------
+    # Counting
+
+    def scan_code(self):
+        """Count the product or variant matching the scanned code"""
+        code = self.barcode_input.text().strip()
+        self.barcode_input.clear()
+        if not code or self.stock_take is None:
+            return
+
+        if ProductCatalog.is_loaded():
+            self.add_scanned_item(ProductCatalog.find_by_barcode(code), code)
+        else:
+            run_in_background(
+                ProductCatalog.find_by_barcode, code,
+                on_result=lambda match: self.add_scanned_item(match, code)
+            )
+
+    def add_scanned_item(self, match, code):
+        product, variant = match
+        if product is None:
+            QMessageBox.warning(self, "Code-barres inconnu", f"Aucun produit ne correspond au code {code}.")
+        elif variant is not None:
+            self.add_count(product['id'], variant['id'])
+        elif product.get('has_variants'):
+            # A product code does not tell which variant is on the shelf
+            from .variant_selection_dialog import VariantSelectionDialog
+            dialog = VariantSelectionDialog(product, self)
+            if dialog.exec_():
+                variant = dialog.get_selected_variant()
+                if variant:
+                    self.add_count(product['id'], variant['id'])
+        else:
+            self.add_count(product['id'], None)
+        self.barcode_input.setFocus()
+
+    def add_count(self, product_id, variant_id):
+        quantity = self.quantity_spin.value()
+        if self.replace_check.isChecked():
+            # A full count of the row: write it now, after the scans before it
+            self.flush_counts()
+            if not StockTake.record_counts(
+                self.stock_take['id'], [(product_id, variant_id, quantity)],
+                replace=True, user_id=self.user_id()
+            ):
+                QMessageBox.warning(self, "Erreur", "Le comptage n'a pas pu être enregistré.")
+            self.refresh_counts()
+            return
+        self.pending_counts.append((product_id, variant_id, quantity))
+        if not self.flush_timer.isActive():
+            self.flush_timer.start()
+
+    def flush_counts(self):
+        """Write the buffered scans in one transaction"""
+        self.flush_timer.stop()
+        if not self.pending_counts or self.stock_take is None:
+            return True
+        counts, self.pending_counts = self.pending_counts, []
+        if not StockTake.record_counts(self.stock_take['id'], counts, user_id=self.user_id()):
+            self.pending_counts = counts + self.pending_counts
+            QMessageBox.warning(self, "Erreur", "Les derniers comptages n'ont pas pu être enregistrés.")
+            return False
+        self.refresh_counts()
+        return True
+
+    def refresh_counts(self):
+        if self.stock_take is None:
+            return
+        stock_take_id = self.stock_take['id']
+        run_in_background(
+            lambda: (StockTake.get_counts(stock_take_id, self.RECENT_COUNTS), StockTake.get_summary(stock_take_id)),
+            on_result=self.show_counts,
+            key=(id(self), 'counts'),
+        )
+
+    def show_counts(self, result):
+        counts, summary = result
+        self.counts_table.setRowCount(len(counts))
+        for row, count in enumerate(counts):
+            self.counts_table.setItem(row, 0, QTableWidgetItem(count['name']))
+            self.counts_table.setItem(row, 1, QTableWidgetItem(count['barcode'] or ''))
+            for column, key in ((2, 'counted_quantity'), (3, 'expected_quantity'), (4, 'difference')):
+                item = QTableWidgetItem(f"{count[key]:g}")
+                item.setTextAlignment(Qt.AlignRight | Qt.AlignVCenter)
+                self.counts_table.setItem(row, column, item)
+            difference = count['difference']
+            if difference:
+                self.counts_table.item(row, 4).setForeground(Qt.darkGreen if difference > 0 else Qt.red)
+        if summary:
+            self.summary_label.setText(
+                f"{summary['counted_rows']} article(s) compté(s), {summary['adjusted_rows']} écart(s): "
+                f"+{summary['surplus']:g} / -{summary['shortage']:g}"
+            )
+
+    # ------------------------------------------------------------------
+    # Closing
+
+    def close_session(self):
+        if self.stock_take is None or not self.flush_counts():
+            return
+        summary = StockTake.get_summary(self.stock_take['id']) or {}
+        message = (
+            f"{summary.get('counted_rows', 0)} article(s) compté(s), "
+            f"{summary.get('adjusted_rows', 0)} écart(s) à corriger."
+        )
+        if self.zero_uncounted_check.isChecked():
+            message += "\nLes articles non comptés seront mis à zéro."
+        reply = QMessageBox.question(
+            self,
+            "Clôturer l'inventaire",
+            f"{message}\n\nLe stock sera ajusté. Continuer?",
+            QMessageBox.Yes | QMessageBox.No,
+            QMessageBox.No
+        )
+        if reply != QMessageBox.Yes:
+            return
+
+        self.count_group.setEnabled(False)
+        run_in_background(
+            StockTake.close, self.stock_take['id'], self.user_id(), self.zero_uncounted_check.isChecked(),
+            on_result=self.session_closed,
+            on_error=self.session_close_failed,
+            key=(id(self), 'close'),
+        )
+
+    def session_closed(self, result):
+        if result is None:
+            self.session_close_failed("voir le journal")
+            return
+        QMessageBox.information(
+            self,
+            "Inventaire clôturé",
+            f"{result['counted_rows']} article(s) compté(s), {result['adjusted_rows']} ajustement(s) "
+            f"enregistré(s) (solde {result['net']:+g})."
+        )
+        self.show_session(None)
+
+    def session_close_failed(self, message):
+        self.count_group.setEnabled(True)
+        QMessageBox.warning(self, "Erreur", f"L'inventaire n'a pas pu être clôturé: {message}")
+
+    def cancel_session(self):
+        if self.stock_take is None:
+            return
+        reply = QMessageBox.question(
+            self,
+            "Abandonner l'inventaire",
+            "Les comptages seront abandonnés et le stock ne sera pas modifié. Continuer?",
+            QMessageBox.Yes | QMessageBox.No,
+            QMessageBox.No
+        )
+        if reply == QMessageBox.Yes:
+            self.pending_counts = []
+            StockTake.cancel(self.stock_take['id'])
+            self.show_session(None)
+
+    def done(self, result):
+        # Scans still in the buffer belong to the session; the count list
+        # refresh the flush queues has no window left to fill
+        self.flush_counts()
+        DbWorker.instance().cancel_key((id(self), 'counts'))
+        super().done(result)
@@ -1,17 +1,21 @@
 from PyQt5.QtWidgets import (
     QDialog, QVBoxLayout, QHBoxLayout, QLabel, QLineEdit,
-    QPushButton, QTableWidget, QTableWidgetItem, QMessageBox,
+    QPushButton, QTableView, QMessageBox, QAbstractItemView,
     QHeaderView, QWidget, QSplitter, QListWidget, QListWidgetItem,
     QComboBox, QCheckBox, QDialogButtonBox, QDoubleSpinBox, QSpinBox,
-    QFormLayout, QGroupBox, QTabWidget, QMenu
+    QFormLayout, QGroupBox, QTabWidget, QMenu, QFrame, QInputDialog
 )
-from PyQt5.QtCore import Qt
+from PyQt5.QtCore import Qt, QSortFilterProxyModel
 from PyQt5.QtGui import QCursor
 from models.product_attribute import ProductAttribute
 from models.product import Product
+from ui.variant_table_model import VariantTableModel, PriceDelegate, StockDelegate
 import json
 
 class VariantManagementDialog(QDialog):
+    # Ask before generating more variants than this
+    CONFIRM_VARIANT_COUNT = 500
+
     def __init__(self, product_id=None, parent=None, variant_attributes=None):
         super().__init__(parent)
         self.product_id = product_id
@@ -87,17 +91,37 @@ class VariantManagementDialog(QDialog):
         instruction.setStyleSheet("font-size: 14px; margin-bottom: 10px;")
         layout.addWidget(instruction)
         
-        # Variants table
-        self.variants_table = QTableWidget()
-        self.variants_table.setColumnCount(7)  # Added one more column for actions
-        self.variants_table.setHorizontalHeaderLabels([
-            "Actif", "Variante", "SKU", "Prix de vente", "Stock", "Code-barres", "Actions"
-        ])
+        # Filter on the variant name
+        self.variant_filter = QLineEdit()
+        self.variant_filter.setPlaceholderText("🔍 Filtrer les variantes...")
+        layout.addWidget(self.variant_filter)
+        
+        # Variants table: a model over self.variants, edited in place through delegates
+        self.variants_model = VariantTableModel(self)
+        self.variants_proxy = QSortFilterProxyModel(self)
+        self.variants_proxy.setSourceModel(self.variants_model)
+        self.variants_proxy.setFilterKeyColumn(VariantTableModel.COL_NAME)
+        self.variants_proxy.setFilterCaseSensitivity(Qt.CaseInsensitive)
+        self.variant_filter.textChanged.connect(self.variants_proxy.setFilterFixedString)
+        
+        self.variants_table = QTableView()
+        self.variants_table.setModel(self.variants_proxy)
+        self.variants_table.setItemDelegateForColumn(VariantTableModel.COL_PRICE, PriceDelegate(self.variants_table))
+        self.variants_table.setItemDelegateForColumn(VariantTableModel.COL_STOCK, StockDelegate(self.variants_table))
+        self.variants_table.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.variants_table.setSelectionMode(QAbstractItemView.ExtendedSelection)
+        self.variants_table.setEditTriggers(
+            QAbstractItemView.DoubleClicked | QAbstractItemView.SelectedClicked | QAbstractItemView.EditKeyPressed
+        )
+        self.variants_table.doubleClicked.connect(self.on_variant_double_clicked)
         
+        # Fixed row heights so the view never measures rows it does not paint
+        self.variants_table.verticalHeader().setSectionResizeMode(QHeaderView.Fixed)
+        self.variants_table.verticalHeader().setDefaultSectionSize(28)
         self.variants_table.horizontalHeader().setSectionResizeMode(1, QHeaderView.Stretch)
         self.variants_table.horizontalHeader().setSectionResizeMode(0, QHeaderView.Fixed)
         self.variants_table.setColumnWidth(0, 50)
-        self.variants_table.setColumnWidth(6, 100)  # Actions column width
+        self.variants_table.setColumnWidth(6, 60)
         
         # Enable context menu
         self.variants_table.setContextMenuPolicy(Qt.CustomContextMenu)
@@ -105,6 +129,12 @@ class VariantManagementDialog(QDialog):
         
         layout.addWidget(self.variants_table)
         
+        self.variants_count_label = QLabel()
+        layout.addWidget(self.variants_count_label)
+        self.variants_model.modelReset.connect(self.update_variants_count)
+        self.variants_model.rowsRemoved.connect(self.update_variants_count)
+        self.variants_model.dataChanged.connect(self.update_variants_count)
+        
         # Bulk action buttons
         bulk_layout = QHBoxLayout()
         
@@ -116,6 +146,17 @@ class VariantManagementDialog(QDialog):
         
         bulk_layout.addWidget(active_all_btn)
         bulk_layout.addWidget(deactive_all_btn)
+        
+        # Actions on the selected rows
+        selection_btn = QPushButton("Sélection ▾")
+        selection_btn.setToolTip("Modifier les variantes sélectionnées")
+        selection_menu = QMenu(selection_btn)
+        selection_menu.addAction("Activer", lambda: self.set_selection_active(True))
+        selection_menu.addAction("Désactiver", lambda: self.set_selection_active(False))
+        selection_menu.addAction("Définir le prix...", self.set_selection_price)
+        selection_menu.addAction("Définir le stock...", self.set_selection_stock)
+        selection_btn.setMenu(selection_menu)
+        bulk_layout.addWidget(selection_btn)
         bulk_layout.addStretch()
         
         # Add buttons for editing operations
@@ -141,8 +182,8 @@ class VariantManagementDialog(QDialog):
             
         try:
             # Clear existing variants in table
-            self.variants_table.setRowCount(0)
             self.variants = []
+            self.variants_model.set_variants(self.variants)
             
             # Get variants from the database
             self.existing_variants = Product.get_variants(self.product_id)
@@ -160,7 +201,8 @@ class VariantManagementDialog(QDialog):
                     'active': True,
                     'name': variant.get('name', ''),
                     'sku': variant.get('sku', ''),
-                    'price': float(variant.get('price_adjustment') or 0),
+                    'price': float(variant.get('effective_price') or 0),
+                    'price_extras': float(variant.get('price_extras') or 0),
                     'stock': int(variant.get('stock') or 0),
                     'barcode': variant.get('barcode', ''),
                     'attributes': variant.get('attributes', {})
@@ -189,13 +231,11 @@ class VariantManagementDialog(QDialog):
         edit_action = menu.addAction("Modifier")
         delete_action = menu.addAction("Supprimer")
         
-        # Get the item at the position
-        item = self.variants_table.itemAt(position)
-        if not item:
+        # Get the row at the position
+        index = self.variants_table.indexAt(position)
+        if not index.isValid():
             return
-            
-        # Get the row of the item
-        row = item.row()
+        row = self.variants_proxy.mapToSource(index).row()
         
         # Show the menu at the cursor position
         action = menu.exec_(QCursor.pos())
@@ -385,16 +425,7 @@ class VariantManagementDialog(QDialog):
         variant['barcode'] = barcode
         
         # Update the table
-        row = self.variants.index(variant)
-        self.variants_table.item(row, 1).setText(variant['name'])
-        self.variants_table.item(row, 2).setText(variant['sku'])
-        price_spin = self.variants_table.cellWidget(row, 3)
-        if price_spin:
-            price_spin.setValue(variant['price'])
-        stock_spin = self.variants_table.cellWidget(row, 4)
-        if stock_spin:
-            stock_spin.setValue(variant['stock'])
-        self.variants_table.item(row, 5).setText(variant['barcode'])
+        self.variants_model.variant_changed(self.variants_model.row_of(variant))
         
         # Close the dialog
         dialog.accept()
@@ -403,7 +434,8 @@ class VariantManagementDialog(QDialog):
         """Get product information for margin calculation"""
         try:
             from models.product import Product
-            return Product.get_product(product_id)
+            product = Product.get_product(product_id)
+            return dict(product) if product else None
         except Exception as e:
             print(f"Error getting product info: {e}")
             return None
@@ -414,6 +446,15 @@ class VariantManagementDialog(QDialog):
             return
             
         variant = self.variants[row]
+
+        if variant.get('id') and Product.has_history(variant_id=variant['id']):
+            QMessageBox.warning(
+                self,
+                "Suppression impossible",
+                "Cette variante a des ventes ou des mouvements de stock: elle ne peut "
+                "pas être supprimée sans perdre cet historique."
+            )
+            return
         
         # Ask for confirmation
         reply = QMessageBox.question(
@@ -432,8 +473,7 @@ class VariantManagementDialog(QDialog):
             # Delete from database
             if Product.delete_variant(variant['id']):
                 # Remove from our lists
-                self.variants.pop(row)
-                self.variants_table.removeRow(row)
+                self.variants_model.remove_row(row)
                 QMessageBox.information(
                     self,
                     "Succès",
@@ -447,48 +487,44 @@ class VariantManagementDialog(QDialog):
                 )
         else:
             # Just remove from our lists since it's not in database yet
-            self.variants.pop(row)
-            self.variants_table.removeRow(row)
+            self.variants_model.remove_row(row)
     
     def save_variant_changes(self):
         """Save changes to existing variants"""
-        success_count = 0
-        error_count = 0
+        # Only existing variants edited since they were loaded
+        changed = [variant for variant in self.variants_model.changed_variants() if variant.get('id')]
+        if not changed:
+            QMessageBox.information(self, "Aucune modification", "Aucune variante n'a été modifiée.")
+            return
         
-        for variant in self.variants:
-            # Only process existing variants (ones with ID)
-            if 'id' in variant and variant['id']:
-                # Update variant in database
-                # Use unit_price instead of price_adjustment based on the actual database structure
-                update_data = {
-                    'unit_price': variant['price'],  # Updated to use unit_price instead of price_adjustment
-                    'stock': variant['stock'],
-                    'barcode': variant['barcode'],
-                    'name': variant['name'],
-                    'sku': variant['sku'],
-                    'attribute_values': variant['attributes']
-                }
-                
-                # Print debug info
-                print(f"Updating variant {variant['id']} with {update_data}")
-                
-                if Product.update_variant(variant['id'], **update_data):
-                    success_count += 1
-                else:
-                    error_count += 1
+        # The grid edits the selling price; the database stores it as an
+        # adjustment over the product price and the combination's extras
+        updates = [
+            {
+                'id': variant['id'],
+                'price_adjustment': variant['price'] - self.variants_model.base_price - variant.get('price_extras', 0),
+                'stock': variant['stock'],
+                'barcode': variant['barcode'] or None,
+                'name': variant['name'],
+                'sku': variant['sku'],
+                'attribute_values': variant['attributes']
+            }
+            for variant in changed
+        ]
         
-        # Show result message
-        if error_count == 0:
+        saved = Product.update_variants(updates)
+        if saved is not None:
+            self.variants_model.mark_saved(update['id'] for update in updates)
             QMessageBox.information(
                 self,
                 "Succès",
-                f"{success_count} variantes mises à jour avec succès."
+                f"{saved} variantes mises à jour avec succès."
             )
         else:
             QMessageBox.warning(
                 self,
-                "Résultats",
-                f"{success_count} variantes mises à jour avec succès. {error_count} erreurs."
+                "Erreur",
+                f"Erreur lors de la mise à jour des {len(updates)} variantes modifiées."
             )
 
     def load_attributes(self):
@@ -573,16 +609,9 @@ class VariantManagementDialog(QDialog):
         if not attribute_name:
             return
             
-        # Get attribute values
-        values = []
-        attributes = ProductAttribute.get_all_attributes()
-        for attr in attributes:
-            if attr.get('name') == attribute_name:
-                try:
-                    values = ProductAttribute.get_attribute_values(attr['id'])
-                except Exception as e:
-                    print(f"Error getting attribute values: {e}")
-                break
+        # Get attribute values (served from the attribute cache)
+        attribute = ProductAttribute.get_attribute_by_name(attribute_name)
+        values = attribute['values'] if attribute else []
         
         # Add checkboxes for each value
         for value in values:
@@ -664,6 +693,28 @@ class VariantManagementDialog(QDialog):
         if not attr_values:
             QMessageBox.warning(self, "Aucune variante", "Aucun attribut ou valeur sélectionné.")
             return
+        
+        # Preview the number of variants before building any of them
+        count = ProductAttribute.count_variant_combinations(attr_values)
+        if count > ProductAttribute.MAX_VARIANT_COMBINATIONS:
+            QMessageBox.warning(
+                self,
+                "Trop de variantes",
+                f"Cette sélection produirait {count} variantes (maximum: "
+                f"{ProductAttribute.MAX_VARIANT_COMBINATIONS}).\n\n"
+                f"Réduisez le nombre d'attributs ou de valeurs sélectionnés."
+            )
+            return
+        if count > self.CONFIRM_VARIANT_COUNT:
+            reply = QMessageBox.question(
+                self,
+                "Confirmation",
+                f"Cette sélection va générer {count} variantes. Continuer?",
+                QMessageBox.Yes | QMessageBox.No,
+                QMessageBox.No
+            )
+            if reply != QMessageBox.Yes:
+                return
             
         # Get product info for default pricing and business rules
         product_info = None
@@ -701,7 +752,6 @@ class VariantManagementDialog(QDialog):
                 return
             elif strategy_msg.clickedButton() == custom_btn:
                 # Get custom price
-                from PyQt5.QtWidgets import QInputDialog
                 custom_price, ok = QInputDialog.getDouble(
                     self, 
                     "Prix personnalisé", 
@@ -716,8 +766,19 @@ class VariantManagementDialog(QDialog):
             else:  # base_btn
                 default_price = base_price
             
-        # Generate combinations with the dict approach
-        combinations = ProductAttribute.generate_variant_combinations_dict(attr_values)
+        # Stream the combinations; the count was checked above
+        combinations = ProductAttribute.iter_variant_combinations_dict(attr_values)
+        
+        # Generate a more unique SKU
+        base_sku = "SKU"  # This would normally come from the product
+        if product_info and product_info.get('name'):
+            # Use first 3 chars of product name if available
+            prod_name = ''.join(c for c in product_info['name'] if c.isalnum())
+            base_sku = prod_name[:3].upper()
+        
+        # Add a unique timestamp-based suffix to ensure uniqueness
+        import time
+        timestamp_suffix = str(int(time.time() * 1000))[-4:]  # Last 4 digits of current time in ms
         
         # Store as list of variant dictionaries
         self.variants = []
@@ -729,13 +790,6 @@ class VariantManagementDialog(QDialog):
             
             variant_name = " / ".join(name_parts)
             
-            # Generate a more unique SKU
-            base_sku = "SKU"  # This would normally come from the product
-            if product_info and product_info.get('name'):
-                # Use first 3 chars of product name if available
-                prod_name = ''.join(c for c in product_info['name'] if c.isalnum())
-                base_sku = prod_name[:3].upper()
-                
             sku_parts = []
             
             # Get first 2 letters (or full word if shorter) of each value, with attribute first letter
@@ -747,10 +801,6 @@ class VariantManagementDialog(QDialog):
                 value_part = cleaned_value[:2].upper()
                 sku_parts.append(f"{attr_prefix}{value_part}")
             
-            # Add a unique timestamp-based suffix to ensure uniqueness
-            import time
-            timestamp_suffix = str(int(time.time() * 1000))[-4:]  # Last 4 digits of current time in ms
-            
             sku = f"{base_sku}-{''.join(sku_parts)}-{timestamp_suffix}"
             
             # Create variant dictionary
@@ -783,8 +833,6 @@ class VariantManagementDialog(QDialog):
 
     def populate_variants_table(self):
         """Populate the variants table with generated variants"""
-        self.variants_table.setRowCount(len(self.variants))
-        
         # Get product info for margin calculations
         product_info = None
         if self.product_id:
@@ -797,167 +845,69 @@ class VariantManagementDialog(QDialog):
             purchase_price = float(product_info.get('purchase_price', 0) or 0)
             base_price = float(product_info.get('unit_price', 0) or 0)
         
-        for row, variant in enumerate(self.variants):
-            # Active checkbox
-            active_cb = QCheckBox()
-            active_cb.setChecked(variant['active'])
-            active_cb.stateChanged.connect(lambda state, r=row: self.update_variant_active(r, state))
-            active_cell = QWidget()
-            active_layout = QHBoxLayout(active_cell)
-            active_layout.addWidget(active_cb)
-            active_layout.setAlignment(Qt.AlignCenter)
-            active_layout.setContentsMargins(0, 0, 0, 0)
-            
-            # Variant name
-            name_item = QTableWidgetItem(variant['name'])
-            name_item.setFlags(name_item.flags() & ~Qt.ItemIsEditable)  # Make read-only
-            
-            # Check if variant has empty attributes and add warning indicator
-            has_attributes = variant.get('attributes') and len(variant.get('attributes', {})) > 0
-            if not has_attributes:
-                name_item.setText(f"⚠️ {variant['name']}")
-                name_item.setToolTip("Attention: Cette variante n'a pas d'attributs définis!")
-                name_item.setForeground(Qt.red)
-            
-            # Store variant ID in the name item if it exists
-            if 'id' in variant and variant['id']:
-                name_item.setData(Qt.UserRole, variant['id'])
-                # Add a visual indicator for existing variants
-                name_item.setToolTip(f"ID: {variant['id']} (Variante existante)")
-            
-            # SKU
-            sku_item = QTableWidgetItem(variant['sku'])
-            
-            # Price widget with margin validation
-            price_widget = QWidget()
-            price_layout = QVBoxLayout(price_widget)
-            price_layout.setContentsMargins(0, 0, 0, 0)
-            price_layout.setSpacing(0)
-            
-            price_spin = QDoubleSpinBox()
-            price_spin.setMinimum(0)
-            price_spin.setMaximum(999999.99)
-            price_spin.setValue(variant['price'])
-            price_spin.setSuffix(" MAD")
-            
-            # Calculate margin and add visual indicators
-            if purchase_price > 0:
-                margin = variant['price'] - purchase_price
-                margin_percent = (margin / purchase_price * 100) if purchase_price > 0 else 0
-                
-                # Style the price spinbox based on margin
-                if margin < 0:
-                    price_spin.setStyleSheet("QDoubleSpinBox { background-color: #ffcccc; color: red; font-weight: bold; }")
-                    tooltip = f"ALERTE: Marge négative! {margin:.2f} MAD ({margin_percent:.1f}%)"
-                elif margin_percent < 10:
-                    price_spin.setStyleSheet("QDoubleSpinBox { background-color: #fff3cd; }")
-                    tooltip = f"Marge faible: {margin:.2f} MAD ({margin_percent:.1f}%)"
-                else:
-                    tooltip = f"Marge: {margin:.2f} MAD ({margin_percent:.1f}%)"
-                
-                price_spin.setToolTip(tooltip)
-                
-                # Add margin indicator label for negative margins
-                if margin < 0:
-                    margin_indicator = QLabel(f"⚠️ -{abs(margin):.0f} MAD")
-                    margin_indicator.setStyleSheet("color: red; font-size: 9px;")
-                    price_layout.addWidget(margin_indicator)
-            
-            # Check for large price reductions
-            if base_price > 0 and variant['price'] < base_price * 0.5:
-                reduction = base_price - variant['price']
-                reduction_percent = (reduction / base_price * 100)
-                
-                if 'margin_indicator' not in locals():  # Only add if we don't already have one
-                    reduction_warning = QLabel(f"⚠️ -{reduction_percent:.0f}%")
-                    reduction_warning.setStyleSheet("color: orange; font-size: 9px;")
-                    price_layout.addWidget(reduction_warning)
-                    
-                if not price_spin.toolTip():
-                    price_spin.setToolTip(f"Réduction excessive: {reduction_percent:.1f}% du prix de base")
-            
-            # Connect value changed after setting initial value
-            price_spin.valueChanged.connect(lambda value, r=row: self.update_variant_price(r, value))
-            
-            price_layout.addWidget(price_spin)
-            
-            # Stock widget
-            stock_spin = QSpinBox()
-            stock_spin.setMinimum(0)
-            stock_spin.setMaximum(999999)
-            stock_spin.setValue(variant['stock'])
-            stock_spin.valueChanged.connect(lambda value, r=row: self.update_variant_stock(r, value))
-            
-            # Barcode
-            barcode_item = QTableWidgetItem(variant['barcode'])
-            barcode_item.setData(Qt.UserRole, variant)
-            
-            # Add action buttons
-            actions_widget = QWidget()
-            actions_layout = QHBoxLayout(actions_widget)
-            actions_layout.setContentsMargins(2, 2, 2, 2)
-            actions_layout.setSpacing(2)
-            
-            # Edit button
-            edit_btn = QPushButton("✏️")
-            edit_btn.setToolTip("Modifier cette variante")
-            edit_btn.setFixedSize(30, 25)
-            edit_btn.clicked.connect(lambda checked, r=row: self.edit_variant(r))
-            
-            # Delete button
-            delete_btn = QPushButton("🗑️")
-            delete_btn.setToolTip("Supprimer cette variante")
-            delete_btn.setFixedSize(30, 25)
-            delete_btn.clicked.connect(lambda checked, r=row: self.delete_variant(r))
-            
-            # Add warning icon for problematic variants
-            if (purchase_price > 0 and variant['price'] < purchase_price) or not has_attributes:
-                warning_btn = QPushButton("⚠️")
-                warning_btn.setToolTip("Cette variante présente des problèmes (marge négative ou attributs manquants)")
-                warning_btn.setFixedSize(30, 25)
-                warning_btn.setStyleSheet("color: red; font-weight: bold;")
-                actions_layout.addWidget(warning_btn)
-            
-            # Add buttons to actions layout
-            actions_layout.addWidget(edit_btn)
-            actions_layout.addWidget(delete_btn)
-            actions_layout.addStretch()
-            
-            # Add to table
-            self.variants_table.setCellWidget(row, 0, active_cell)
-            self.variants_table.setItem(row, 1, name_item)
-            self.variants_table.setItem(row, 2, sku_item)
-            self.variants_table.setCellWidget(row, 3, price_widget)
-            self.variants_table.setCellWidget(row, 4, stock_spin)
-            self.variants_table.setItem(row, 5, barcode_item)
-            self.variants_table.setCellWidget(row, 6, actions_widget)
+        self.variants_model.set_variants(self.variants, purchase_price, base_price)
 
-    def update_variant_active(self, row, state):
-        """Update the active state of a variant"""
-        if row < len(self.variants):
-            self.variants[row]['active'] = (state == Qt.Checked)
+    def update_variants_count(self):
+        """Show how many variants the table holds"""
+        active = sum(1 for variant in self.variants if variant['active'])
+        self.variants_count_label.setText(f"{len(self.variants)} variantes ({active} actives)")
 
-    def update_variant_price(self, row, value):
-        """Update the price of a variant"""
-        if row < len(self.variants):
-            self.variants[row]['price'] = value
+    def on_variant_double_clicked(self, index):
+        """Open the edit dialog from the read-only name column"""
+        row = self.variants_proxy.mapToSource(index).row()
+        if index.column() == VariantTableModel.COL_NAME:
+            self.edit_variant(row)
 
-    def update_variant_stock(self, row, value):
-        """Update the stock of a variant"""
-        if row < len(self.variants):
-            self.variants[row]['stock'] = value
+    def selected_rows(self):
+        """Model rows of the selected variants"""
+        return sorted(
+            self.variants_proxy.mapToSource(index).row()
+            for index in self.variants_table.selectionModel().selectedRows()
+        )
+
+    def selected_rows_or_warn(self):
+        rows = self.selected_rows()
+        if not rows:
+            QMessageBox.information(self, "Aucune sélection", "Sélectionnez d'abord une ou plusieurs variantes.")
+        return rows
+
+    def set_selection_active(self, active):
+        """Set the selected variants active or inactive"""
+        rows = self.selected_rows_or_warn()
+        if rows:
+            self.variants_model.set_field(rows, 'active', active)
+
+    def set_selection_price(self):
+        """Give the selected variants the same selling price"""
+        rows = self.selected_rows_or_warn()
+        if not rows:
+            return
+        price, ok = QInputDialog.getDouble(
+            self,
+            "Prix de vente",
+            f"Prix pour les {len(rows)} variantes sélectionnées:",
+            self.variants[rows[0]]['price'], 0, 999999.99, 2
+        )
+        if ok:
+            self.variants_model.set_field(rows, 'price', price)
+
+    def set_selection_stock(self):
+        """Give the selected variants the same stock"""
+        rows = self.selected_rows_or_warn()
+        if not rows:
+            return
+        stock, ok = QInputDialog.getInt(
+            self,
+            "Stock",
+            f"Stock pour les {len(rows)} variantes sélectionnées:",
+            self.variants[rows[0]]['stock'], 0, 999999
+        )
+        if ok:
+            self.variants_model.set_field(rows, 'stock', stock)
 
     def set_all_active(self, active):
         """Set all variants active or inactive"""
-        for row in range(self.variants_table.rowCount()):
-            cell_widget = self.variants_table.cellWidget(row, 0)
-            if cell_widget:
-                # Find the checkbox in the cell widget
-                for i in range(cell_widget.layout().count()):
-                    checkbox = cell_widget.layout().itemAt(i).widget()
-                    if isinstance(checkbox, QCheckBox):
-                        checkbox.setChecked(active)
-                        break
+        self.variants_model.set_field(range(len(self.variants)), 'active', active)
 
     def open_attribute_management(self):
         """Open the attribute management dialog"""
@@ -988,26 +938,19 @@ class VariantManagementDialog(QDialog):
         """Get the configured variants data"""
         result = []
         
-        # Update SKUs and barcodes from the table
-        for row in range(self.variants_table.rowCount()):
-            variant = self.variants[row]
-            sku_item = self.variants_table.item(row, 2)
-            barcode_item = self.variants_table.item(row, 5)
-            
-            if sku_item:
-                variant['sku'] = sku_item.text()
-            if barcode_item:
-                variant['barcode'] = barcode_item.text()
-            
+        # The table model edits self.variants in place
+        for variant in self.variants:
             # Add only active variants
             if variant['active']:
                 # Convert attribute dict to string format
                 variant_data = {
+                    'id': variant.get('id'),
                     'name': variant['name'],
                     'sku': variant['sku'],
                     'barcode': variant['barcode'],
                     'price': variant['price'],
                     'stock': variant['stock'],
+                    'attributes': variant['attributes'],
                     'attribute_values': json.dumps(variant['attributes'])
                 }
                 result.append(variant_data)
@@ -1,12 +1,14 @@
 from PyQt5.QtWidgets import (
     QDialog, QVBoxLayout, QHBoxLayout, QLabel, QListWidget, 
     QPushButton, QListWidgetItem, QMessageBox, QGridLayout,
-    QFrame, QDialogButtonBox
+    QFrame, QDialogButtonBox, QComboBox, QFormLayout
 )
-from PyQt5.QtCore import Qt
-from PyQt5.QtGui import QPixmap
+from PyQt5.QtCore import Qt, QTimer
+from PyQt5.QtGui import QPixmap, QColor
 from models.product import Product
-import json
+from models.product_attribute import ProductAttribute
+from models.catalog import ProductCatalog, parse_json_attributes
+from .db_worker import DbWorker, run_in_background
 import os
 
 class VariantSelectionDialog(QDialog):
@@ -14,6 +16,10 @@ class VariantSelectionDialog(QDialog):
         super().__init__(parent)
         self.product = product
         self.selected_variant = None
+        # Dynamic variants products are composed from their attribute lines
+        self.dynamic = bool(product.get('dynamic_variants'))
+        self.line_combos = []  # (attribute line, QComboBox) in dynamic mode
+        self.existing_variants = {}  # combination key -> created variant
         self.init_ui()
         self.load_variants()
 
@@ -30,10 +36,30 @@ class VariantSelectionDialog(QDialog):
         self.create_product_header(main_layout)
         
         # Variants list
-        variants_label = QLabel("Choisissez une variante:")
+        variants_label = QLabel("Composez la variante:" if self.dynamic else "Choisissez une variante:")
         variants_label.setStyleSheet("font-weight: bold; font-size: 14px;")
         main_layout.addWidget(variants_label)
         
+        if self.dynamic:
+            # One value picker per attribute line, filled by show_attribute_lines()
+            self.attributes_form = QFormLayout()
+            main_layout.addLayout(self.attributes_form)
+            
+            self.selection_label = QLabel("Chargement des attributs...")
+            self.selection_label.setStyleSheet("font-size: 14px; padding: 10px;")
+            main_layout.addWidget(self.selection_label)
+            main_layout.addStretch()
+        else:
+            self.create_variants_list(main_layout)
+        
+        # Buttons
+        buttons = QDialogButtonBox(QDialogButtonBox.Ok | QDialogButtonBox.Cancel)
+        buttons.accepted.connect(self.accept_variant)
+        buttons.rejected.connect(self.reject)
+        main_layout.addWidget(buttons)
+
+    def create_variants_list(self, main_layout):
+        """Create the list of pre-built variants"""
         self.variants_list = QListWidget()
         self.variants_list.setStyleSheet("""
             QListWidget {
@@ -51,12 +77,6 @@ class VariantSelectionDialog(QDialog):
         """)
         self.variants_list.itemDoubleClicked.connect(self.on_variant_double_clicked)
         main_layout.addWidget(self.variants_list)
-        
-        # Buttons
-        buttons = QDialogButtonBox(QDialogButtonBox.Ok | QDialogButtonBox.Cancel)
-        buttons.accepted.connect(self.accept_variant)
-        buttons.rejected.connect(self.reject)
-        main_layout.addWidget(buttons)
 
     def create_product_header(self, layout):
         """Create the product information header"""
@@ -92,15 +112,7 @@ class VariantSelectionDialog(QDialog):
         info_layout.addWidget(price_label)
         
         # Get variant attributes
-        variant_attrs = []
-        if self.product.get('variant_attributes'):
-            try:
-                if isinstance(self.product['variant_attributes'], str):
-                    variant_attrs = json.loads(self.product['variant_attributes'])
-                else:
-                    variant_attrs = self.product['variant_attributes']
-            except:
-                pass
+        variant_attrs = parse_json_attributes(self.product.get('variant_attributes')) or []
                 
         # Show attributes
         if variant_attrs:
@@ -113,45 +125,154 @@ class VariantSelectionDialog(QDialog):
         layout.addSpacing(10)
 
     def load_variants(self):
+        """Fetch product variants, from memory when the catalog is loaded"""
+        self.request_key = (id(self), 'variants')
+        if self.dynamic:
+            run_in_background(
+                self.fetch_dynamic_options, self.product['id'],
+                on_result=self.show_attribute_lines,
+                on_error=lambda message: self.show_attribute_lines(([], [])),
+                key=self.request_key,
+            )
+            return
+
+        if ProductCatalog.is_loaded():
+            # Deferred so an empty result can still reject the running dialog
+            variants = ProductCatalog.get_variants(self.product['id'])
+            QTimer.singleShot(0, lambda: self.show_variants(variants))
+            return
+
+        placeholder = QListWidgetItem("Chargement des variantes...")
+        placeholder.setFlags(Qt.NoItemFlags)
+        self.variants_list.addItem(placeholder)
+
+        run_in_background(
+            Product.get_variants, self.product['id'],
+            on_result=self.show_variants,
+            on_error=lambda message: self.show_variants([]),
+            key=self.request_key,
+        )
+
+    @staticmethod
+    def fetch_dynamic_options(product_id):
+        """Attribute lines and already created variants of a dynamic variants product"""
+        lines = ProductAttribute.get_product_attribute_lines(product_id)
+        if ProductCatalog.is_loaded():
+            variants = ProductCatalog.get_variants(product_id)
+        else:
+            variants = Product.get_variants(product_id)
+        return lines, variants
+
+    def show_attribute_lines(self, options):
+        """Build one value picker per attribute line"""
+        lines, variants = options
+        lines = [line for line in lines if line['values']]
+        if not lines:
+            QMessageBox.warning(
+                self,
+                "Aucun attribut",
+                "Ce produit n'a pas d'attributs configurés."
+            )
+            self.reject()
+            return
+
+        self.existing_variants = {
+            variant['combination_key']: variant
+            for variant in variants if variant.get('combination_key')
+        }
+
+        for line in lines:
+            combo = QComboBox()
+            for value in line['values']:
+                text = value['value']
+                if value.get('price_extra'):
+                    text += f" (+{value['price_extra']:.2f} MAD)"
+                combo.addItem(text, value)
+            combo.currentIndexChanged.connect(self.update_selection)
+            self.attributes_form.addRow(f"{line['attribute_name']}:", combo)
+            self.line_combos.append((line, combo))
+
+        self.update_selection()
+
+    def compose_variant(self):
+        """Variant matching the selected values, created or not yet"""
+        values = [(line, combo.currentData()) for line, combo in self.line_combos]
+        template_value_ids = [value['template_value_id'] for _, value in values]
+
+        existing = self.existing_variants.get(ProductAttribute.combination_key(template_value_ids))
+        if existing is not None:
+            return dict(existing)
+
+        # Not sold or stocked yet: checkout creates the row from template_value_ids
+        attributes = {line['attribute_name']: value['value'] for line, value in values}
+        price = float(self.product.get('unit_price') or 0) + sum(value.get('price_extra') or 0 for _, value in values)
+        return {
+            'id': None,
+            'product_id': self.product['id'],
+            'template_value_ids': sorted(template_value_ids),
+            'name': " / ".join(attributes.values()),
+            'display_name': " / ".join(attributes.values()),
+            'attributes': attributes,
+            'attribute_values': attributes,
+            'effective_price': price,
+            'unit_price': price,
+            'stock': 0
+        }
+
+    def update_selection(self):
+        """Show price and stock of the composed variant"""
+        variant = self.compose_variant()
+        price = float(variant.get('effective_price') or 0)
+        if variant['id'] is None:
+            stock_text = "Nouvelle combinaison"
+        else:
+            stock_text = f"Stock: {int(variant.get('stock') or 0)}"
+        self.selection_label.setText(f"{variant['name']} — {price:.2f} MAD — {stock_text}")
+
+        # Colour the other values by what they would combine into
+        run_in_background(
+            ProductAttribute.resolve_variant, self.product['id'],
+            [value['template_value_id'] for value in (combo.currentData() for _, combo in self.line_combos)],
+            on_result=self.show_availability,
+            key=(id(self), 'resolve'),
+        )
+
+    def show_availability(self, resolution):
+        """Green: existing variant in stock; red: existing but out of stock"""
+        if not resolution:
+            return
+        for _, combo in self.line_combos:
+            for index in range(combo.count()):
+                value_id = combo.itemData(index)['template_value_id']
+                if value_id in resolution['in_stock']:
+                    color = QColor("#28a745")
+                elif value_id in resolution['available']:
+                    color = QColor("#dc3545")
+                else:
+                    color = None
+                combo.setItemData(index, color, Qt.ForegroundRole)
+
+    def done(self, result):
+        # Drop the pending variant fetch when the dialog closes first
+        DbWorker.instance().cancel_key(self.request_key)
+        DbWorker.instance().cancel_key((id(self), 'resolve'))
+        super().done(result)
+
+    def show_variants(self, variants):
         """Load product variants into the list"""
-        variants = Product.get_variants(self.product['id'])
-        
+        self.variants_list.clear()
+
         if not variants:
             QMessageBox.warning(
                 self,
                 "Aucune variante",
                 "Ce produit n'a pas de variantes configurées."
             )
-            self.close()
+            self.reject()
             return
             
         for variant in variants:
             try:
-                # Parse attribute values safely from either 'attributes' or 'attribute_values' key
-                attr_values = {}
-                
-                # Try both possible keys for attributes (for compatibility with different data structures)
-                for key in ['attributes', 'attribute_values']:
-                    if variant.get(key):
-                        try:
-                            # Handle both string JSON and direct dictionary representation
-                            if isinstance(variant[key], str):
-                                parsed_values = json.loads(variant[key])
-                                attr_values = parsed_values
-                                # Add the parsed result back to the variant for later use
-                                variant[key] = parsed_values
-                            else:
-                                attr_values = variant[key]
-                            
-                            # If we successfully parsed values, stop looking
-                            if attr_values:
-                                break
-                        except Exception as e:
-                            print(f"Error parsing {key}: {e}")
-                
-                # Debug output
-                print(f"Variant {variant.get('id')}: Parsed attribute values: {attr_values}")
-                
                 # Create list item
                 item = QListWidgetItem()
                 
@@ -162,75 +283,8 @@ class VariantSelectionDialog(QDialog):
                 # Variant name/description
                 variant_info = QVBoxLayout()
                 
-                # Create variant name from attributes
-                variant_name = variant.get('name', '')
-                if not variant_name and attr_values:
-                    try:
-                        # Ensure we have some kind of name even if we can't extract from attributes
-                        default_name = f"Variante #{variant.get('id', '')}"
-                    
-                        # Try multiple approaches to get a meaningful name
-                        attr_vals = []
-                    
-                        # First try: If we have a direct 'name' field, use it
-                        if variant.get('name'):
-                            variant_name = variant['name']
-                        # Second try: Extract from attribute values dictionary
-                        elif isinstance(attr_values, dict) and attr_values:
-                            attr_vals = []
-                            # Safely extract values from the dictionary
-                            for attr_name, attr_value in attr_values.items():
-                                if attr_value:
-                                    # Handle if attr_value is another dict or a complex object
-                                    if isinstance(attr_value, dict):
-                                        # Try to extract a meaningful value from the dict
-                                        for val in attr_value.values():
-                                            if val:
-                                                attr_vals.append(str(val))
-                                                break
-                                    else:
-                                        attr_vals.append(str(attr_value))
-                        
-                            if attr_vals:
-                                variant_name = " / ".join(attr_vals)
-                            else:
-                                variant_name = default_name
-                        # Third try: If attr_values is a list
-                        elif isinstance(attr_values, list) and attr_values:
-                            attr_vals = [str(val) for val in attr_values if val]
-                            if attr_vals:
-                                variant_name = " / ".join(attr_vals)
-                            else:
-                                variant_name = default_name
-                        # Fourth try: If attr_values is a string
-                        elif isinstance(attr_values, str) and attr_values:
-                            # Try to parse it as JSON, might be a serialized structure
-                            try:
-                                parsed = json.loads(attr_values)
-                                if isinstance(parsed, dict):
-                                    attr_vals = [str(val) for val in parsed.values() if val]
-                                elif isinstance(parsed, list):
-                                    attr_vals = [str(val) for val in parsed if val]
-                                else:
-                                    attr_vals = [str(parsed)]
-                                
-                                if attr_vals:
-                                    variant_name = " / ".join(attr_vals)
-                                else:
-                                    variant_name = default_name
-                            except:
-                                # Not valid JSON, use as direct string
-                                variant_name = attr_values
-                        # Last resort: Use default name
-                        else:
-                            variant_name = default_name
-                        
-                        # Debug the name generation
-                        print(f"Generated variant name: {variant_name} from attr_values: {attr_values}")
-                        
-                    except Exception as e:
-                        print(f"Error creating variant name: {e}")
-                        variant_name = f"Variante #{variant.get('id', '')}"
+                # Precomputed from the variant's attribute values
+                variant_name = variant.get('display_name') or variant.get('name') or f"Variante #{variant.get('id', '')}"
                     
                 name_label = QLabel(variant_name)
                 name_label.setStyleSheet("font-weight: bold;")
@@ -254,21 +308,8 @@ class VariantSelectionDialog(QDialog):
                 price_stock = QVBoxLayout()
                 price_stock.setAlignment(Qt.AlignRight)
                 
-                # Calculate adjusted price with all attribute price extras
-                base_price = float(self.product['unit_price'])
-                
-                # Use total_price_adjustment which includes attribute price extras and variant price adjustment
-                if 'total_price_adjustment' in variant:
-                    price_adj = float(variant.get('total_price_adjustment', 0))
-                else:
-                    # Fallback to just the variant's price adjustment if the total isn't available
-                    price_adj = float(variant.get('price_adjustment', 0))
-                    
-                # Show the price breakdown if we have extras data
-                if 'price_extras' in variant and variant['price_extras'] > 0:
-                    print(f"Variant price breakdown: Base {base_price} + Attributes {variant['price_extras']} + Variant {variant.get('price_adjustment', 0)} = {base_price + price_adj}")
-                    
-                final_price = base_price + price_adj
+                # Stored selling price: base + variant adjustment + attribute extras
+                final_price = float(variant.get('effective_price') or variant.get('unit_price') or 0)
                 
                 price_label = QLabel(f"{final_price:.2f} MAD")
                 price_label.setStyleSheet("font-weight: bold; color: #28a745;")
@@ -312,6 +353,13 @@ class VariantSelectionDialog(QDialog):
 
     def accept_variant(self):
         """Get selected variant and accept the dialog"""
+        if self.dynamic:
+            if not self.line_combos:
+                return
+            self.selected_variant = self.compose_variant()
+            self.accept()
+            return
+
         current_item = self.variants_list.currentItem()
         if not current_item:
             QMessageBox.warning(self, "Aucune sélection", "Veuillez sélectionner une variante.")
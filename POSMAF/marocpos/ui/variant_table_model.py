@@ -0,0 +1,261 @@
+from PyQt5.QtCore import Qt, QAbstractTableModel, QModelIndex
+from PyQt5.QtGui import QColor
+from PyQt5.QtWidgets import QStyledItemDelegate, QDoubleSpinBox, QSpinBox
+
+
+class VariantTableModel(QAbstractTableModel):
+    """Variant grid of VariantManagementDialog.
+
+    The model edits the variant dicts of the list it is given in place, so
+    the dialog's ``variants`` list always reflects the grid. Nothing is built
+    per cell: the view only asks for the rows it paints, which keeps the
+    dialog responsive with thousands of variants.
+    """
+    COL_ACTIVE, COL_NAME, COL_SKU, COL_PRICE, COL_STOCK, COL_BARCODE, COL_STATUS = range(7)
+    HEADERS = ["Actif", "Variante", "SKU", "Prix de vente", "Stock", "Code-barres", "Alertes"]
+
+    # Editable text/number columns -> variant key
+    FIELDS = {COL_SKU: 'sku', COL_PRICE: 'price', COL_STOCK: 'stock', COL_BARCODE: 'barcode'}
+
+    NEGATIVE_MARGIN_COLOR = QColor("#ffcccc")
+    LOW_MARGIN_COLOR = QColor("#fff3cd")
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.variants = []
+        self.purchase_price = 0
+        self.base_price = 0
+        self._changed = set()  # ids of existing variants edited since the last load
+
+    # ------------------------------------------------------------------
+    # Loading
+
+    def set_variants(self, variants, purchase_price=0, base_price=0):
+        """Show ``variants`` (kept by reference) priced against the product's prices"""
+        self.beginResetModel()
+        self.variants = variants
+        self.purchase_price = purchase_price
+        self.base_price = base_price
+        self._changed = set()
+        self.endResetModel()
+
+    def variant(self, row):
+        if 0 <= row < len(self.variants):
+            return self.variants[row]
+        return None
+
+    def row_of(self, variant):
+        """Row of a variant dict (by identity), or -1"""
+        for row, candidate in enumerate(self.variants):
+            if candidate is variant:
+                return row
+        return -1
+
+    # ------------------------------------------------------------------
+    # Qt model interface
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.variants)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.HEADERS)
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and orientation == Qt.Horizontal:
+            return self.HEADERS[section]
+        return None
+
+    def flags(self, index):
+        if not index.isValid():
+            return Qt.NoItemFlags
+        flags = Qt.ItemIsEnabled | Qt.ItemIsSelectable
+        if index.column() == self.COL_ACTIVE:
+            flags |= Qt.ItemIsUserCheckable
+        elif index.column() in self.FIELDS:
+            flags |= Qt.ItemIsEditable
+        return flags
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        variant = self.variants[index.row()]
+        column = index.column()
+
+        if column == self.COL_ACTIVE:
+            if role == Qt.CheckStateRole:
+                return Qt.Checked if variant['active'] else Qt.Unchecked
+            return None
+
+        if role == Qt.EditRole and column in self.FIELDS:
+            return variant[self.FIELDS[column]]
+
+        if role == Qt.DisplayRole:
+            if column == self.COL_NAME:
+                if not self.has_attributes(variant):
+                    return f"⚠️ {variant['name']}"
+                return variant['name']
+            if column == self.COL_PRICE:
+                return f"{variant['price']:.2f} MAD"
+            if column == self.COL_STATUS:
+                return "⚠️" if self.has_problem(variant) else ""
+            if column in self.FIELDS:
+                return variant[self.FIELDS[column]]
+            return None
+
+        if role == Qt.ToolTipRole:
+            if column == self.COL_NAME:
+                if not self.has_attributes(variant):
+                    return "Attention: Cette variante n'a pas d'attributs définis!"
+                if variant.get('id'):
+                    return f"ID: {variant['id']} (Variante existante)"
+            elif column == self.COL_PRICE:
+                return self.price_message(variant)
+            elif column == self.COL_STATUS and self.has_problem(variant):
+                return "Cette variante présente des problèmes (marge négative ou attributs manquants)"
+            return None
+
+        if role == Qt.ForegroundRole:
+            if column == self.COL_NAME and not self.has_attributes(variant):
+                return QColor(Qt.red)
+            if column == self.COL_STATUS:
+                return QColor(Qt.red)
+            return None
+
+        if role == Qt.BackgroundRole and column == self.COL_PRICE and self.purchase_price > 0:
+            margin = variant['price'] - self.purchase_price
+            if margin < 0:
+                return self.NEGATIVE_MARGIN_COLOR
+            if margin / self.purchase_price * 100 < 10:
+                return self.LOW_MARGIN_COLOR
+            return None
+
+        if role == Qt.TextAlignmentRole and column in (self.COL_PRICE, self.COL_STOCK):
+            return int(Qt.AlignRight | Qt.AlignVCenter)
+        if role == Qt.TextAlignmentRole and column == self.COL_STATUS:
+            return int(Qt.AlignCenter)
+        return None
+
+    def setData(self, index, value, role=Qt.EditRole):
+        if not index.isValid():
+            return False
+        column = index.column()
+        if column == self.COL_ACTIVE and role == Qt.CheckStateRole:
+            return self.set_field([index.row()], 'active', value == Qt.Checked)
+        if column in self.FIELDS and role == Qt.EditRole:
+            field = self.FIELDS[column]
+            if field == 'price':
+                value = float(value)
+            elif field == 'stock':
+                value = int(value)
+            else:
+                value = str(value).strip()
+            return self.set_field([index.row()], field, value)
+        return False
+
+    # ------------------------------------------------------------------
+    # Rules shared with the edit dialog
+
+    @staticmethod
+    def has_attributes(variant):
+        return bool(variant.get('attributes'))
+
+    def has_problem(self, variant):
+        negative_margin = self.purchase_price > 0 and variant['price'] < self.purchase_price
+        return negative_margin or not self.has_attributes(variant)
+
+    def price_message(self, variant):
+        """Margin (or excessive reduction) description of a variant's price"""
+        price = variant['price']
+        if self.purchase_price > 0:
+            margin = price - self.purchase_price
+            margin_percent = margin / self.purchase_price * 100
+            if margin < 0:
+                return f"ALERTE: Marge négative! {margin:.2f} MAD ({margin_percent:.1f}%)"
+            if margin_percent < 10:
+                return f"Marge faible: {margin:.2f} MAD ({margin_percent:.1f}%)"
+            return f"Marge: {margin:.2f} MAD ({margin_percent:.1f}%)"
+        if self.base_price > 0 and price < self.base_price * 0.5:
+            reduction_percent = (self.base_price - price) / self.base_price * 100
+            return f"Réduction excessive: {reduction_percent:.1f}% du prix de base"
+        return None
+
+    # ------------------------------------------------------------------
+    # Bulk edits
+
+    def set_field(self, rows, field, value):
+        """Set one field on many rows and repaint them with a single signal"""
+        rows = [row for row in rows if 0 <= row < len(self.variants)]
+        if not rows:
+            return False
+        for row in rows:
+            variant = self.variants[row]
+            variant[field] = value
+            if variant.get('id'):
+                self._changed.add(variant['id'])
+        self.dataChanged.emit(
+            self.index(min(rows), 0),
+            self.index(max(rows), self.columnCount() - 1)
+        )
+        return True
+
+    def variant_changed(self, row):
+        """Repaint a row whose variant dict was edited outside the model"""
+        variant = self.variant(row)
+        if variant is None:
+            return
+        if variant.get('id'):
+            self._changed.add(variant['id'])
+        self.dataChanged.emit(self.index(row, 0), self.index(row, self.columnCount() - 1))
+
+    def remove_row(self, row):
+        if not 0 <= row < len(self.variants):
+            return False
+        self.beginRemoveRows(QModelIndex(), row, row)
+        variant = self.variants.pop(row)
+        self._changed.discard(variant.get('id'))
+        self.endRemoveRows()
+        return True
+
+    def changed_variants(self):
+        """Existing variants edited since they were loaded"""
+        return [variant for variant in self.variants if variant.get('id') in self._changed]
+
+    def mark_saved(self, variant_ids):
+        self._changed.difference_update(variant_ids)
+
+
+class PriceDelegate(QStyledItemDelegate):
+    """Spin box editor for the selling price column"""
+
+    def createEditor(self, parent, option, index):
+        editor = QDoubleSpinBox(parent)
+        editor.setMinimum(0)
+        editor.setMaximum(999999.99)
+        editor.setSuffix(" MAD")
+        editor.setFrame(False)
+        return editor
+
+    def setEditorData(self, editor, index):
+        editor.setValue(float(index.data(Qt.EditRole) or 0))
+
+    def setModelData(self, editor, model, index):
+        editor.interpretText()
+        model.setData(index, editor.value(), Qt.EditRole)
+
+
+class StockDelegate(QStyledItemDelegate):
+    """Spin box editor for the stock column"""
+
+    def createEditor(self, parent, option, index):
+        editor = QSpinBox(parent)
+        editor.setMinimum(0)
+        editor.setMaximum(999999)
+        editor.setFrame(False)
+        return editor
+
+    def setEditorData(self, editor, index):
+        editor.setValue(int(index.data(Qt.EditRole) or 0))
+
+    def setModelData(self, editor, model, index):
+        editor.interpretText()
+        model.setData(index, editor.value(), Qt.EditRole)